@@ -4,20 +4,23 @@ import sqlite3
 app = Flask(__name__)
 DB_FILE = "game_data.db"
 
-def get_scores():
-    """Retrieve all player scores from the database."""
+def get_scores(limit=-1, offset=0):
+    """Retrieve player scores from the database, best first (limit -1 means all)."""
     conn = sqlite3.connect(DB_FILE)
     cursor = conn.cursor()
-    cursor.execute('SELECT username, score FROM players ORDER BY score DESC')
+    cursor.execute('SELECT username, score FROM players ORDER BY score DESC LIMIT ? OFFSET ?', (limit, offset))
     scores = [{"username": row[0], "score": row[1]} for row in cursor.fetchall()]
     conn.close()
     return scores
 
 @app.route('/scores', methods=['GET'])
 def fetch_scores():
-    """API endpoint to get all player scores."""
-    scores = get_scores()
-    return jsonify({"scores": scores})
+    """API endpoint to get player scores, optionally paginated with ?limit=&offset=."""
+    scores = get_scores(request.args.get("limit", -1, type=int), request.args.get("offset", 0, type=int))
+    # ETag from the body, so pollers get a 304 while nothing changed
+    response = jsonify({"scores": scores})
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/update_score', methods=['POST'])
 def update_score():
@@ -1,16 +1,20 @@
 import threading
 import asyncio
 from app import app
+from config import SHARDS
 from db import init_db
-from game_manager import GameManager
+from rooms import RoomManager
 from fpga_server import start_tcp_server
 from websocket_server import start_ws_server
+from shards import start_shards, run_front
 
 async def main():
-    game = GameManager()
-    await asyncio.gather(start_ws_server(game), start_tcp_server(game))
+    rooms = RoomManager()
+    await asyncio.gather(start_ws_server(rooms), start_tcp_server(rooms))
 
 if __name__ == "__main__":
     init_db()
+    # Shards are spawned before the Flask thread exists
+    shards = start_shards(SHARDS) if SHARDS > 1 else None
     threading.Thread(target=lambda: app.run(host="0.0.0.0", port=5000), daemon=True).start()
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(run_front(shards) if shards else main())
\ No newline at end of file
@@ -1,14 +1,57 @@
+import time
 from flask import Flask, jsonify, request
-from db import update_score, get_scores
+from db import get_best_results, get_match
+from leaderboard import leaderboard
+from metrics import registry, CONTENT_TYPE
+from tracing import tracer
 
 app = Flask(__name__)
 
 @app.route("/scores")
 def scores():
-    return jsonify({"scores": get_scores()})
+    limit = request.args.get("limit", type=int)
+    offset = request.args.get("offset", 0, type=int)
+    # Polling lobby screens get a 304 until a score changes
+    tag = leaderboard.etag(limit, offset)
+    if request.if_none_match.contains(tag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({"scores": leaderboard.page(limit, offset), "offset": offset})
+    response.set_etag(tag)
+    return response
+
+@app.route("/scores/<username>")
+def score_rank(username):
+    rank = leaderboard.rank(username)
+    if rank is None:
+        return jsonify({"error": "Unknown player"}), 404
+    return jsonify(rank)
 
 @app.route("/update_score", methods=["POST"])
 def api_update_score():
     data = request.json
-    update_score(data.get("username"), data.get("increment", 1))
+    leaderboard.add(data.get("username"), data.get("increment", 1))
     return jsonify({"message": "Score updated"})
+
+@app.route("/matches/best")
+def best_match_results():
+    mode = request.args.get("mode", "Disco Dash")
+    days = request.args.get("days", 7, type=float)
+    limit = min(request.args.get("limit", 10, type=int), 100)
+    return jsonify({"mode": mode, "results": get_best_results(mode, time.time() - days * 86400, limit)})
+
+@app.route("/matches/<int:match_id>")
+def match_detail(match_id):
+    match = get_match(match_id, with_events=request.args.get("events") == "1")
+    if match is None:
+        return jsonify({"error": "Unknown match"}), 404
+    return jsonify(match)
+
+@app.route("/latency")
+def latency():
+    # With SHARDS > 1 the events are traced in the shards; ?shard=N shows one of them
+    return jsonify(tracer.snapshot(request.args.get("shard", type=int)))
+
+@app.route("/metrics")
+def metrics():
+    return app.response_class(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,339 @@
+"""
+Synthetic FPGA gateways and browsers for capacity testing a running server.
+
+Browsers are spread over --rooms rooms. The first browser in each room
+configures it (init + game_selection); FPGA gateways then fill the configured
+rooms the same way real ones do. Gateways send framed motion events at --rate
+per second with exponential gaps, plus a burst of --burst events every
+--burst-every seconds, with tokens drawn from --mix. They answer clock pings
+like a real gateway. Browsers answer clock pings, acknowledge traced frames,
+and send player_position (and player_input, in Disco Dash) at the given
+rates.
+
+Measured on the browser side:
+  frames per second   state frames received per browser
+  frame latency       frame timestamp (tick start) -> received
+  event latency       gateway device time -> the "data" echo received
+
+Both latencies compare clocks of this process and the server, so run it on
+the same box as the server; on a small box the generator's own CPU use
+counts against the result. With --ramp the browser count doubles until the
+frame rate or the p95 frame latency falls out of budget. Scores go to the
+server's database under "load <room> <player>" names.
+
+Run from backend/server, against a server started with python __main__.py:
+    python -m benchmarks.load_generator --fpgas 8 --browsers 32 --rooms 4 [--seconds 10] [--json]
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import struct
+import time
+
+import websockets
+
+from config import TCP_PORT, WS_PORT
+from fpga_protocol import PING_MAGIC, TOKENS, encode_event
+
+MODES = ("Coin Cascade", "Bullet Barrage", "Disco Dash")
+ACTIONS = ("ArrowUp", "ArrowLeft", "ArrowRight", "Button")
+STATE_FRAMES = ("gameStateUpdate", "gameStateDelta")
+DEFAULT_MIX = "J=3,L=2,R=2,B1=1,B2=1,N=1"
+MIN_FPS = 55.0  # frame rate a browser must see for --ramp to keep going
+LATENCY_BUDGET_MS = 50.0  # p95 frame latency allowed for --ramp to keep going
+
+_PING = struct.Struct(">BH")
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        token, _, weight = part.partition("=")
+        token = token.strip()
+        if token not in TOKENS:
+            raise argparse.ArgumentTypeError(f"Unknown token {token!r}, expected one of {', '.join(TOKENS)}")
+        mix[token] = float(weight or 1)
+    return mix
+
+
+def device_time():
+    """ Microseconds on this process's clock, wrapped like a gateway's u32 counter """
+    return int(time.time() * 1e6) & 0xFFFFFFFF
+
+
+def summarise(samples):
+    if not samples:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1]}
+
+
+class Results:
+    def __init__(self):
+        self.fpga = {"connected": 0, "rejected": 0, "failed": 0, "sent": 0, "pings": 0}
+        self.browsers = {"connected": 0, "failed": 0, "dropped": 0, "positions": 0, "inputs": 0}
+        self.frames = {}  # browser index -> state frames received while measuring
+        self.frame_latency = []
+        self.event_latency = []
+        self.server = None
+
+    def report(self, seconds):
+        rates = [count / seconds for count in self.frames.values()]
+        return {
+            "fpga": self.fpga,
+            "browsers": self.browsers,
+            "framesPerSecond": {
+                "mean": sum(rates) / len(rates) if rates else 0.0,
+                "min": min(rates, default=0.0),
+            },
+            "frameLatencyMs": summarise(self.frame_latency),
+            "eventLatencyMs": summarise(self.event_latency),
+            "server": self.server,
+        }
+
+
+async def fpga_gateway(args, mix, results, measuring, stop):
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.tcp_port)
+    except OSError:
+        results.fpga["failed"] += 1
+        return
+
+    # The server sends "S" once the gateway has a player slot and closes otherwise
+    if await reader.read(1) != b"S":
+        results.fpga["rejected"] += 1
+        writer.close()
+        return
+    results.fpga["connected"] += 1
+
+    async def answer_pings():
+        while True:
+            magic, ping_id = _PING.unpack(await reader.readexactly(_PING.size))
+            if magic != PING_MAGIC:
+                continue
+            writer.write(encode_event("T", ping_id, device_time()))
+            results.fpga["pings"] += 1
+
+    def send(seq):
+        token = random.choices(list(mix), list(mix.values()))[0]
+        if args.legacy:
+            writer.write(token.encode())
+        else:
+            writer.write(encode_event(token, seq, device_time()))
+        if measuring.is_set():
+            results.fpga["sent"] += 1
+
+    pings = asyncio.create_task(answer_pings())
+    seq = 0
+    next_burst = time.monotonic() + args.burst_every if args.burst else math.inf
+    try:
+        while not stop.is_set():
+            await asyncio.sleep(random.expovariate(args.rate) if args.rate > 0 else 1.0)
+            if args.rate > 0:
+                send(seq)
+                seq += 1
+            if time.monotonic() >= next_burst:
+                for _ in range(args.burst):
+                    send(seq)
+                    seq += 1
+                next_burst += args.burst_every
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        pings.cancel()
+        writer.close()
+
+
+async def browser(index, room, host, args, results, configured, measuring, stop):
+    url = f"ws://{args.host}:{args.ws_port}"
+    try:
+        ws = await websockets.connect(url, max_size=None)
+    except OSError:
+        results.browsers["failed"] += 1
+        return
+    results.browsers["connected"] += 1
+    player = index // args.rooms % args.players_per_room + 1
+    mode = args.mode or MODES[int(room.rsplit("-", 1)[1]) % len(MODES)]
+
+    if host:
+        names = [f"load {room} {pid}" for pid in range(1, args.players_per_room + 1)]
+        await ws.send(json.dumps({"type": "init", "room": room, "numPlayers": args.players_per_room, "names": names}))
+        await ws.send(json.dumps({"type": "game_selection", "room": room, "mode": mode, "player": 1}))
+        configured.release()
+    else:
+        await ws.send(json.dumps({"type": "join_room", "room": room}))
+
+    async def send_inputs():
+        x, y = random.uniform(-1.5, 1.5), random.uniform(-0.7, 0.2)
+        position_gap = 1 / args.position_rate if args.position_rate > 0 else math.inf
+        input_gap = 1 / args.input_rate if args.input_rate > 0 and mode == "Disco Dash" else math.inf
+        next_position = next_input = time.monotonic()
+        while True:
+            await asyncio.sleep(max(0.0, min(next_position, next_input) - time.monotonic()))
+            now = time.monotonic()
+            if now >= next_position:
+                x = min(1.5, max(-1.5, x + random.uniform(-0.05, 0.05)))
+                await ws.send(json.dumps({
+                    "type": "player_position", "player": player,
+                    "position": {"x": x, "y": y}, "sentAt": time.time() * 1000
+                }))
+                results.browsers["positions"] += 1
+                next_position += position_gap
+            if now >= next_input:
+                await ws.send(json.dumps({
+                    "type": "player_input", "player": player,
+                    "action": random.choice(ACTIONS), "timestamp": time.time()
+                }))
+                results.browsers["inputs"] += 1
+                next_input += input_gap
+
+    sender = asyncio.create_task(send_inputs())
+    results.frames[index] = 0
+    try:
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            received = time.time()
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            kind = data.get("type")
+
+            if kind == "clock_ping":
+                stamp = received * 1000
+                await ws.send(json.dumps({"type": "clock_pong", "id": data["id"], "t1": stamp, "t2": stamp}))
+            elif kind in STATE_FRAMES:
+                if data.get("traces"):
+                    await ws.send(json.dumps({"type": "trace_ack", "traces": data["traces"], "displayedAt": time.time() * 1000}))
+                if measuring.is_set():
+                    results.frames[index] += 1
+                    results.frame_latency.append((received - data["timestamp"]) * 1000)
+            elif kind == "data" and data.get("deviceTime") is not None and measuring.is_set():
+                delay = ((int(received * 1e6) - data["deviceTime"]) & 0xFFFFFFFF) / 1000
+                results.event_latency.append(delay)
+    except websockets.ConnectionClosed:
+        results.browsers["dropped"] += 1
+    finally:
+        sender.cancel()
+        await ws.close()
+
+
+async def server_latency(args):
+    """ The server's own per-stage trace percentiles (see tracing.py) """
+    try:
+        async with websockets.connect(f"ws://{args.host}:{args.ws_port}") as ws:
+            await ws.send(json.dumps({"type": "get_latency_stats"}))
+            while True:
+                data = json.loads(await asyncio.wait_for(ws.recv(), 5))
+                if data.get("type") == "latency_stats":
+                    return data["stats"]
+    except (OSError, asyncio.TimeoutError, websockets.ConnectionClosed):
+        return None
+
+
+async def run_load(args, browsers, mix):
+    results = Results()
+    configured = asyncio.Semaphore(0)
+    measuring = asyncio.Event()
+    stop = asyncio.Event()
+    # A run gets fresh room names so rooms from an earlier step are not reused
+    prefix = f"load{random.randrange(1 << 16):04x}"
+    rooms = [f"{prefix}-{i}" for i in range(args.rooms)]
+
+    tasks = [
+        asyncio.create_task(browser(i, rooms[i % args.rooms], i < args.rooms, args, results, configured, measuring, stop))
+        for i in range(browsers)
+    ]
+    for _ in range(min(args.rooms, browsers)):
+        await configured.acquire()
+    tasks += [asyncio.create_task(fpga_gateway(args, mix, results, measuring, stop)) for _ in range(args.fpgas)]
+
+    await asyncio.sleep(args.warmup)
+    measuring.set()
+    await asyncio.sleep(args.seconds)
+    measuring.clear()
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    results.server = await server_latency(args)
+    return results.report(args.seconds)
+
+
+def print_report(browsers, report):
+    fps = report["framesPerSecond"]
+    frame = report["frameLatencyMs"]
+    event = report["eventLatencyMs"]
+    fpga = report["fpga"]
+    print(
+        f"{browsers:5d} browsers  {fpga['connected']:3d} gateways ({fpga['rejected']} rejected)  "
+        f"fps mean {fps['mean']:5.1f} min {fps['min']:5.1f}  "
+        f"frame p50 {frame['p50']:6.2f} p95 {frame['p95']:6.2f} p99 {frame['p99']:6.2f} ms  "
+        f"event p50 {event['p50']:6.2f} p95 {event['p95']:6.2f} ms  dropped {report['browsers']['dropped']}"
+    )
+
+
+def within_budget(report):
+    return report["framesPerSecond"]["min"] >= MIN_FPS and report["frameLatencyMs"]["p95"] <= LATENCY_BUDGET_MS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--ws-port", type=int, default=WS_PORT)
+    parser.add_argument("--tcp-port", type=int, default=TCP_PORT)
+    parser.add_argument("--fpgas", type=int, default=4)
+    parser.add_argument("--browsers", type=int, default=8)
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument("--mode", choices=MODES, help="mode for every room (default: rotate)")
+    parser.add_argument("--rate", type=float, default=20.0, help="events per second per gateway")
+    parser.add_argument("--burst", type=int, default=0, help="extra events sent back-to-back")
+    parser.add_argument("--burst-every", type=float, default=1.0, help="seconds between bursts")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help="token weights, e.g. J=3,L=1")
+    parser.add_argument("--legacy", action="store_true", help="send bare tokens instead of framed events")
+    parser.add_argument("--position-rate", type=float, default=30.0, help="player_position per second per browser")
+    parser.add_argument("--input-rate", type=float, default=2.0, help="player_input per second per browser (Disco Dash)")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--ramp", action="store_true", help="double the browsers until out of budget")
+    parser.add_argument("--max-browsers", type=int, default=1024)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    args.rooms = max(1, args.rooms)
+    args.players_per_room = max(1, math.ceil(args.fpgas / args.rooms))
+
+    steps = []
+    browsers = max(args.browsers, args.rooms)
+    while True:
+        report = asyncio.run(run_load(args, browsers, args.mix))
+        steps.append({"load": {"browsers": browsers, "fpgas": args.fpgas, "rooms": args.rooms}, **report})
+        if not args.json:
+            print_report(browsers, report)
+        if not args.ramp or not within_budget(report) or browsers * 2 > args.max_browsers:
+            break
+        browsers *= 2
+
+    if args.json:
+        print(json.dumps(steps if args.ramp else steps[0], indent=2))
+        return
+
+    if args.ramp:
+        held = [step["load"]["browsers"] for step in steps if within_budget(step)]
+        if held:
+            print(f"Held {MIN_FPS:.0f} fps with p95 frame latency <= {LATENCY_BUDGET_MS:.0f} ms up to {held[-1]} browsers")
+        else:
+            print(f"Out of budget already at {steps[0]['load']['browsers']} browsers")
+    server = steps[-1]["server"]
+    if server:
+        print("Server stages (p50 / p95 ms): " + ", ".join(
+            f"{stage} {stats['p50Ms']:.2f}/{stats['p95Ms']:.2f}" for stage, stats in server.items() if stats["count"]
+        ))
+
+
+if __name__ == "__main__":
+    main()
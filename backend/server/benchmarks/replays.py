@@ -0,0 +1,145 @@
+"""
+Replays of lag-compensated matches against their recordings.
+
+For Coin Cascade and Bullet Barrage, one room plays two matches back to back
+on a ManualClock the way a live room would: two browsers report positions
+over laggy links and two FPGA players move and jump. Only the second match is
+recorded, so it starts with warm lag-compensation and motion state. Its
+recording is replayed on both backends and the scores have to match the
+live ones; the replay speed is reported as well.
+
+Run from backend/server:  python -m benchmarks.replays
+"""
+import asyncio
+import contextlib
+import io
+import random
+import tempfile
+import time
+from environment import Environment, ManualClock
+from fpga_protocol import make_event
+from game_manager import GameManager
+from game_modes.vectorized import np
+from motion import GROUND_Y
+from recorder import MatchRecorder, read_recording
+from replay import Replayer
+from score_store import ScoreWriter
+from websocket_server import handle_message
+
+MODES = ("Coin Cascade", "Bullet Barrage")
+SECONDS = 20
+DT = 1 / 60
+BROWSERS = (1, 2)
+GATEWAYS = (3, 4)
+
+
+class Browser:
+    """ The WebSocket a player's position reports arrive on """
+    remote_address = ("benchmark", 0)
+    closed = False
+
+
+def snapshot(game):
+    """ Everyone's position, and the latencies reports are rewound by """
+    return {pid: (pos["x"], pos["y"]) for pid, pos in game.player_positions.items()}, dict(game.lag.latency)
+
+
+class TrackingReplayer(Replayer):
+    """ Keeps a snapshot after every replayed tick """
+
+    def __init__(self, entries, backend=None):
+        super().__init__(entries, backend)
+        self.trajectory = []
+
+    async def _apply(self, entry):
+        await super()._apply(entry)
+        if entry["kind"] == "tick":
+            self.trajectory.append(snapshot(self.game))
+
+
+async def play(game, clock, moves, seconds, browsers, trajectory=None):
+    ground = GROUND_Y[game.mode]
+    for _ in range(round(seconds / DT)):
+        now = clock.advance(DT)
+        for pid, ws in browsers.items():
+            # A report about every 100 ms, sent 20-120 ms before it arrives
+            if moves.random() < 0.17:
+                pos = game.player_positions[pid]
+                target = min(game.objects, key=lambda obj: abs(obj["x"] - pos["x"]), default=pos)
+                x = pos["x"] + max(-0.05, min(0.05, target["x"] - pos["x"]))
+                y = ground + (0.3 if moves.random() < 0.2 else 0.0)
+                lag = moves.uniform(0.02, 0.12)
+                await handle_message({
+                    "type": "player_position",
+                    "player": pid,
+                    "position": {"x": x, "y": y},
+                    "sentAt": (now - lag) * 1000,
+                }, game, ws)
+        for pid in GATEWAYS:
+            if moves.random() < 0.05:
+                game.push_fpga_events(pid, [make_event(moves.choice("LRNJ"), received_at=now)])
+        await game.simulate(now)
+        if trajectory is not None:
+            trajectory.append(snapshot(game))
+
+
+async def record(mode, seed, directory):
+    """ Two matches in one room; returns the second one's recording and the room """
+    clock = ManualClock(1_000_000.0)
+    game = GameManager(
+        f"replays-{mode}",
+        score_writer=ScoreWriter(write=lambda batch: None, save=lambda match: None),
+        env=Environment(clock=clock),
+    )
+    game.engines = {}
+    moves = random.Random(seed)
+    browsers = {pid: Browser() for pid in BROWSERS}
+    game.update_config(len(BROWSERS) + len(GATEWAYS), [f"Player {pid}" for pid in BROWSERS + GATEWAYS])
+    for pid in BROWSERS + GATEWAYS:
+        game.player_positions[pid] = {"x": moves.uniform(-1.5, 1.5), "y": GROUND_Y[mode]}
+    for pid in GATEWAYS:
+        game.attach_fpga(pid)
+
+    game.start_match(mode, seed=seed, record=False)
+    await play(game, clock, moves, SECONDS, browsers)
+    # Walking and in the air when the next match starts, which carries over into it
+    for pid in GATEWAYS:
+        game.push_fpga_events(pid, [make_event("R", received_at=clock()), make_event("J", received_at=clock())])
+    await play(game, clock, moves, DT, browsers)
+
+    game.start_match(mode, seed=seed + 1, record=False)
+    game.recorder = MatchRecorder.for_match(game, "dict", directory)
+    trajectory = []
+    await play(game, clock, moves, SECONDS, browsers, trajectory)
+    path = game.recorder.path
+    game.finish_recording()
+    return path, outcome(game, trajectory)
+
+
+def outcome(game, trajectory):
+    # Scores alone can agree by chance; every scoring event and every tick's snapshot cannot
+    return dict(game.match.scores), list(game.match.events), trajectory
+
+
+def main():
+    print(f"{'mode':<16}{'backend':>8}{'ticks':>8}{'replay x':>10}  scores")
+    with tempfile.TemporaryDirectory() as directory:
+        for seed, mode in enumerate(MODES, start=1):
+            with contextlib.redirect_stdout(io.StringIO()):
+                path, live = asyncio.run(record(mode, seed * 100, directory))
+            entries = read_recording(path)
+            for backend in ("dict", "numpy") if np is not None else ("dict",):
+                replayer = TrackingReplayer(entries, backend)
+                started = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scores = asyncio.run(replayer.run())
+                elapsed = time.perf_counter() - started
+                assert replayer.recorded_scores() == live[0], f"{mode}: the recording ends with other scores"
+                replayed = outcome(replayer.game, replayer.trajectory)
+                for name, want, got in zip(("scores", "events", "ticks"), live, replayed):
+                    assert got == want, f"{mode} replay on {backend} diverged in {name}"
+                print(f"{mode:<16}{backend:>8}{replayer.ticks:>8}{SECONDS / elapsed:>9.0f}x  {scores}")
+
+
+if __name__ == "__main__":
+    main()
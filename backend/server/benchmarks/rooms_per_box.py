@@ -0,0 +1,156 @@
+"""
+How many rooms one box can tick at 60 Hz, with rooms sharded over processes.
+
+Every shard process runs a RoomManager with simulated rooms (4 moving
+players and 2 subscribed sockets per room, modes in rotation) on the real
+tick scheduler for a few seconds. First the rooms per shard are raised until
+one shard can no longer hold 60 Hz; then one shard per core runs that many
+rooms at once to check that throughput scales with the core count.
+
+Run from backend/server:  python -m benchmarks.rooms_per_box [--seconds 3] [--json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+
+MODES = ("Coin Cascade", "Bullet Barrage", "Disco Dash")
+PLAYERS = 4
+SOCKETS_PER_ROOM = 2
+MIN_RATE = 58.0  # actual Hz a shard must hold to count as keeping up
+WORK_BUDGET = 0.8  # share of the tick period the p95 tick may use
+
+
+class FakeSocket:
+    def __init__(self, name):
+        self.remote_address = name
+        self.closed = False
+        self.bytes = 0
+
+    async def send(self, msg):
+        self.bytes += len(msg)
+
+    async def close(self):
+        self.closed = True
+
+
+async def run_rooms(count, seconds, seed):
+    import game_manager
+    from rooms import RoomManager
+    from websocket_server import clients
+
+    # Every mode at the default rate, so results stay comparable as MODE_TICK_RATES changes
+    game_manager.MODE_TICK_RATES = {}
+
+    moves = random.Random(seed)
+    rooms = RoomManager(max_rooms=count + 1)
+    for i in range(count):
+        sockets = [FakeSocket(f"bench-{i}-{j}") for j in range(SOCKETS_PER_ROOM)]
+        for j, ws in enumerate(sockets):
+            clients.register(ws)
+            clients.set_encoding(ws, "binary" if j % 2 else "json")
+            room = rooms.join(f"bench-{i}", ws)
+            room.state_sync.subscribe(ws)
+        room.update_config(PLAYERS, [f"Player {pid}" for pid in range(1, PLAYERS + 1)])
+        room.start_match(MODES[i % len(MODES)])
+        room.player_positions = {
+            pid: {"x": moves.uniform(-1.5, 1.5), "y": moves.uniform(-0.7, 0.2)} for pid in range(1, PLAYERS + 1)
+        }
+
+    async def tick(behind, publish):
+        for room in rooms:
+            for pos in room.player_positions.values():
+                pos["x"] += moves.uniform(-0.02, 0.02)
+        return await rooms.tick(behind, publish)
+
+    try:
+        await asyncio.wait_for(rooms.scheduler.run(tick), seconds)
+    except asyncio.TimeoutError:
+        pass
+    return rooms.scheduler.snapshot()
+
+
+def shard(count, seconds, seed, results):
+    with contextlib.redirect_stdout(io.StringIO()):
+        snapshot = asyncio.run(run_rooms(count, seconds, seed))
+    results.put(snapshot)
+
+
+def run_shards(shards, rooms_per_shard, seconds):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=shard, args=(rooms_per_shard, seconds, seed, results))
+        for seed in range(shards)
+    ]
+    for process in processes:
+        process.start()
+    snapshots = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return snapshots
+
+
+def keeps_up(snapshot):
+    period_ms = 1000 / snapshot["tickRate"]
+    return snapshot["actualHz"] >= MIN_RATE and snapshot["workMs"]["p95"] <= WORK_BUDGET * period_ms
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--max-rooms", type=int, default=512)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    report = {"cores": cores, "sweep": [], "scaling": None}
+
+    rooms_per_shard = 0
+    count = 1
+    while count <= args.max_rooms:
+        (snapshot,) = run_shards(1, count, args.seconds)
+        report["sweep"].append({"rooms": count, **snapshot})
+        if not args.json:
+            print(
+                f"1 shard  {count:4d} rooms  {snapshot['actualHz']:5.1f} Hz  "
+                f"work mean {snapshot['workMs']['mean']:6.2f} ms  p95 {snapshot['workMs']['p95']:6.2f} ms  "
+                f"overruns {snapshot['overruns']}"
+            )
+        if not keeps_up(snapshot):
+            break
+        rooms_per_shard = count
+        count *= 2
+
+    if rooms_per_shard:
+        snapshots = run_shards(cores, rooms_per_shard, args.seconds)
+        holding = sum(1 for snapshot in snapshots if keeps_up(snapshot))
+        report["scaling"] = {
+            "shards": cores,
+            "roomsPerShard": rooms_per_shard,
+            "shardsAt60Hz": holding,
+            "roomsAt60Hz": holding * rooms_per_shard,
+            "actualHz": [snapshot["actualHz"] for snapshot in snapshots],
+            "workP95Ms": [snapshot["workMs"]["p95"] for snapshot in snapshots],
+        }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    scaling = report["scaling"]
+    if scaling is None:
+        print("A single room does not hold 60 Hz on this box")
+        return
+    print(
+        f"{cores} shards x {rooms_per_shard} rooms: {scaling['shardsAt60Hz']}/{cores} shards held 60 Hz "
+        f"-> {scaling['roomsAt60Hz']} rooms per box"
+    )
+
+
+if __name__ == "__main__":
+    main()
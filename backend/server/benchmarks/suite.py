@@ -0,0 +1,313 @@
+"""
+Benchmark suite for the hot paths, checked against stored baselines.
+
+Cases (time per call):
+  mode.*       update_coin_game / update_arrow_game / update_spikeball_game
+               at several object and player counts
+  broadcast.*  broadcast_state to N in-process fake sockets, JSON and binary
+  encode.*     json.dumps of a gameStateUpdate keyframe
+  db.*         update_score, add_scores, get_scores and a leaderboard page
+               against a scratch database of 10k to 1M players
+
+Each case runs for at least --min-time seconds per round and reports the
+median of --rounds rounds. Results are compared with the baseline file
+(benchmarks/baselines.json by default) and any case slower than the
+baseline by more than --tolerance is reported as a regression, with a
+non-zero exit status. --save writes the current results as the new
+baseline. Baselines are only comparable on the machine that recorded them:
+against another machine's baseline regressions are reported but only fail
+the run with --force.
+
+Run from backend/server:  python -m benchmarks.suite [--quick] [--save] [--json] [-k broadcast]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+DT = 1 / 60
+
+MODE_OBJECTS = (10, 100, 1000)
+MODE_PLAYERS = (2, 16)
+ARROW_PLAYERS = (2, 8, 16)
+BROADCAST_CLIENTS = (10, 100, 1000)
+ENCODE_OBJECTS = (10, 100, 1000)
+DB_ROWS = (10_000, 100_000, 1_000_000)
+QUICK_DB_ROWS = (10_000, 100_000)
+
+
+class FakeSocket:
+    def __init__(self, name):
+        self.remote_address = name
+        self.closed = False
+
+    async def send(self, msg):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+def measure(call, rounds, min_time):
+    """ Median seconds per call over rounds of at least min_time each """
+    call()
+    samples = []
+    for _ in range(rounds):
+        calls = 0
+        started = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            call()
+            calls += 1
+            elapsed = time.perf_counter() - started
+        samples.append(elapsed / calls)
+    return statistics.median(samples)
+
+
+def make_game(mode, players, seed):
+    from environment import Environment
+    from game_manager import GameManager
+
+    game = GameManager(f"bench-{mode}", env=Environment(seed))
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.update_config(players, [f"Player {pid}" for pid in range(1, players + 1)])
+        game.start_match(mode, seed=seed)
+    moves = random.Random(seed)
+    game.player_positions = {
+        pid: {"x": moves.uniform(-1.5, 1.5), "y": moves.uniform(-0.7, 0.2)} for pid in range(1, players + 1)
+    }
+    return game, moves
+
+
+def mode_cases(args):
+    from game_modes import coin_game, spikeball_game
+    from game_modes.arrow_game import update_arrow_game
+    from wire import OBJECT_TYPES
+
+    knobs = [
+        ("coin", "Coin Cascade", coin_game, "MIN_COINS", coin_game.update_coin_game),
+        ("spikeball", "Bullet Barrage", spikeball_game, "MIN_SPIKES", spikeball_game.update_spikeball_game),
+    ]
+    for name, mode, module, knob, update in knobs:
+        default = getattr(module, knob)
+        try:
+            for objects, players in itertools.product(MODE_OBJECTS, MODE_PLAYERS):
+                setattr(module, knob, objects)
+                game, moves = make_game(mode, players, seed=objects)
+                clock = itertools.count(1)
+
+                def tick():
+                    for pos in game.player_positions.values():
+                        pos["x"] += moves.uniform(-0.02, 0.02)
+                    game.objects[:] = update(game, game.start_time + next(clock) * DT)
+
+                yield f"mode.{name}.objects={objects}.players={players}", tick
+        finally:
+            setattr(module, knob, default)
+
+    actions = [kind for kind in OBJECT_TYPES if kind.startswith("Arrow") or kind == "Button"]
+    for players in ARROW_PLAYERS:
+        game, moves = make_game("Disco Dash", players, seed=players)
+        clock = itertools.count(1)
+        loop = asyncio.new_event_loop()
+
+        def tick():
+            now = game.start_time + next(clock) * DT
+            for pid in game.player_positions:
+                if moves.random() < 0.05:
+                    game.player_input_queue.append({"player": pid, "action": moves.choice(actions), "timestamp": now})
+            game.objects[:] = loop.run_until_complete(update_arrow_game(game, now))
+
+        try:
+            yield f"mode.arrow.players={players}", tick
+        finally:
+            loop.close()
+
+
+def broadcast_cases(args):
+    from game_modes.coin_game import update_coin_game
+    from websocket_server import broadcast_state, clients
+
+    for count, encoding in itertools.product(BROADCAST_CLIENTS, ("json", "binary")):
+        game, _ = make_game("Coin Cascade", 4, seed=count)
+        loop = asyncio.new_event_loop()
+        sockets = [FakeSocket(f"bench-{i}") for i in range(count)]
+
+        async def subscribe():
+            for ws in sockets:
+                clients.register(ws)
+                clients.set_encoding(ws, encoding)
+                game.subscribers.add(ws)
+
+        async def unsubscribe():
+            for ws in sockets:
+                clients.unregister(ws)
+            await asyncio.sleep(0)
+
+        loop.run_until_complete(subscribe())
+        clock = itertools.count(1)
+
+        def tick():
+            now = game.start_time + next(clock) * DT
+            game.objects[:] = update_coin_game(game, now)
+            state = {"mode": game.mode, "objects": game.objects, "scores": game.player_scores, "timestamp": now}
+            # Let the channel writers drain the queued frames as a real loop would
+            loop.run_until_complete(broadcast_state(game, state))
+            loop.run_until_complete(asyncio.sleep(0))
+
+        try:
+            yield f"broadcast.{encoding}.clients={count}", tick
+        finally:
+            loop.run_until_complete(unsubscribe())
+            loop.close()
+
+
+def encode_cases(args):
+    from environment import Environment
+    from game_modes.coin_game import create_new_coin
+
+    for objects in ENCODE_OBJECTS:
+        env = Environment(objects)
+        frame = {
+            "type": "gameStateUpdate",
+            "mode": "Coin Cascade",
+            "objects": [create_new_coin(1000.0, env) for _ in range(objects)],
+            "scores": {pid: pid * 10 for pid in range(1, 5)},
+            "timestamp": 1000.0,
+            "seq": 1,
+            "keyframe": True,
+        }
+        yield f"encode.json.objects={objects}", lambda frame=frame: json.dumps(frame)
+
+
+def db_cases(args):
+    import db
+
+    for rows in QUICK_DB_ROWS if args.quick else DB_ROWS:
+        with tempfile.TemporaryDirectory() as scratch:
+            db.DB_FILE = os.path.join(scratch, "bench.db")
+            db._local.conn = None
+            db.init_db()
+            conn = db.get_connection()
+            scores = random.Random(rows)
+            with conn:
+                conn.executemany(
+                    "INSERT INTO players (username, score) VALUES (?, ?)",
+                    ((f"player-{i}", scores.randrange(100_000)) for i in range(rows))
+                )
+            names = itertools.cycle(f"player-{i}" for i in range(0, rows, 7))
+            batch = {f"player-{i * (rows // 32)}": 1 for i in range(32)}
+
+            yield f"db.update_score.rows={rows}", lambda: db.update_score(next(names), 1)
+            yield f"db.add_scores.batch=32.rows={rows}", lambda: db.add_scores(batch)
+            yield f"db.get_score_page.rows={rows}", lambda: db.get_score_page(100, 0)
+            yield f"db.get_scores.rows={rows}", db.get_scores
+
+            conn.close()
+            db._local.conn = None
+
+
+GROUPS = {"mode": mode_cases, "broadcast": broadcast_cases, "encode": encode_cases, "db": db_cases}
+
+
+def _may_match(pattern, group):
+    # Setting up a group (e.g. a 1M row database) is skipped only when the pattern
+    # clearly names another group; "arrow" or "players=2" can match in any group
+    head = pattern.split(".")[0]
+    return pattern in group or head == group or head not in GROUPS
+
+
+def run_suite(args):
+    results = {}
+    for group, cases in GROUPS.items():
+        if args.k and not any(_may_match(pattern, group) for pattern in args.k):
+            continue
+        for name, call in cases(args):
+            if args.k and not any(pattern in name for pattern in args.k):
+                continue
+            # Game code prints on config changes and errors; keep the report readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                seconds = measure(call, args.rounds, args.min_time)
+            results[name] = seconds * 1e6
+            if not args.json:
+                print(f"  {name:<48}{seconds * 1e6:>14.2f} us", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    rows = []
+    for name, us in results.items():
+        base = baseline.get(name)
+        ratio = us / base if base else None
+        status = "new" if base is None else "REGRESSION" if ratio > 1 + tolerance else "ok"
+        rows.append({"name": name, "us": us, "baselineUs": base, "ratio": ratio, "status": status})
+    return rows
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"machine": None, "results": {}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--rounds", type=int, default=9)
+    parser.add_argument("--min-time", type=float, default=0.25)
+    parser.add_argument("--quick", action="store_true", help="skip the 1M row database")
+    parser.add_argument("-k", action="append", help="only run cases whose name contains this")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--force", action="store_true", help="fail on regressions even against another machine's baseline")
+    args = parser.parse_args()
+
+    results = run_suite(args)
+
+    baseline = load_baseline(args.baseline)
+    rows = compare(results, baseline["results"], args.tolerance)
+    regressions = [row for row in rows if row["status"] == "REGRESSION"]
+    comparable = not baseline["machine"] or baseline["machine"] == machine()
+
+    if args.json:
+        print(json.dumps({"machine": machine(), "baselineMachine": baseline["machine"], "cases": rows}, indent=2))
+    else:
+        print(f"{'case':<50}{'us':>12}{'baseline':>12}{'ratio':>8}  status")
+        for row in rows:
+            base = f"{row['baselineUs']:.2f}" if row["baselineUs"] else "-"
+            ratio = f"{row['ratio']:.2f}" if row["ratio"] else "-"
+            print(f"{row['name']:<50}{row['us']:>12.2f}{base:>12}{ratio:>8}  {row['status']}")
+        if not comparable:
+            print(f"⚠️ Baseline was recorded on {baseline['machine']}, ratios are not comparable")
+
+    if args.save:
+        # Cases not run this time (e.g. with -k or --quick) keep their old baseline
+        merged = {**baseline["results"], **results}
+        with open(args.baseline, "w") as f:
+            json.dump({"machine": machine(), "results": dict(sorted(merged.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"Saved {len(results)} results to {args.baseline}", file=sys.stderr)
+    elif regressions and (comparable or args.force):
+        print(f"❌ {len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+def machine():
+    return f"{platform.machine()} {platform.python_implementation()} {platform.python_version()} {os.cpu_count()} cpu"
+
+
+if __name__ == "__main__":
+    main()
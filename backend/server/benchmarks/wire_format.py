@@ -0,0 +1,129 @@
+"""
+Serialization cost and size of state frames, JSON versus binary.
+
+Every frame is also decoded again and compared with its JSON form, plus a
+delta that removes fields, which the games rarely produce on their own.
+
+Run from backend/server:  python -m benchmarks.wire_format
+"""
+import asyncio
+import json
+import struct
+import time
+from game_manager import GameManager
+from game_modes.coin_game import update_coin_game, create_new_coin
+from game_modes.arrow_game import update_arrow_game
+from game_modes.spikeball_game import update_spikeball_game
+from wire import FIELDS, StateCodec, decode_binary
+
+TICKS = 600
+DT = 1 / 60
+
+
+def record_frames(mode, extra_coins=0):
+    game = GameManager()
+    game.update_config(2, ["Player 1", "Player 2"])
+    game.mode = mode
+    game.start_time = time.time()
+    game.player_positions = {1: {"x": 5, "y": 5}, 2: {"x": -5, "y": 5}}
+    client = object()
+    game.state_sync.subscribe(client)
+
+    keyframes, deltas = [], []
+    now = game.start_time
+    for _ in range(TICKS):
+        now += DT
+        if mode == "Coin Cascade":
+            game.objects[:] = update_coin_game(game, now)
+            while len(game.objects) < extra_coins:
+                game.objects.append(create_new_coin(now, game.env))
+        elif mode == "Disco Dash":
+            game.objects[:] = asyncio.run(update_arrow_game(game, now))
+        else:
+            game.objects[:] = update_spikeball_game(game, now)
+
+        state = {"mode": mode, "objects": game.objects, "scores": game.player_scores, "timestamp": now}
+        groups = game.state_sync.frames(state, [client, object()])
+        for frame, _ in groups:
+            # Frames reference the live object list, so keep a copy of this tick's state
+            frame = json.loads(json.dumps(frame))
+            (deltas if frame["type"] == "gameStateDelta" else keyframes).append(frame)
+        game.state_sync.ack(client, game.state_sync.seq)
+    return keyframes, deltas
+
+
+def as_decoded(frame, ids):
+    """ frame as decode_binary should give it back: small ids, known fields only, 32-bit floats """
+    formats = dict(FIELDS)
+
+    def fields(obj):
+        kept = {}
+        for name, value in obj.items():
+            if name not in formats:
+                continue
+            if formats[name] == "f" and value is not None:
+                value = struct.unpack("<f", struct.pack("<f", value))[0]
+            kept[name] = value
+        return kept
+
+    def objects(objs):
+        return [{"id": ids[obj["id"]], "type": obj["type"], **fields(obj)} for obj in objs]
+
+    expected = {key: frame[key] for key in ("type", "mode", "seq", "timestamp", "traces") if key in frame}
+    expected["scores"] = {int(pid): score for pid, score in frame["scores"].items()}
+    if frame["type"] == "gameStateUpdate":
+        expected.update(objects=objects(frame["objects"]), keyframe=True)
+    else:
+        expected.update(
+            baseSeq=frame["baseSeq"],
+            spawned=objects(frame["spawned"]),
+            removed=[ids[obj_id] for obj_id in frame["removed"]],
+            changed={ids[obj_id]: fields(changes) for obj_id, changes in frame["changed"].items()},
+        )
+    return expected
+
+
+def check_round_trip(frames):
+    codec = StateCodec()
+    for frame in frames:
+        decoded = decode_binary(codec.encode_binary(frame))
+        assert decoded == as_decoded(frame, codec.ids.ids), f"binary {frame['type']} {frame['seq']} decodes differently"
+
+
+# A delta that clears fields, as diff_objects marks a field the object no longer has
+CLEARED = {
+    "type": "gameStateDelta", "mode": "Disco Dash", "seq": 2, "baseSeq": 1, "timestamp": 1.5,
+    "spawned": [], "removed": [], "scores": {"1": 2},
+    "changed": {"arrow-1": {"hitBy": None, "missedBy": [2], "y": None}, "arrow-2": {"speed": 3.0}},
+}
+
+
+def measure(frames, encode):
+    started = time.perf_counter()
+    size = sum(len(encode(frame)) for frame in frames)
+    elapsed = time.perf_counter() - started
+    return size / len(frames), elapsed * 1e6 / len(frames)
+
+
+def main():
+    cases = [
+        ("Coin Cascade", 0),
+        ("Coin Cascade", 100),
+        ("Disco Dash", 0),
+        ("Bullet Barrage", 0),
+    ]
+    print(f"{'case':<22}{'frame':<10}{'json B':>10}{'bin B':>10}{'json us':>10}{'bin us':>10}")
+    for mode, extra in cases:
+        keyframes, deltas = record_frames(mode, extra)
+        check_round_trip(keyframes + deltas)
+        codec = StateCodec()
+        label = f"{mode} x{extra}" if extra else mode
+        for kind, frames in (("keyframe", keyframes), ("delta", deltas)):
+            json_size, json_us = measure(frames, json.dumps)
+            bin_size, bin_us = measure(frames, codec.encode_binary)
+            print(f"{label:<22}{kind:<10}{json_size:>10.0f}{bin_size:>10.0f}{json_us:>10.1f}{bin_us:>10.1f}")
+    check_round_trip([CLEARED])
+
+
+if __name__ == "__main__":
+    main()
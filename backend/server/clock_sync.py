@@ -0,0 +1,84 @@
+from collections import deque
+from itertools import count
+from config import CLOCK_SYNC_WINDOW, CLOCK_SYNC_SMOOTHING
+
+# NTP-style exchange. The server stamps a ping with its send time t0, the
+# remote end notes when it received it (t1) and when it answered (t2), and the
+# server notes when the answer arrived (t3). Then
+#
+#   rtt    = (t3 - t0) - (t2 - t1)
+#   offset = ((t1 - t0) + (t2 - t3)) / 2      (remote clock minus server clock)
+#
+# The offset error is at most half the path asymmetry, so the sample with the
+# lowest RTT in the recent window is the one trusted; estimates are smoothed.
+
+
+class ClockSync:
+    """ Smoothed offset/RTT of one remote clock; all times in seconds """
+
+    def __init__(self, window=CLOCK_SYNC_WINDOW, smoothing=CLOCK_SYNC_SMOOTHING):
+        self.samples = deque(maxlen=window)  # (rtt, offset)
+        self.smoothing = smoothing
+        self.offset = None
+        self.rtt = None
+        self.pending = {}  # ping id -> t0
+        self.ids = count(1)
+
+    @property
+    def synced(self):
+        return self.offset is not None
+
+    def ping(self, now):
+        ping_id = next(self.ids) & 0xFFFF
+        self.pending[ping_id] = now
+        # Unanswered pings are forgotten once a window's worth are outstanding
+        while len(self.pending) > self.samples.maxlen:
+            del self.pending[next(iter(self.pending))]
+        return ping_id
+
+    def pong(self, ping_id, t1, t2, t3):
+        t0 = self.pending.pop(ping_id, None)
+        if t0 is not None:
+            self.sample(t0, t1, t2, t3)
+
+    def sample(self, t0, t1, t2, t3):
+        rtt = (t3 - t0) - (t2 - t1)
+        if rtt < 0:
+            return
+        self.samples.append((rtt, (t1 - t0 + t2 - t3) / 2))
+        _, best_offset = min(self.samples)
+        if self.offset is None:
+            self.offset, self.rtt = best_offset, rtt
+        else:
+            self.offset += self.smoothing * (best_offset - self.offset)
+            self.rtt += self.smoothing * (rtt - self.rtt)
+
+    def to_server(self, remote_time):
+        """ Remote clock reading (seconds) on the server clock; unchanged until synced """
+        return remote_time - self.offset if self.synced else remote_time
+
+    def snapshot(self):
+        return {
+            "synced": self.synced,
+            "offsetMs": self.offset * 1000 if self.synced else None,
+            "rttMs": self.rtt * 1000 if self.synced else None,
+            "samples": len(self.samples),
+        }
+
+
+class DeviceClockSync(ClockSync):
+    """ Clock of an FPGA gateway, whose device time is a wrapping u32 in microseconds """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_raw = None
+        self.wraps = 0
+
+    def device_seconds(self, raw):
+        if self.last_raw is not None and raw < self.last_raw - 0x80000000:
+            self.wraps += 1
+        elif self.last_raw is not None and raw > self.last_raw + 0x80000000:
+            # A late reading from before the last wrap
+            return (raw + (self.wraps - 1) * 0x100000000) / 1e6
+        self.last_raw = raw
+        return (raw + self.wraps * 0x100000000) / 1e6
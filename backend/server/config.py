@@ -4,4 +4,82 @@ WS_PORT = 8765
 DB_FILE = "game_data.db"
 TICK_RATE = 1 / 60  # 60 FPS
 AWS_IP = "13.61.26.147"
-TCP_PORT = 15234
\ No newline at end of file
+TCP_PORT = 15234
+
+# Tick scheduling
+TICK_POLICY = "catch_up"  # "catch_up" replays missed ticks back-to-back, "skip" drops them
+MAX_CATCH_UP_TICKS = 3  # beyond this many missed ticks the scheduler skips ahead
+TICK_STATS_WINDOW = 600  # number of recent ticks kept for live telemetry
+# Simulation tick period per mode, TICK_RATE for the others, e.g. {"Bullet Barrage": 1 / 30}.
+# Coin and spike motion is scaled and collisions are swept along each tick's path, so a
+# mode plays and scores the same at any rate; browsers smooth between states.
+MODE_TICK_RATES = {}
+BROADCAST_RATE = TICK_RATE  # minimum seconds between gameStateUpdates of a room, whatever its tick rate
+
+# State sync
+KEYFRAME_INTERVAL = 60  # ticks between full gameStateUpdate keyframes for delta clients
+DELTA_HISTORY = 120  # ticks of snapshots kept as possible delta baselines
+
+# Broadcast fan-out
+SEND_QUEUE_SIZE = 64  # per-client queued messages before a client is considered stalled
+
+# FPGA TCP connections
+FPGA_READ_BUFFER = 4096  # bytes per read and stream buffer limit
+FPGA_SOCKET_RCVBUF = 64 * 1024  # kernel receive buffer per connection
+FPGA_IDLE_TIMEOUT = None  # seconds without data before a gateway is dropped; None leaves it to TCP keepalive
+FPGA_EVENT_QUEUE_SIZE = 64  # parsed event batches queued per player before reads pause
+FPGA_KEEPALIVE = True
+FPGA_KEEPALIVE_IDLE = 10  # seconds
+FPGA_KEEPALIVE_INTERVAL = 5  # seconds
+FPGA_KEEPALIVE_COUNT = 3
+
+# FPGA input path
+INPUT_RING_SIZE = 256  # pending FPGA events per player between ticks
+
+# Simulation
+SIM_BACKEND = "dict"  # "numpy" runs coin and spikeball modes on game_modes/vectorized.py
+
+# Score persistence
+SCORE_FLUSH_INTERVAL = 2.0  # seconds between write-behind flushes of score deltas
+
+# SQLite
+DB_WORKERS = 2  # threads serving db calls made from the event loop
+DB_CACHE_KB = 8192  # page cache per connection
+DB_BUSY_TIMEOUT = 5  # seconds a writer waits for the database lock
+
+# Leaderboard
+LEADERBOARD_TOP_K = 1000  # highest scores kept in memory; deeper pages are read from SQLite
+LEADERBOARD_MAX_LIMIT = 1000  # largest page a client may ask for
+
+# Match history
+MATCH_EVENT_LIMIT = 100000  # scoring events logged per match; later ones are only counted
+
+# Rooms
+DEFAULT_ROOM = "default"  # room every WebSocket starts in
+MAX_ROOMS = 32  # rooms hosted by one process
+
+# Sharding (rooms spread over worker processes)
+SHARDS = 0  # worker processes; 0 or 1 runs every room in the main process
+SHARD_SOCKET_DIR = "/tmp"  # Unix sockets between the front process and the shards
+SHARD_STATUS_INTERVAL = 0.25  # seconds between room status reports from a shard
+SHARD_LEADERBOARD_MAX_AGE = 1.0  # seconds a process may serve leaderboard rows other processes wrote to
+
+# Lag compensation
+LAG_COMP_MAX_REWIND = 0.25  # seconds; clients further behind are judged as if they had this much lag
+POSITION_HISTORY = 32  # position reports kept per player
+LATENCY_SMOOTHING = 0.2  # weight of a new sample in the smoothed per-player latency
+
+# Clock synchronization
+CLOCK_SYNC_INTERVAL = 2.0  # seconds between clock pings per connection
+CLOCK_SYNC_BURST = 4  # quick pings right after connecting, CLOCK_SYNC_BURST_INTERVAL apart
+CLOCK_SYNC_BURST_INTERVAL = 0.2
+CLOCK_SYNC_WINDOW = 8  # samples kept; the lowest-RTT one is trusted most
+CLOCK_SYNC_SMOOTHING = 0.3  # weight of a new estimate in the smoothed offset and RTT
+FPGA_CLOCK_SYNC = True  # ping gateways that speak the framed protocol
+
+# Latency tracing
+TRACE_OPEN_LIMIT = 4096  # FPGA events followed at once; the oldest are dropped beyond this
+
+# Match recording (see recorder.py / replay.py)
+RECORD_MATCHES = False  # write every match's seed and inputs to RECORD_DIR
+RECORD_DIR = "recordings"
@@ -1,36 +1,187 @@
+import asyncio
 import sqlite3
-from config import DB_FILE
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import DB_FILE, DB_WORKERS, DB_CACHE_KB, DB_BUSY_TIMEOUT
+
+# One connection per thread (Flask request threads, the db executor's workers),
+# opened on first use and kept for the life of the thread. sqlite3 caches the
+# compiled statements per connection, so the SQL below is only prepared once.
+
+UPSERT_SCORE = (
+    'INSERT INTO players (username, score) VALUES (?, ?) '
+    'ON CONFLICT(username) DO UPDATE SET score = score + excluded.score'
+)
+# Bumped in the same transaction as every score write, by every process sharing
+# the file, so the leaderboard can tell whether the players table changed
+BUMP_SCORE_VERSION = 'UPDATE score_version SET version = version + 1'
+SELECT_SCORE_VERSION = 'SELECT version FROM score_version'
+INSERT_MATCH = 'INSERT INTO matches (mode, started_at, ended_at, num_players) VALUES (?, ?, ?, ?)'
+INSERT_RESULT = (
+    'INSERT INTO match_results (match_id, player, username, score, mode, started_at) '
+    'VALUES (?, ?, ?, ?, ?, ?)'
+)
+INSERT_EVENT = 'INSERT INTO match_events (match_id, at, player, kind, points) VALUES (?, ?, ?, ?, ?)'
+SELECT_BEST_RESULTS = (
+    'SELECT match_id, player, username, score, started_at FROM match_results '
+    'WHERE mode = ? AND started_at >= ? ORDER BY score DESC LIMIT ?'
+)
+SELECT_MATCH = 'SELECT id, mode, started_at, ended_at, num_players FROM matches WHERE id = ?'
+SELECT_MATCH_RESULTS = 'SELECT player, username, score FROM match_results WHERE match_id = ? ORDER BY score DESC'
+SELECT_MATCH_EVENTS = 'SELECT at, player, kind, points FROM match_events WHERE match_id = ? ORDER BY at'
+SELECT_SCORES = 'SELECT username, score FROM players ORDER BY score DESC'
+SELECT_SCORE_PAGE = SELECT_SCORES + ' LIMIT ? OFFSET ?'
+SELECT_PLAYER_SCORE = 'SELECT score FROM players WHERE username = ?'
+COUNT_HIGHER_SCORES = 'SELECT COUNT(*) FROM players WHERE score > ?'
+
+_local = threading.local()
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+
+
+def connect():
+    conn = sqlite3.connect(DB_FILE, timeout=DB_BUSY_TIMEOUT, cached_statements=128)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DB_CACHE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = connect()
+    return conn
+
+
+async def run_db(fn, *args):
+    """ Run a db function on the db executor so the event loop never waits on SQLite """
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
 
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS players (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE,
-            score INTEGER DEFAULT 0
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    conn = get_connection()
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS players (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE,
+                score INTEGER DEFAULT 0
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_players_score ON players (score DESC)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS score_version (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                version INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('INSERT OR IGNORE INTO score_version (id, version) VALUES (0, 0)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS matches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mode TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                ended_at REAL NOT NULL,
+                num_players INTEGER
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_matches_mode_started ON matches (mode, started_at)')
+        # mode and started_at are copied from the match so leaderboard queries stay on one index
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS match_results (
+                match_id INTEGER NOT NULL REFERENCES matches (id),
+                player INTEGER NOT NULL,
+                username TEXT,
+                score INTEGER NOT NULL,
+                mode TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                PRIMARY KEY (match_id, player)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_mode_started ON match_results (mode, started_at, score)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_results_username ON match_results (username, started_at)')
+        # Append-only: rows are only ever inserted, at the end of their match
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS match_events (
+                match_id INTEGER NOT NULL REFERENCES matches (id),
+                at REAL NOT NULL,
+                player INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                points INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_events_match ON match_events (match_id, at)')
 
 def update_score(username, increment=1):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT score FROM players WHERE username = ?', (username,))
-    result = cursor.fetchone()
-    if result:
-        new_score = result[0] + increment
-        cursor.execute('UPDATE players SET score = ? WHERE username = ?', (new_score, username))
-    else:
-        cursor.execute('INSERT INTO players (username, score) VALUES (?, ?)', (username, increment))
-    conn.commit()
-    conn.close()
+    """ Returns the score version after the write """
+    conn = get_connection()
+    with conn:
+        conn.execute(UPSERT_SCORE, (username, increment))
+        return _bump_score_version(conn)
+
+def add_scores(deltas):
+    """ Apply {username: increment} in a single transaction; returns the score version after it """
+    conn = get_connection()
+    with conn:
+        conn.executemany(UPSERT_SCORE, deltas.items())
+        return _bump_score_version(conn)
+
+def _bump_score_version(conn):
+    conn.execute(BUMP_SCORE_VERSION)
+    return conn.execute(SELECT_SCORE_VERSION).fetchone()[0]
+
+def get_score_version():
+    return get_connection().execute(SELECT_SCORE_VERSION).fetchone()[0]
 
 def get_scores():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('SELECT username, score FROM players ORDER BY score DESC')
-    scores = cursor.fetchall()
-    conn.close()
-    return scores
+    return get_connection().execute(SELECT_SCORES).fetchall()
+
+def get_score_page(limit, offset=0):
+    return get_connection().execute(SELECT_SCORE_PAGE, (limit, offset)).fetchall()
+
+def get_rank(username):
+    """ (rank, score) of a player, rank 1 being the best; None if unknown """
+    conn = get_connection()
+    row = conn.execute(SELECT_PLAYER_SCORE, (username,)).fetchone()
+    if row is None:
+        return None
+    (higher,) = conn.execute(COUNT_HIGHER_SCORES, (row[0],)).fetchone()
+    return higher + 1, row[0]
+
+def save_match(match):
+    """ Write a finished MatchRecord (match row, results, event log) in one transaction """
+    conn = get_connection()
+    with conn:
+        match_id = conn.execute(INSERT_MATCH, (match.mode, match.started_at, match.ended_at, match.num_players)).lastrowid
+        conn.executemany(INSERT_RESULT, (
+            (match_id, pid, username, score, match.mode, match.started_at)
+            for pid, username, score in match.results()
+        ))
+        conn.executemany(INSERT_EVENT, ((match_id, at, pid, kind, points) for at, pid, kind, points in match.events))
+    return match_id
+
+def get_best_results(mode, since, limit=10):
+    """ Best single-match scores in a mode since a unix time, e.g. "best Disco Dash score this week" """
+    rows = get_connection().execute(SELECT_BEST_RESULTS, (mode, since, limit)).fetchall()
+    return [
+        {"matchId": match_id, "player": pid, "username": username, "score": score, "startedAt": started_at}
+        for match_id, pid, username, score, started_at in rows
+    ]
+
+def get_match(match_id, with_events=False):
+    conn = get_connection()
+    row = conn.execute(SELECT_MATCH, (match_id,)).fetchone()
+    if row is None:
+        return None
+    match = dict(zip(("id", "mode", "startedAt", "endedAt", "numPlayers"), row))
+    match["results"] = [
+        {"player": pid, "username": username, "score": score}
+        for pid, username, score in conn.execute(SELECT_MATCH_RESULTS, (match_id,))
+    ]
+    if with_events:
+        match["events"] = [
+            {"at": at, "player": pid, "kind": kind, "points": points}
+            for at, pid, kind, points in conn.execute(SELECT_MATCH_EVENTS, (match_id,))
+        ]
+    return match
@@ -0,0 +1,47 @@
+import random
+import time
+import uuid
+
+_seeds = random.SystemRandom()
+
+
+class Environment:
+    """
+    Where a room's simulation gets its randomness, object ids and time. Live
+    rooms draw a fresh seed per match and read the wall clock; a replay uses
+    the recorded seed and a ManualClock, so the same inputs give the same
+    objects and scores.
+    """
+
+    def __init__(self, seed=None, clock=time.time):
+        self.clock = clock
+        self.reseed(seed)
+
+    def reseed(self, seed=None):
+        self.seed = _seeds.randrange(1 << 32) if seed is None else seed
+        self.random = random.Random(self.seed)
+        # Ids come from their own stream so they do not shift the game's draws
+        self._ids = random.Random(f"ids-{self.seed}")
+
+    def uuid(self):
+        return str(uuid.UUID(int=self._ids.getrandbits(128), version=4))
+
+    def now(self):
+        return self.clock()
+
+
+class ManualClock:
+    """ A clock that only moves when told to """
+
+    def __init__(self, now=0.0):
+        self.time = now
+
+    def __call__(self):
+        return self.time
+
+    def set(self, now):
+        self.time = now
+
+    def advance(self, seconds):
+        self.time += seconds
+        return self.time
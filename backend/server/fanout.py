@@ -0,0 +1,148 @@
+import asyncio
+from collections import deque
+from config import SEND_QUEUE_SIZE
+from metrics import WS_CLIENTS
+
+# Frames that are superseded by the next tick and may be coalesced or dropped
+STATE_FRAME_TYPES = ("gameStateUpdate", "gameStateDelta")
+
+
+class ClientChannel:
+    """
+    Bounded send queue for one WebSocket, drained by its own writer task so a
+    slow browser only ever delays itself. At most one state frame is kept
+    queued: a newer one replaces it. Other messages are never dropped; a
+    client whose queue is full of them is disconnected instead.
+    """
+
+    def __init__(self, ws, on_close, max_queue=SEND_QUEUE_SIZE):
+        self.ws = ws
+        self.on_close = on_close
+        self.max_queue = max_queue
+        self.queue = deque()  # (message, droppable)
+        self.encoding = "json"  # wire encoding negotiated for state frames
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self.task = asyncio.create_task(self._drain())
+
+    def push(self, msg, droppable=False):
+        if self.closed:
+            return
+
+        if droppable:
+            for i, (_, queued_droppable) in enumerate(self.queue):
+                if queued_droppable:
+                    del self.queue[i]
+                    self.coalesced += 1
+                    break
+        elif len(self.queue) >= self.max_queue:
+            # Make room by discarding a pending state frame before giving up
+            for i, (_, queued_droppable) in enumerate(self.queue):
+                if queued_droppable:
+                    del self.queue[i]
+                    self.dropped += 1
+                    break
+
+        if len(self.queue) >= self.max_queue:
+            if droppable:
+                self.dropped += 1
+                return
+            print(f"❌ Send queue full for {self.ws.remote_address}, disconnecting")
+            self.close()
+            return
+
+        self.queue.append((msg, droppable))
+        self.ready.set()
+
+    async def _drain(self):
+        while not self.closed:
+            if not self.queue:
+                self.ready.clear()
+                await self.ready.wait()
+                continue
+
+            msg, droppable = self.queue.popleft()
+            if self.ws.closed:
+                break
+            try:
+                if getattr(self.ws, "relayed", False):
+                    # A shard's stand-in socket: the front needs the flag for its own queue
+                    await self.ws.send(msg, droppable)
+                else:
+                    await self.ws.send(msg)
+                self.sent += 1
+            except Exception as e:
+                print(f"Error sending message: {e}")
+                break
+        self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.ready.set()
+        self.on_close(self.ws)
+        asyncio.ensure_future(self.ws.close())
+
+    def stats(self):
+        return {
+            "address": str(self.ws.remote_address),
+            "encoding": self.encoding,
+            "queueDepth": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class FanOut:
+    """ Registry of per-client channels; frames are encoded by the caller once """
+
+    def __init__(self, max_queue=SEND_QUEUE_SIZE):
+        self.max_queue = max_queue
+        self.channels = {}
+
+    def __iter__(self):
+        return iter(list(self.channels))
+
+    def __len__(self):
+        return len(self.channels)
+
+    def register(self, ws):
+        self.channels[ws] = ClientChannel(ws, self.unregister, self.max_queue)
+        WS_CLIENTS.set(len(self.channels))
+
+    def unregister(self, ws):
+        channel = self.channels.pop(ws, None)
+        if channel:
+            WS_CLIENTS.set(len(self.channels))
+            channel.close()
+
+    def set_encoding(self, ws, encoding):
+        channel = self.channels.get(ws)
+        if channel:
+            channel.encoding = encoding
+
+    def by_encoding(self, targets):
+        groups = {}
+        for ws in targets:
+            channel = self.channels.get(ws)
+            if channel:
+                groups.setdefault(channel.encoding, []).append(ws)
+        return groups
+
+    def send(self, ws, msg, droppable=False):
+        channel = self.channels.get(ws)
+        if channel:
+            channel.push(msg, droppable)
+
+    def publish(self, msg, targets=None, droppable=False):
+        for ws in list(self.channels if targets is None else targets):
+            self.send(ws, msg, droppable)
+
+    def stats(self):
+        return [channel.stats() for channel in self.channels.values()]
@@ -0,0 +1,116 @@
+import struct
+import time
+
+# FPGA gateway wire protocol.
+#
+# Framed events:  0xA5 | length u8 | seq u16 | device time u32 (us) | token (length bytes)
+# Legacy events:  bare tokens ("J", "L", "B1", ...) with optional whitespace between them
+#
+# A stream may mix both. TCP can split or coalesce writes, so the parser keeps
+# whatever is left over after the last complete event and resumes on the next chunk.
+#
+# Clock sync (framed gateways only):
+#   server -> gateway  0x5A | ping id u16
+#   gateway -> server  framed event with token "T", seq = ping id and device
+#                      time = when the ping was received
+
+MAGIC = 0xA5
+PING_MAGIC = 0x5A
+TIME_TOKEN = "T"
+TOKENS = ("B1", "B2", "J", "L", "R", "N")
+MAX_TOKEN_LENGTH = 16
+
+_HEADER = struct.Struct(">BBHI")
+_PING = struct.Struct(">BH")
+_TOKEN_BYTES = {token.encode(): token for token in TOKENS}
+_WHITESPACE = b" \t\r\n\x00"
+
+
+def encode_event(token, seq, device_time):
+    """ Frame a single event the way a gateway should send it """
+    payload = token.encode()
+    return _HEADER.pack(MAGIC, len(payload), seq & 0xFFFF, int(device_time) & 0xFFFFFFFF) + payload
+
+
+def encode_ping(ping_id):
+    return _PING.pack(PING_MAGIC, ping_id & 0xFFFF)
+
+
+def make_event(token, seq=None, device_time=None, received_at=None):
+    return {
+        "data": token,
+        "seq": seq,
+        "deviceTime": device_time,
+        "receivedAt": received_at if received_at is not None else time.time(),
+    }
+
+
+class FrameParser:
+    """ Incremental parser that extracts every complete event from a TCP stream """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.expected_seq = None
+        self.events = 0
+        self.lost = 0  # events missing according to sequence numbers
+        self.garbage = 0  # bytes skipped because they were not part of any event
+
+    def _track_seq(self, seq):
+        if self.expected_seq is not None and seq != self.expected_seq:
+            self.lost += (seq - self.expected_seq) & 0xFFFF
+        self.expected_seq = (seq + 1) & 0xFFFF
+
+    def feed(self, data):
+        """ Add received bytes and return the list of complete events, in order """
+        self.buffer += data
+        received_at = time.time()
+        events = []
+        buf = self.buffer
+        pos = 0
+
+        while pos < len(buf):
+            byte = buf[pos]
+
+            if byte == MAGIC:
+                if len(buf) - pos < _HEADER.size:
+                    break
+                _, length, seq, device_time = _HEADER.unpack_from(buf, pos)
+                if length == 0 or length > MAX_TOKEN_LENGTH:
+                    self.garbage += 1
+                    pos += 1
+                    continue
+                end = pos + _HEADER.size + length
+                if end > len(buf):
+                    break
+                token = bytes(buf[pos + _HEADER.size:end]).decode(errors="replace")
+                if token != TIME_TOKEN:
+                    # Clock replies carry the ping id in seq, not an event number
+                    self._track_seq(seq)
+                events.append(make_event(token, seq, device_time, received_at))
+                pos = end
+                continue
+
+            if byte in _WHITESPACE:
+                pos += 1
+                continue
+
+            pair = bytes(buf[pos:pos + 2])
+            if pair in _TOKEN_BYTES:
+                events.append(make_event(_TOKEN_BYTES[pair], received_at=received_at))
+                pos += 2
+            elif pair[:1] in _TOKEN_BYTES:
+                events.append(make_event(_TOKEN_BYTES[pair[:1]], received_at=received_at))
+                pos += 1
+            elif byte == ord("B") and pos + 1 == len(buf):
+                # "B1"/"B2" split across two reads
+                break
+            else:
+                self.garbage += 1
+                pos += 1
+
+        del buf[:pos]
+        self.events += len(events)
+        return events
+
+    def stats(self):
+        return {"events": self.events, "lost": self.lost, "garbage": self.garbage, "buffered": len(self.buffer)}
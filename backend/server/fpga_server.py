@@ -1,123 +1,228 @@
 import asyncio
 import socket
-import json
 import time
-from config import TCP_PORT
+from config import (
+    TCP_PORT, FPGA_READ_BUFFER, FPGA_SOCKET_RCVBUF, FPGA_IDLE_TIMEOUT, FPGA_EVENT_QUEUE_SIZE,
+    FPGA_KEEPALIVE, FPGA_KEEPALIVE_IDLE, FPGA_KEEPALIVE_INTERVAL, FPGA_KEEPALIVE_COUNT,
+    FPGA_CLOCK_SYNC, CLOCK_SYNC_INTERVAL, CLOCK_SYNC_BURST, CLOCK_SYNC_BURST_INTERVAL
+)
+from clock_sync import DeviceClockSync
+from fpga_protocol import FrameParser, TIME_TOKEN, encode_ping
+from metrics import FPGA_CLIENTS
+from tracing import tracer
 from websocket_server import broadcast
 
-# Global state for FPGA connections
-fpga_connections = {}  # Mapping: player_id -> connection (and address)
-clients = set()  # WebSocket clients
 
-# Set up the TCP socket for FPGA connection (non-blocking)
-tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-tcp_socket.bind(('0.0.0.0', TCP_PORT))
-tcp_socket.listen(5)
-tcp_socket.setblocking(False)
+def configure_socket(sock):
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, FPGA_SOCKET_RCVBUF)
+    if FPGA_KEEPALIVE:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        # Linux only: start probing after FPGA_KEEPALIVE_IDLE seconds of silence
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, FPGA_KEEPALIVE_IDLE)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, FPGA_KEEPALIVE_INTERVAL)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, FPGA_KEEPALIVE_COUNT)
+
+
+def free_player_slot(game_manager):
+    for player_id in range(1, game_manager.config["numPlayers"] + 1):
+        if player_id not in game_manager.fpga_connections:
+            return player_id
+    return None
+
+
+async def reject(writer, reason):
+    print(f"❌ {reason}. Rejecting connection from {writer.get_extra_info('peername')}")
+    writer.close()
+    await writer.wait_closed()
+
+
+# Handle an incoming FPGA (TCP) connection
+async def handle_tcp_connection(reader, writer, rooms):
+    addr = writer.get_extra_info("peername")
+    print(f"FPGA connection from: {addr}")
+
+    # Gateways fill the configured rooms in the order they were opened
+    game_manager = rooms.room_for_fpga()
+    if game_manager is None:
+        if not any(room.config for room in rooms):
+            await reject(writer, "Game configuration is missing")
+        else:
+            await reject(writer, "Maximum number of FPGA connections reached")
+        return
+    player_id = free_player_slot(game_manager)
+
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        configure_socket(sock)
+
+    # Assign player ID and handle communication if game config is set
+    queue = asyncio.Queue(FPGA_EVENT_QUEUE_SIZE)
+    parser = FrameParser()
+    clock = DeviceClockSync()
+    game_manager.fpga_connections[player_id] = {
+        "writer": writer,
+        "addr": str(addr),
+        "queue": queue,
+        "parser": parser,
+        "clock": clock
+    }
+    player_name = game_manager.config["names"][player_id - 1] if player_id - 1 < len(game_manager.config["names"]) else f"Player {player_id}"
+    print(f"Assigned FPGA at {addr} to Player {player_id} ({player_name}) in room {game_manager.room_id}")
+
+    # Notify WebSocket clients about this FPGA connection
+    notification = {
+        "type": "player_connected",
+        "player": player_id,
+        "name": player_name,
+        "address": str(addr)
+    }
+    await broadcast(notification, game_manager)
 
-# Handle incoming FPGA (TCP) connections
-async def handle_tcp_connection(game_manager):
-    loop = asyncio.get_running_loop()
-    while True:
-        try:
-            # Accept FPGA connection asynchronously
-            connection_socket, addr = await loop.sock_accept(tcp_socket)
-            print(f"FPGA connection from: {addr}")
-            connection_socket.setblocking(False)
-
-            # Check if game_config is initialized
-            if not game_manager.config:
-                print(f"❌ Game configuration is missing. Rejecting connection from {addr}")
-                connection_socket.close()
-                continue  # Skip to the next iteration (waiting for the next connection)
-
-            # Check if maximum number of players is reached
-            if len(fpga_connections) >= game_manager.config["numPlayers"]:
-                print(f"❌ Maximum number of FPGA connections reached. Rejecting connection from {addr}")
-                connection_socket.close()
-                continue  # Skip to the next iteration (waiting for the next connection)
-
-            # Assign player ID and handle communication if game config is set
-            player_id = len(fpga_connections) + 1
-            fpga_connections[player_id] = {
-                "conn": connection_socket,
-                "addr": str(addr)
-            }
-            player_name = game_manager.config["names"][player_id - 1] if player_id - 1 < len(game_manager.config["names"]) else f"Player {player_id}"
-            print(f"Assigned FPGA at {addr} to Player {player_id} ({player_name})")
-
-            # Notify WebSocket clients about this FPGA connection
-            notification = {
-                "type": "player_connected",
-                "player": player_id,
-                "name": player_name,
-                "address": str(addr)
-            }
-            await broadcast(notification)
+    game_manager.attach_fpga(player_id, clock)
+    FPGA_CLIENTS.inc()
+    consumer = asyncio.create_task(consume_fpga_events(game_manager, player_id, queue))
+    pinger = asyncio.create_task(ping_fpga_clock(writer, clock, parser)) if FPGA_CLOCK_SYNC else None
+    try:
+        # Send initial command to FPGA
+        writer.write(b"S")
+        await writer.drain()
+        await handle_fpga_client(reader, player_id, parser, queue)
+    finally:
+        consumer.cancel()
+        if pinger:
+            pinger.cancel()
+        game_manager.fpga_connections.pop(player_id, None)
+        game_manager.detach_fpga(player_id)
+        FPGA_CLIENTS.dec()
+        writer.close()
+        print(f"FPGA stream stats for player {player_id}: {parser.stats()}")
+        disconnect_msg = {"type": "player_disconnected", "player": player_id}
+        await broadcast(disconnect_msg, game_manager)
+        rooms.close_if_idle(game_manager)
 
-            # Send initial command to FPGA
-            await loop.sock_sendall(connection_socket, b"S")
 
-            # Start handling FPGA client messages asynchronously
-            asyncio.create_task(handle_fpga_client(connection_socket, player_id))
+def event_payload(player_id, event):
+    message = event["data"]
+    return {
+        "type": "data",
+        "player": player_id,
+        "data": message,
+        "seq": event["seq"],
+        "deviceTime": event["deviceTime"],
+        "button1": message == 'B1',
+        "button2": message == 'B2',
+        "jump": message == 'J',
+        "left": message == 'L',
+        "right": message == 'R',
+        "still": message == 'N'
+    }
+
 
+# Clock pings, only for gateways that have shown they speak the framed protocol;
+# legacy gateways never see the ping bytes
+async def ping_fpga_clock(writer, clock, parser):
+    sent = 0
+    while True:
+        await asyncio.sleep(CLOCK_SYNC_BURST_INTERVAL if sent < CLOCK_SYNC_BURST else CLOCK_SYNC_INTERVAL)
+        if parser.expected_seq is None:
+            continue
+        writer.write(encode_ping(clock.ping(time.time())))
+        await writer.drain()
+        sent += 1
+
+
+# Clock replies update the gateway's clock estimate; once it is synced every
+# event also gets the time it was pressed on the server clock
+def apply_fpga_clock(clock, events):
+    game_events = []
+    for event in events:
+        device_time = event["deviceTime"]
+        if event["data"] == TIME_TOKEN:
+            if device_time is not None:
+                device_seconds = clock.device_seconds(device_time)
+                clock.pong(event["seq"], device_seconds, device_seconds, event["receivedAt"])
+            continue
+        if clock.synced and device_time is not None:
+            event["pressedAt"] = min(clock.to_server(clock.device_seconds(device_time)), event["receivedAt"])
+            tracer.pressed(event.get("traceId"), event["pressedAt"])
+        game_events.append(event)
+    return game_events
+
+
+# Hand a batch of parsed FPGA events straight to the simulation, and to the
+# browsers so they can animate the avatar
+async def dispatch_fpga_events(game_manager, player_id, events):
+    clock = game_manager.fpga_clocks.get(player_id)
+    if clock:
+        events = apply_fpga_clock(clock, events)
+    if not events:
+        return
+    now = time.time()
+    for event in events:
+        tracer.mark(event.get("traceId"), "queue", now)
+    game_manager.push_fpga_events(player_id, events)
+    for event in events:
+        await broadcast(event_payload(player_id, event), game_manager)
+
+
+# Deliver queued event batches for one player
+async def consume_fpga_events(game_manager, player_id, queue):
+    while True:
+        events = await queue.get()
+        try:
+            await dispatch_fpga_events(game_manager, player_id, events)
         except Exception as e:
-            print(f"Error accepting FPGA connection: {e}")
+            print(f"Error dispatching FPGA events for player {player_id}: {e}")
 
 
 # Handle FPGA communication (data exchange)
-async def handle_fpga_client(conn, player_id):
-    loop = asyncio.get_running_loop()
+async def handle_fpga_client(reader, player_id, parser, queue):
     try:
         while True:
-            data = await loop.sock_recv(conn, 1024)
+            data = await asyncio.wait_for(reader.read(FPGA_READ_BUFFER), FPGA_IDLE_TIMEOUT)
             if not data:
                 print(f"FPGA connection for player {player_id} closed.")
                 break
-            message = data.decode().strip()
-            # print(f"Received data from player {player_id}: {message}")
-
-            # Process received message from FPGA
-            payload = {
-                "type": "data",
-                "player": player_id,
-                "data": message,
-                "button1": message == 'B1',
-                "button2": message == 'B2',
-                "jump": message == 'J',
-                "left": message == 'L',
-                "right": message == 'R',
-                "still": message == 'N'
-            }
-
-            # Broadcast this data to all WebSocket clients
-            await broadcast(payload)
 
+            events = parser.feed(data)
+            for event in events:
+                if event["data"] != TIME_TOKEN:
+                    tracer.start(event)
+            if events:
+                # Blocks while the queue is full, which stops reading and lets
+                # TCP flow control push back on the gateway
+                await queue.put(events)
+
+    except asyncio.TimeoutError:
+        print(f"FPGA connection for player {player_id} idle for {FPGA_IDLE_TIMEOUT}s, closing.")
     except Exception as e:
         print(f"Error handling FPGA for player {player_id}: {e}")
-    finally:
-        conn.close()
-        disconnect_msg = {"type": "player_disconnected", "player": player_id}
-        await broadcast(disconnect_msg)
-
-# Function to handle the game initialization message from WebSocket
-def handle_init_message(data, game_manager, ws):
-    print(f"Received init message: {data}")  # Debugging: Check what data is received
-    game_manager.update_config(data.get("numPlayers", 1), data.get("names", []))
-    response = {"type": "config_ack"}
-    return response
-
-# Function to handle the game start message
-def handle_game_start(data, game_manager):
-    game_manager.start_time = time.time()
+
+
+def fpga_stats(rooms):
     return {
-        "type": "startGame",
-        "game_selected": data["gameSelected"],
-        "start_at": game_manager.start_time
+        room.room_id: {
+            player_id: {
+                "address": conn["addr"],
+                "queueDepth": conn["queue"].qsize(),
+                "clock": conn["clock"].snapshot(),
+                **conn["parser"].stats()
+            }
+            for player_id, conn in room.fpga_connections.items()
+        }
+        for room in rooms
     }
 
-# Main entry point for the TCP server
-async def start_tcp_server(game_manager):
-    await handle_tcp_connection(game_manager)
+
+# Main entry point for the TCP server; the listener only exists while this runs
+async def start_tcp_server(rooms, host="0.0.0.0", port=TCP_PORT):
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_tcp_connection(reader, writer, rooms),
+        host, port, reuse_address=True, limit=FPGA_READ_BUFFER
+    )
+    print(f"[TCP] Listening on port {port}")
+    async with server:
+        await server.serve_forever()
 
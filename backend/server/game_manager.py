@@ -1,20 +1,68 @@
-import time
 import asyncio
-from config import TICK_RATE
+import time
+from config import (
+    SIM_BACKEND, DEFAULT_ROOM, RECORD_MATCHES, TICK_RATE, MODE_TICK_RATES, MAX_CATCH_UP_TICKS, BROADCAST_RATE
+)
+from scheduler import TickScheduler
+from score_store import ScoreWriter
+from match_history import MatchRecord
+from db import save_match
+from environment import Environment
 from game_modes.coin_game import update_coin_game
-from game_modes.arrow_game import update_arrow_game
+from game_modes.arrow_game import update_arrow_game, DERIVED_FIELDS as ARROW_DERIVED_FIELDS
 from game_modes.spikeball_game import update_spikeball_game
-from websocket_server import broadcast
+from game_modes.vectorized import make_engines
+from input_buffer import InputRing
+from lag_compensation import LagCompensator, COMPENSATED_MODES
+from tracing import tracer
+from motion import PlayerMotion, ARROW_ACTIONS
+from recorder import MatchRecorder
+from state_sync import StateSync
+from wire import StateCodec
+from websocket_server import broadcast_state
 
 class GameManager:
-    def __init__(self):
+    """
+    One room: a match, its FPGA player slots and the WebSockets watching it.
+    A RoomManager shares its scheduler and score writer between rooms; a
+    GameManager created on its own gets its own and runs with game_loop().
+    All randomness and time in the simulation come from env. A room only
+    needs ticks while a match runs and someone is connected to it; the
+    scheduler sleeps otherwise and is woken when that changes.
+    """
+
+    def __init__(self, room_id=DEFAULT_ROOM, scheduler=None, score_writer=None, env=None):
+        self.room_id = room_id
+        self.env = env or Environment()
         self.mode = None
         self.start_time = None
         self.config = None
         self.objects = []
         self.player_positions = {}
+        self.previous_positions = {}  # pid -> (x, y) at the last tick, for swept collisions
         self.player_scores = {}
+        self.score_writer = score_writer or ScoreWriter()
+        self.match = None  # MatchRecord of the match being played
+        self.recorder = None  # MatchRecorder of that match, with RECORD_MATCHES
         self.player_input_queue = []
+        self.mode_state = {}  # per-mode bookkeeping that lives for one match
+        self.scheduler = scheduler or TickScheduler()
+        self.subscribers = set()  # WebSockets in this room
+        self.fpga_connections = {}  # player_id -> connection (and address)
+        self.state_sync = StateSync(derived_fields={"Disco Dash": ARROW_DERIVED_FIELDS})
+        self.codec = StateCodec()
+        self.fpga_inputs = InputRing()
+        self.fpga_players = set()
+        self.motion = {}
+        self.lag = LagCompensator()
+        self.clocks = {}  # pid -> ClockSync of the browser reporting for that player
+        self.fpga_clocks = {}  # pid -> DeviceClockSync of that player's gateway
+        self.last_tick = None
+        self.next_tick = None  # scheduler clock time this room is due, when sharing a scheduler
+        self.tick_traces = []  # trace ids of FPGA events consumed by the current tick
+        self.unpublished = None  # simulated time of state not broadcast yet
+        self.last_published = None
+        self.engines = make_engines() if SIM_BACKEND == "numpy" else {}
 
     def update_config(self, num_players, names):
         """ Update the game configuration """
@@ -24,28 +72,221 @@ class GameManager:
         }
         print(f"Updated game configuration: {self.config}")
 
-    def sync_score(self, pid, points=1):
+    def sync_score(self, pid, points=1, kind="score"):
         self.player_scores[pid] = self.player_scores.get(pid, 0) + points
-        # Update persistent DB here (optional)
+        if self.match:
+            self.match.record(pid, points, kind, self.env.clock())
+        names = self.config["names"] if self.config else []
+        if 0 < pid <= len(names):
+            # Persisted by the score writer in batches, off the event loop
+            self.score_writer.add(names[pid - 1], points)
+
+    @property
+    def tick_period(self):
+        return MODE_TICK_RATES.get(self.mode, TICK_RATE)
+
+    @property
+    def tick_steps(self):
+        """ TICK_RATE ticks per tick of this mode; coins and spikes move once per tick """
+        return self.tick_period / TICK_RATE
+
+    def start_match(self, mode, seed=None, record=RECORD_MATCHES):
+        self.mode = mode
+        self.env.reseed(seed)
+        self.start_time = self.env.clock()
+        self.objects.clear()
+        self.lag.snapshots.clear()
+        self.previous_positions = {}
+        # Presses queued before the match (possibly while the scheduler slept) do not carry into it
+        self.fpga_inputs.drain()
+        self.match = MatchRecord(mode, self.start_time, self.config)
+        if record:
+            self.recorder = MatchRecorder.for_match(self, "numpy" if self.engines else "dict")
+        self.scheduler.wake()
+
+    def finish_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.finish(self.env.clock(), self.match.scores if self.match else {})
+
+    def end_match(self):
+        """ Persist the finished match and pending score deltas without blocking the tick """
+        self.finish_recording()
+        self.score_writer.flush_soon()
+        match, self.match = self.match, None
+        if match:
+            self.score_writer.save_match_soon(match.finish(self.env.clock()))
+
+    def attach_fpga(self, player_id, clock=None):
+        if self.recorder:
+            self.recorder.write("attach", self.env.clock(), player=player_id)
+        self.fpga_players.add(player_id)
+        self.motion[player_id] = PlayerMotion()
+        if clock:
+            self.fpga_clocks[player_id] = clock
+        self.scheduler.wake()
+
+    def detach_fpga(self, player_id):
+        if self.recorder:
+            self.recorder.write("detach", self.env.clock(), player=player_id)
+        self.fpga_players.discard(player_id)
+        self.fpga_clocks.pop(player_id, None)
+        self.motion.pop(player_id, None)
+        self.fpga_inputs.discard(player_id)
+
+    def push_fpga_events(self, player_id, events):
+        """ Called from the FPGA connection; consumed by the next tick """
+        if self.recorder:
+            self.recorder.write("fpga", self.env.clock(), player=player_id, events=events)
+        self.fpga_inputs.push(player_id, events)
+
+    def consume_fpga_events(self, now):
+        dt = now - self.last_tick if self.last_tick else 0.0
+        self.last_tick = now
+
+        for player_id, event in self.fpga_inputs.drain():
+            trace_id = event.get("traceId")
+            if trace_id:
+                # Wall clock like the other stages; now is the simulated tick time
+                tracer.mark(trace_id, "input")
+                self.tick_traces.append(trace_id)
+
+            motion = self.motion.get(player_id)
+            if motion:
+                motion.apply(event["data"])
+
+            action = ARROW_ACTIONS.get(event["data"])
+            if self.mode == "Disco Dash" and action:
+                self.player_input_queue.append({
+                    "player": player_id,
+                    "action": action,
+                    # When the gateway clock is synced, the press time on the server clock
+                    "timestamp": event.get("pressedAt", event["receivedAt"])
+                })
+
+        for player_id, motion in self.motion.items():
+            pos = self.player_positions.get(player_id)
+            if pos:
+                motion.step(pos, self.mode, dt)
+
+    def clock_stats(self):
+        return {
+            "browsers": {pid: clock.snapshot() for pid, clock in self.clocks.items()},
+            "fpga": {pid: clock.snapshot() for pid, clock in self.fpga_clocks.items()},
+        }
+
+    def tick_stats(self):
+        return self.scheduler.snapshot()
+
+    async def simulate(self, now):
+        """ Advance the room to now without publishing anything; False if no match is running """
+        if self.recorder:
+            self.recorder.write("tick", now)
+        self.consume_fpga_events(now)
+        if not self.mode or not self.start_time:
+            self.tick_traces.clear()
+            return False
+
+        engine = self.engines.get(self.mode)
+        if engine:
+            self.objects[:] = engine.update(self, now)
+        elif self.mode == "Coin Cascade":
+            self.objects[:] = update_coin_game(self, now)
+        elif self.mode == "Disco Dash":
+            self.objects[:] = await update_arrow_game(self, now)
+        elif self.mode == "Bullet Barrage":
+            self.objects[:] = update_spikeball_game(self, now)
+
+        if self.mode in COMPENSATED_MODES:
+            self.lag.record_objects(now, self.objects)
+        self.previous_positions = {pid: (pos["x"], pos["y"]) for pid, pos in self.player_positions.items()}
+        return True
+
+    def needs_ticks(self):
+        return bool(self.mode and self.start_time) and not self.is_idle()
+
+    def due(self, now, slack=0.0):
+        """ Whether this room's next tick is due at scheduler time now; if so, schedule the one after """
+        if self.next_tick is not None and now < self.next_tick - slack:
+            return False
+        period = self.tick_period
+        # Missed ticks are caught up like the scheduler's own, further behind it realigns
+        if self.next_tick is None or now - self.next_tick > period * MAX_CATCH_UP_TICKS:
+            self.next_tick = now + period
+        else:
+            self.next_tick += period
+        return True
+
+    def pause(self):
+        """ Called instead of ticking while needs_ticks() is False """
+        # Motion resumes from the first tick after the pause instead of integrating over it
+        if self.recorder and self.last_tick is not None:
+            self.recorder.write("pause", self.env.clock())
+        self.last_tick = None
+        self.next_tick = None
+        self.last_published = None
+        self.previous_positions = {}
+
+    async def tick(self, behind=0.0, publish=True):
+        """
+        One tick, simulated at the time of its deadline (behind seconds ago)
+        and broadcast if publish. Returns the period until the next one, or
+        None when the room can sleep.
+        """
+        if not self.needs_ticks():
+            self.pause()
+            return None
+        now = self.env.clock() - behind
+        if await self.simulate(now):
+            self.unpublished = now
+        if publish:
+            await self.publish()
+        return self.tick_period
+
+    async def publish(self):
+        """ Broadcast the state of the last simulated tick, unless that was done already """
+        now = self.unpublished
+        if now is None:
+            return
+        # A mode ticking faster than BROADCAST_RATE skips frames; the next one carries the latest state
+        if self.last_published is not None and now - self.last_published < BROADCAST_RATE - self.tick_period / 2:
+            return
+        self.unpublished = None
+        self.last_published = now
+        traces, self.tick_traces = self.tick_traces, []
+        await broadcast_state(self, {
+            "mode": self.mode,
+            "objects": self.objects,
+            "scores": self.player_scores,
+            "timestamp": now,
+            "traces": traces
+        })
+        if traces:
+            published = time.time()
+            for trace_id in traces:
+                tracer.mark(trace_id, "tick", published, "server")
+
+    def is_idle(self):
+        return not self.subscribers and not self.fpga_connections
+
+    def shutdown(self):
+        """ Blocking save of the running match, for when the event loop is going away """
+        self.finish_recording()
+        if self.match:
+            try:
+                save_match(self.match.finish(self.env.clock()))
+            except Exception as e:
+                print(f"❌ Failed to save the running {self.mode} match: {e}")
+            self.match = None
 
     async def game_loop(self):
-        while True:
-            await asyncio.sleep(TICK_RATE)
-            if not self.mode or not self.start_time:
-                continue
-
-            now = time.time()
-            if self.mode == "Coin Cascade":
-                self.objects[:] = update_coin_game(self, now)
-            elif self.mode == "Disco Dash":
-                self.objects[:] = await update_arrow_game(self, now)
-            elif self.mode == "Bullet Barrage":
-                self.objects[:] = update_spikeball_game(self, now)
-
-            await broadcast({
-                "type": "gameStateUpdate",
-                "mode": self.mode,
-                "objects": self.objects,
-                "scores": self.player_scores,
-                "timestamp": now
-            })
+        writer = asyncio.create_task(self.score_writer.run())
+        try:
+            await self.scheduler.run(self.tick)
+        finally:
+            # Before the writer stops, so a save that fails now is still retried by its final flush
+            await self.score_writer.wait_for_saves()
+            writer.cancel()
+            # Its final flush runs as it stops
+            await asyncio.gather(writer, return_exceptions=True)
+            self.shutdown()
@@ -1,3 +1,4 @@
+from bisect import bisect_left, bisect_right
 from websocket_server import broadcast
 
 BEATMAP = [
@@ -22,105 +23,194 @@ BEATMAP = [
 WINDOW = 150
 SPAWN_OFFSET = 1280
 MOVE_SPEED = 150
-
-
-def spawn_arrows(game_manager, now, elapsed_time, beatmap_duration, loop_count):
-    arrow_map = {arrow["id"]: arrow for arrow in game_manager.objects if arrow["type"].startswith("Arrow") or arrow["type"] == "Button"}
-    
-    for loop in [loop_count, loop_count + 1]:
-        loop_base_time = loop * beatmap_duration
-        for beat in BEATMAP:
-            beat_time_global = loop_base_time + beat["time"]
-            if abs(beat_time_global - elapsed_time) < WINDOW:
-                unique_id = f"arrow-{loop}-{beat['time']}"
-                if unique_id not in arrow_map:
-                    arrow_map[unique_id] = {
-                        "id": unique_id,
-                        "type": beat["type"],
-                        "x": SPAWN_OFFSET,
-                        "y": 0,
-                        "spawnedAt": now,
-                        "time": beat_time_global,
-                        "hitBy": [],
-                        "missedBy": []
-                    }
-    return arrow_map
-
-
-def get_best_arrow_for_player(player, action, timestamp, arrow_map):
+HIT_X = 80
+HIT_RANGE = 50
+PERFECT_RANGE = 20
+DESPAWN_X = -50
+PERFECT_POINTS = 2
+GOOD_POINTS = 1
+MISS_POINTS = -1
+
+# Seconds from spawn until an arrow reaches the hit line
+TRAVEL_TIME = (SPAWN_OFFSET - HIT_X) / MOVE_SPEED
+
+# Fields delta clients recompute from each frame's timestamp instead of receiving:
+# x = SPAWN_OFFSET - MOVE_SPEED * (timestamp - spawnedAt)
+DERIVED_FIELDS = frozenset({"x"})
+
+
+class BeatScheduler:
+    """
+    Walks the (looping) beatmap with a cursor instead of scanning it every
+    tick: beat i is BEATMAP[i % n] in loop i // n. Each call only looks at
+    the beats that entered the spawn window since the previous one.
+    """
+
+    def __init__(self, beatmap=BEATMAP):
+        self.beats = sorted(beatmap, key=lambda beat: beat["time"])
+        self.duration = self.beats[-1]["time"]
+        self.cursor = 0
+
+    def beat_at(self, index):
+        loop, i = divmod(index, len(self.beats))
+        beat = self.beats[i]
+        return loop, beat, loop * self.duration + beat["time"]
+
+    def due(self, elapsed_time):
+        """ Beats whose global time is within WINDOW ms of elapsed_time, in order """
+        due = []
+        while True:
+            loop, beat, beat_time_global = self.beat_at(self.cursor)
+            if beat_time_global - elapsed_time >= WINDOW:
+                break
+            # A beat that was already more than WINDOW ms late (e.g. after a stall) is never spawned
+            if elapsed_time - beat_time_global < WINDOW:
+                due.append((loop, beat, beat_time_global))
+            self.cursor += 1
+        return due
+
+
+class ArrowLanes:
+    """ Live arrows per action type, ordered by spawn (and therefore hit) time """
+
+    def __init__(self):
+        self.arrows = {}
+        self.spawned_at = {}
+
+    def add(self, arrow):
+        self.arrows.setdefault(arrow["type"], []).append(arrow)
+        self.spawned_at.setdefault(arrow["type"], []).append(arrow["spawnedAt"])
+
+    def remove(self, arrow):
+        lane = self.arrows.get(arrow["type"], [])
+        for i, candidate in enumerate(lane):
+            if candidate is arrow:
+                del lane[i]
+                del self.spawned_at[arrow["type"]][i]
+                return
+
+    def near(self, action, timestamp, tolerance):
+        """ Arrows of this type whose hit time is within tolerance seconds of timestamp """
+        lane = self.arrows.get(action, [])
+        spawned_at = self.spawned_at.get(action, [])
+        lo = bisect_left(spawned_at, timestamp - TRAVEL_TIME - tolerance)
+        hi = bisect_right(spawned_at, timestamp - TRAVEL_TIME + tolerance)
+        return lane[lo:hi]
+
+
+class ArrowGameState:
+    def __init__(self, game_manager):
+        self.start_time = game_manager.start_time
+        self.beats = BeatScheduler()
+        self.lanes = ArrowLanes()
+        for arrow in live_arrows(game_manager.objects):
+            self.lanes.add(arrow)
+
+
+def live_arrows(objects):
+    # Objects left over from the previous mode are dropped
+    return [obj for obj in objects if obj["type"].startswith("Arrow") or obj["type"] == "Button"]
+
+
+def arrow_game_state(game_manager):
+    state = game_manager.mode_state.get("Disco Dash")
+    if state is None or state.start_time != game_manager.start_time:
+        state = game_manager.mode_state["Disco Dash"] = ArrowGameState(game_manager)
+    return state
+
+
+def spawn_arrows(state, arrows, now, elapsed_time):
+    for loop, beat, beat_time_global in state.beats.due(elapsed_time):
+        arrow = {
+            "id": f"arrow-{loop}-{beat['time']}",
+            "type": beat["type"],
+            "x": SPAWN_OFFSET,
+            "y": 0,
+            "spawnedAt": now,
+            "time": beat_time_global,
+            "hitBy": [],
+            "missedBy": []
+        }
+        arrows.append(arrow)
+        state.lanes.add(arrow)
+    return arrows
+
+
+def get_best_arrow_for_player(player, action, timestamp, lanes):
     best_arrow = None
     best_dist = float("inf")
 
-    for arrow in arrow_map.values():
-        if arrow["type"] != action or player in arrow["hitBy"] or player in arrow["missedBy"]:
+    # Small margin so rounding never hides an arrow the exact distance test below accepts
+    for arrow in lanes.near(action, timestamp, HIT_RANGE / MOVE_SPEED + 1e-6):
+        if player in arrow["hitBy"] or player in arrow["missedBy"]:
             continue
 
         arrow_elapsed = timestamp - arrow["spawnedAt"]
         arrow_x = SPAWN_OFFSET - MOVE_SPEED * arrow_elapsed
-        dist = abs(arrow_x - 80)
+        dist = abs(arrow_x - HIT_X)
 
-        if dist < 50 and dist < best_dist:
+        if dist < HIT_RANGE and dist < best_dist:
             best_arrow = arrow
             best_dist = dist
 
     return best_arrow, best_dist
 
-async def process_player_input(player_input, game_manager, arrow_map):
+async def process_player_input(player_input, game_manager, lanes):
     player = player_input["player"]
     action = player_input["action"]
     timestamp = player_input["timestamp"]
 
-    best_arrow, best_dist = get_best_arrow_for_player(player, action, timestamp, arrow_map)
+    best_arrow, best_dist = get_best_arrow_for_player(player, action, timestamp, lanes)
 
     if best_arrow:
         if player not in best_arrow["hitBy"]:
             best_arrow["hitBy"].append(player)
 
-        feedback, points = ("Perfect", 2) if best_dist <= 20 else ("Good", 1)
+        feedback, points = ("Perfect", PERFECT_POINTS) if best_dist <= PERFECT_RANGE else ("Good", GOOD_POINTS)
     else:
-        feedback, points = "Miss", -1
+        feedback, points = "Miss", MISS_POINTS
 
-    game_manager.sync_score(player, points)
+    game_manager.sync_score(player, points, feedback.lower())
     await broadcast({
         "type": "score_feedback",
         "player": player,
         "result": feedback,
         "points": points
-    })
+    }, game_manager)
 
-async def update_arrows_positions(arrow_map, game_manager, now):
+async def update_arrows_positions(arrows, lanes, game_manager, now):
     final_arrows = []
-    for arrow in arrow_map.values():
+    for arrow in arrows:
         elapsed_time = now - arrow["spawnedAt"]
         arrow["x"] = SPAWN_OFFSET - MOVE_SPEED * elapsed_time
 
-        if arrow["x"] > -50:
+        if arrow["x"] > DESPAWN_X:
             final_arrows.append(arrow)
         else:
+            lanes.remove(arrow)
             for pid in range(1, game_manager.config["numPlayers"] + 1):
                 if pid not in arrow["hitBy"] and pid not in arrow["missedBy"]:
                     arrow["missedBy"].append(pid)
-                    game_manager.sync_score(pid, -1)
+                    game_manager.sync_score(pid, MISS_POINTS, "miss")
                     await broadcast({
                         "type": "score_feedback",
                         "player": pid,
                         "result": "Miss",
-                        "points": -1
-                    })
+                        "points": MISS_POINTS
+                    }, game_manager)
     return final_arrows
 
 async def update_arrow_game(game_manager, now):
     elapsed_time = (now - game_manager.start_time) * 1000  # Time in ms
-    beatmap_duration = BEATMAP[-1]["time"]
-    loop_count = int(elapsed_time // beatmap_duration)
+    state = arrow_game_state(game_manager)
 
-    arrow_map = spawn_arrows(game_manager, now, elapsed_time, beatmap_duration, loop_count)
+    arrows = spawn_arrows(state, live_arrows(game_manager.objects), now, elapsed_time)
 
     for player_input in game_manager.player_input_queue:
-        await process_player_input(player_input, game_manager, arrow_map)
+        await process_player_input(player_input, game_manager, state.lanes)
 
     game_manager.player_input_queue.clear()
 
-    final_arrows = await update_arrows_positions(arrow_map, game_manager, now)
+    final_arrows = await update_arrows_positions(arrows, state.lanes, game_manager, now)
 
     return final_arrows
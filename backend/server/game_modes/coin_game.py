@@ -1,21 +1,33 @@
-import random
-import uuid
 import time
-from utils import distance
+from tracing import tracer
+from spatial import UniformGrid
+from lag_compensation import first_in_order
+
+COLLECT_RADIUS = 0.3
+MIN_COINS = 3
+COIN_GRAVITY_MIN = 0.005  # each coin's gravity is drawn from [MIN, MIN + SPREAD)
+COIN_GRAVITY_SPREAD = 0.02
+COLLECT_POINTS = 1
 
 
 def update_coin_positions(game_manager, now):
     updated = []
-    
+    # Swept only when a tick spans several 60 Hz steps; at the normal rate it is where the coin ends up
+    swept = game_manager.tick_steps > 1
+    previous = game_manager.previous_positions if swept else None
+    grid = UniformGrid.from_positions(game_manager.player_positions, COLLECT_RADIUS, previous)
+    rewound = game_manager.lag.hits(COLLECT_RADIUS, now, game_manager.player_positions)
+
     for coin in game_manager.objects:
         if now - coin["spawnedAt"] > 5:
             continue
 
         elapsed = now - coin["spawnedAt"]
-        new_y = coin["y"] - 0.5 * coin.get("gravity") * elapsed
+        new_y = coin["y"] - 0.5 * coin.get("gravity") * elapsed * game_manager.tick_steps
         coin_pos = (coin["x"], new_y)
 
-        if not coin_collection(coin_pos, game_manager):
+        start = (coin["x"], coin["y"]) if swept else coin_pos
+        if not coin_collection(start, coin_pos, game_manager, grid, rewound.get(coin["id"])):
             if coin_pos[1] < -0.65:
                 continue
             updated.append({**coin, "y": new_y})
@@ -23,40 +35,45 @@ def update_coin_positions(game_manager, now):
     return updated
 
 
-def coin_collection(coin_pos, game_manager):
-    for pid, pos in game_manager.player_positions.items():
-        if distance(coin_pos, (pos["x"], pos["y"])) < 0.3:
-            game_manager.sync_score(pid)
+def coin_collection(start, coin_pos, game_manager, grid, rewound=None):
+    # Anyone the coin passed between start and coin_pos, which is just coin_pos unless swept
+    pid = grid.first_within_segment(start[0], start[1], coin_pos[0], coin_pos[1], COLLECT_RADIUS)
+    if rewound:
+        # Players who touched the coin where it was on their screen count too
+        pid = first_in_order(game_manager.player_positions, [pid, *rewound])
+    if pid is None:
+        return False
+
+    game_manager.sync_score(pid, COLLECT_POINTS, "collect")
 
-            if pos.get("sentAt"):
-                server_time = time.time() * 1000  # ms
-                latency = server_time - pos["sentAt"]
-                print(f"[Latency #2] Player {pid} | Coin collected | Latency: {latency:.2f} ms")
+    pos = game_manager.player_positions[pid]
+    if pos.get("sentAt"):
+        # Position report (sentAt is on the server clock once the browser is synced) -> collection
+        tracer.record("collect", time.time() * 1000 - pos["sentAt"])
 
-            return True
-    return False
+    return True
 
 
-def spawn_new_coins(updated, now):
-    while len(updated) < 3:
-        updated.append(create_new_coin(now))
+def spawn_new_coins(updated, now, env):
+    while len(updated) < MIN_COINS:
+        updated.append(create_new_coin(now, env))
 
     return updated
 
 
-def create_new_coin(now):
+def create_new_coin(now, env):
     return {
-        "id": str(uuid.uuid4()),
+        "id": env.uuid(),
         "type": "coin",
-        "x": random.uniform(-1.5, 1.5),
+        "x": env.random.uniform(-1.5, 1.5),
         "y": 1,
-        "gravity": 0.005 + random.random() * 0.02,
+        "gravity": COIN_GRAVITY_MIN + env.random.random() * COIN_GRAVITY_SPREAD,
         "spawnedAt": now
     }
 
 
 def update_coin_game(game_manager, now):
     updated = update_coin_positions(game_manager, now)
-    updated = spawn_new_coins(updated, now)
+    updated = spawn_new_coins(updated, now, game_manager.env)
 
     return updated
@@ -1,50 +1,64 @@
-import random
-import uuid
-from utils import distance
+from spatial import UniformGrid
 
+HIT_RADIUS = 0.2
+DODGE_X = -2.5
+MIN_SPIKES = 1
+SPIKE_SPEED_MIN = 0.005  # each spike's speed is drawn from [MIN, MIN + SPREAD)
+SPIKE_SPEED_SPREAD = 0.01
+HIT_POINTS = -1
+DODGE_POINTS = 1
 
-def update_spike_position(spike, now):
+
+def update_spike_position(spike, now, steps=1.0):
     elapsed = now - spike["spawnedAt"]
-    dx = spike["speed"] * elapsed
+    dx = spike["speed"] * elapsed * steps
     new_x = spike["x"] - dx
     return new_x
 
 
-def spikeball_collision(spike_pos, new_x, game_manager, pid, scored_hits, scored_dodges):
-    player_pos = game_manager.player_positions[pid]
-    player_pos_tuple = (player_pos["x"], player_pos["y"])
-
-    if pid not in scored_hits and distance(spike_pos, player_pos_tuple) < 0.2:
-        game_manager.sync_score(pid, -1)
-        scored_hits.add(pid)
-
-    elif new_x < -2.5 and pid not in scored_hits and pid not in scored_dodges:
-        game_manager.sync_score(pid, 1)
-        scored_dodges.add(pid)
+def spikeball_collision(path, new_x, game_manager, grid, scored_hits, scored_dodges, rewound=None):
+    # path: (x0, y0, x1, y1) the spike moved along this tick, so a long tick cannot jump over a player;
+    # a single point at the normal tick rate
+    hit = grid.within_segment(*path, HIT_RADIUS)
+    if rewound:
+        # Also hit where the spike was on the player's screen, in player order
+        hit = [pid for pid in game_manager.player_positions if pid in hit or pid in rewound]
+    for pid in hit:
+        if pid not in scored_hits:
+            game_manager.sync_score(pid, HIT_POINTS, "hit")
+            scored_hits.add(pid)
+
+    if new_x < DODGE_X:
+        for pid in game_manager.player_positions:
+            if pid not in scored_hits and pid not in scored_dodges:
+                game_manager.sync_score(pid, DODGE_POINTS, "dodge")
+                scored_dodges.add(pid)
 
     return scored_hits, scored_dodges
 
 
-def update_spikeball_for_player(game_manager, spike, new_x, spike_pos):
+def update_spikeball_for_player(game_manager, spike, new_x, path, grid, rewound=None):
     scored_hits = set(spike.get("scoredHits", []))
     scored_dodges = set(spike.get("scoredDodges", []))
 
-    for pid in game_manager.player_positions:
-        scored_hits, scored_dodges = spikeball_collision(
-            spike_pos, new_x, game_manager, pid, scored_hits, scored_dodges
-        )
-
-    return scored_hits, scored_dodges
+    return spikeball_collision(path, new_x, game_manager, grid, scored_hits, scored_dodges, rewound)
 
 
 def update_spikes(game_manager, now):
     updated = []
+    # Swept only when a tick spans several 60 Hz steps; at the normal rate it is where the spike ends up
+    swept = game_manager.tick_steps > 1
+    previous = game_manager.previous_positions if swept else None
+    grid = UniformGrid.from_positions(game_manager.player_positions, HIT_RADIUS, previous)
+    rewound = game_manager.lag.hits(HIT_RADIUS, now, game_manager.player_positions)
 
     for spike in game_manager.objects:
-        new_x = update_spike_position(spike, now)
-        spike_pos = (new_x, spike["y"])
+        new_x = update_spike_position(spike, now, game_manager.tick_steps)
+        path = (spike["x"] if swept else new_x, spike["y"], new_x, spike["y"])
 
-        scored_hits, scored_dodges = update_spikeball_for_player(game_manager, spike, new_x, spike_pos)
+        scored_hits, scored_dodges = update_spikeball_for_player(
+            game_manager, spike, new_x, path, grid, rewound.get(spike["id"])
+        )
 
         if new_x > -2.8:
             updated.append({
@@ -57,23 +71,28 @@ def update_spikes(game_manager, now):
     return updated
 
 
-def spawn_new_spike(now):
+def spawn_new_spike(now, env):
     return {
-        "id": str(uuid.uuid4()),
+        "id": env.uuid(),
         "type": "spike",
         "x": 2.5,
         "y": -0.25,
-        "speed": 0.005 + random.random() * 0.01,
+        "speed": SPIKE_SPEED_MIN + env.random.random() * SPIKE_SPEED_SPREAD,
         "spawnedAt": now,
         "scoredHits": [],
         "scoredDodges": []
     }
 
 
+def spawn_new_spikes(updated, now, env):
+    while len(updated) < MIN_SPIKES:
+        updated.append(spawn_new_spike(now, env))
+
+    return updated
+
+
 def update_spikeball_game(game_manager, now):
     updated = update_spikes(game_manager, now)
-
-    if len(updated) < 1:
-        updated.append(spawn_new_spike(now))
+    updated = spawn_new_spikes(updated, now, game_manager.env)
 
     return updated
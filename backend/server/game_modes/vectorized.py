@@ -0,0 +1,280 @@
+"""
+Struct-of-arrays versions of the coin and spikeball simulations.
+
+Object state lives in NumPy arrays and is updated, culled and collision-tested
+in batch; dicts are only built for the objects sent out each tick. Results
+match the dict implementations in coin_game.py and spikeball_game.py exactly
+(python -m benchmarks.sim_backends checks this). NumPy is optional: without
+it make_engines() returns nothing and the dict implementations are used.
+"""
+import operator
+import time
+from tracing import tracer
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from game_modes.coin_game import COLLECT_RADIUS, COLLECT_POINTS, spawn_new_coins
+from game_modes.spikeball_game import HIT_RADIUS, DODGE_X, HIT_POINTS, DODGE_POINTS, spawn_new_spikes
+
+COIN_LIFETIME = 5
+COIN_FLOOR = -0.65
+SPIKE_DESPAWN_X = -2.8
+
+
+def _swept(game_manager):
+    # Like the dict modes: sweep only when a tick spans several 60 Hz steps
+    return game_manager.tick_steps > 1
+
+
+def _player_arrays(game_manager):
+    """ Player ids, current x and y, and x and y at the previous tick (current if unknown or not swept) """
+    positions = game_manager.player_positions
+    previous = game_manager.previous_positions if _swept(game_manager) else {}
+    pids = list(positions)
+    px = np.fromiter((pos["x"] for pos in positions.values()), float, len(pids))
+    py = np.fromiter((pos["y"] for pos in positions.values()), float, len(pids))
+    qx = np.fromiter((previous.get(pid, (pos["x"], pos["y"]))[0] for pid, pos in positions.items()), float, len(pids))
+    qy = np.fromiter((previous.get(pid, (pos["x"], pos["y"]))[1] for pid, pos in positions.items()), float, len(pids))
+    return pids, (px, py, qx, qy)
+
+
+def _segment_d2(players, x0, y0, x1, y1):
+    """
+    How close each player (rows) and each object (columns) came this tick,
+    squared, both moving linearly: spatial.segment_distance_sq on arrays
+    """
+    px, py, qx, qy = players
+    ax, ay = x0[None, :] - qx[:, None], y0[None, :] - qy[:, None]
+    bx, by = x1[None, :] - px[:, None], y1[None, :] - py[:, None]
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    moved = length_sq > 0
+    t = np.where(moved, np.clip(-(ax * dx + ay * dy) / np.where(moved, length_sq, 1.0), 0.0, 1.0), 0.0)
+    return (ax + t * dx) ** 2 + (ay + t * dy) ** 2
+
+
+def _first_within(players, x0, y0, x1, y1, radius):
+    """ Index of the first player that came within radius of each object this tick, or -1 """
+    if len(players[0]) == 0 or len(x0) == 0:
+        return np.full(len(x0), -1)
+    inside = _segment_d2(players, x0, y0, x1, y1) < radius * radius
+    return np.where(inside.any(axis=0), inside.argmax(axis=0), -1)
+
+
+def _merge(players, added):
+    # Built exactly like the dict version so the resulting list order matches
+    merged = set(players)
+    for pid in added or ():
+        merged.add(pid)
+    return list(merged)
+
+
+class _Engine:
+    def __init__(self):
+        self.produced = []
+
+    def _in_sync(self, objects):
+        # The engine owns the state as long as nobody replaced the objects it produced
+        return len(objects) == len(self.produced) and all(map(operator.is_, objects, self.produced))
+
+
+class CoinEngine(_Engine):
+    def __init__(self):
+        super().__init__()
+        self.load([])
+
+    def load(self, coins):
+        self.ids = [coin["id"] for coin in coins]
+        self.x = np.array([coin["x"] for coin in coins], float)
+        self.y = np.array([coin["y"] for coin in coins], float)
+        self.gravity = np.array([coin["gravity"] for coin in coins], float)
+        self.spawned = np.array([coin["spawnedAt"] for coin in coins], float)
+
+    def update(self, game_manager, now):
+        if not self._in_sync(game_manager.objects):
+            self.load(game_manager.objects)
+
+        elapsed = now - self.spawned
+        alive = elapsed <= COIN_LIFETIME
+        new_y = self.y - 0.5 * self.gravity * elapsed * game_manager.tick_steps
+
+        pids, players = _player_arrays(game_manager)
+        collector = np.full(len(self.ids), -1)
+        x = self.x[alive]
+        start = self.y[alive] if _swept(game_manager) else new_y[alive]
+        collector[alive] = _first_within(players, x, start, x, new_y[alive], COLLECT_RADIUS)
+
+        rewound = game_manager.lag.hits(COLLECT_RADIUS, now, game_manager.player_positions)
+        if rewound:
+            column = {pid: i for i, pid in enumerate(pids)}
+            for i, obj_id in enumerate(self.ids):
+                if obj_id in rewound and alive[i]:
+                    found = [column[pid] for pid in rewound[obj_id] if pid in column]
+                    if collector[i] >= 0:
+                        found.append(collector[i])
+                    collector[i] = min(found, default=-1)
+
+        for i in np.flatnonzero(collector >= 0).tolist():
+            pid = pids[collector[i]]
+            game_manager.sync_score(pid, COLLECT_POINTS, "collect")
+            pos = game_manager.player_positions[pid]
+            if pos.get("sentAt"):
+                # Position report (sentAt is on the server clock once the browser is synced) -> collection
+                tracer.record("collect", time.time() * 1000 - pos["sentAt"])
+
+        keep = np.flatnonzero(alive & (collector < 0) & (new_y >= COIN_FLOOR))
+        self.ids = [self.ids[i] for i in keep.tolist()]
+        self.x, self.y = self.x[keep], new_y[keep]
+        self.gravity, self.spawned = self.gravity[keep], self.spawned[keep]
+
+        updated = [
+            {"id": obj_id, "type": "coin", "x": x, "y": y, "gravity": gravity, "spawnedAt": spawned}
+            for obj_id, x, y, gravity, spawned in zip(
+                self.ids, self.x.tolist(), self.y.tolist(), self.gravity.tolist(), self.spawned.tolist()
+            )
+        ]
+
+        fresh = spawn_new_coins(updated, now, game_manager.env)[len(keep):]
+        if fresh:
+            self.ids += [coin["id"] for coin in fresh]
+            self.x = np.append(self.x, [coin["x"] for coin in fresh])
+            self.y = np.append(self.y, [coin["y"] for coin in fresh])
+            self.gravity = np.append(self.gravity, [coin["gravity"] for coin in fresh])
+            self.spawned = np.append(self.spawned, [coin["spawnedAt"] for coin in fresh])
+
+        self.produced = updated
+        return updated
+
+
+class SpikeEngine(_Engine):
+    """ Hit/dodge flags are boolean matrices: one row per spike, one column per player seen """
+
+    def __init__(self):
+        super().__init__()
+        self.columns = {}
+        self.load([])
+
+    def _column(self, pid):
+        column = self.columns.get(pid)
+        if column is None:
+            column = self.columns[pid] = len(self.columns)
+        return column
+
+    def _flags(self, spikes, key):
+        flags = np.zeros((len(spikes), max(1, len(self.columns))), bool)
+        for row, spike in enumerate(spikes):
+            for pid in spike.get(key, []):
+                flags[row, self._column(pid)] = True
+        return flags
+
+    def load(self, spikes):
+        for spike in spikes:
+            for pid in spike.get("scoredHits", []) + spike.get("scoredDodges", []):
+                self._column(pid)
+        self.ids = [spike["id"] for spike in spikes]
+        self.x = np.array([spike["x"] for spike in spikes], float)
+        self.y = np.array([spike["y"] for spike in spikes], float)
+        self.speed = np.array([spike["speed"] for spike in spikes], float)
+        self.spawned = np.array([spike["spawnedAt"] for spike in spikes], float)
+        self.hits = self._flags(spikes, "scoredHits")
+        self.dodges = self._flags(spikes, "scoredDodges")
+        # The lists are kept as well so their order matches the dict version's list(set(...))
+        self.hit_lists = [spike.get("scoredHits", []) for spike in spikes]
+        self.dodge_lists = [spike.get("scoredDodges", []) for spike in spikes]
+
+    def _grow(self, columns):
+        extra = columns - self.hits.shape[1]
+        if extra > 0:
+            pad = ((0, 0), (0, extra))
+            self.hits = np.pad(self.hits, pad)
+            self.dodges = np.pad(self.dodges, pad)
+
+    def update(self, game_manager, now):
+        if not self._in_sync(game_manager.objects):
+            self.load(game_manager.objects)
+
+        new_x = self.x - self.speed * (now - self.spawned) * game_manager.tick_steps
+
+        pids, players = _player_arrays(game_manager)
+        columns = np.array([self._column(pid) for pid in pids], int)
+        self._grow(len(self.columns))
+
+        rewound = game_manager.lag.hits(HIT_RADIUS, now, game_manager.player_positions)
+        added_hits, added_dodges = {}, {}
+        if len(pids) and len(self.ids):
+            d2 = _segment_d2(players, self.x if _swept(game_manager) else new_x, self.y, new_x, self.y)
+            inside = (d2 < HIT_RADIUS * HIT_RADIUS).T  # spikes x players
+            if rewound:
+                column = {pid: i for i, pid in enumerate(pids)}
+                for row, obj_id in enumerate(self.ids):
+                    for pid in rewound.get(obj_id, ()):
+                        if pid in column:
+                            inside[row, column[pid]] = True
+            new_hits = inside & ~self.hits[:, columns]
+            dodging = (new_x < DODGE_X)[:, None] & ~(self.hits[:, columns] | new_hits) & ~self.dodges[:, columns]
+
+            # Same scoring order as the dict version: per spike, hits then dodges
+            for row in np.flatnonzero(new_hits.any(axis=1) | dodging.any(axis=1)).tolist():
+                added_hits[row] = [pids[i] for i in np.flatnonzero(new_hits[row]).tolist()]
+                added_dodges[row] = [pids[i] for i in np.flatnonzero(dodging[row]).tolist()]
+                for pid in added_hits[row]:
+                    game_manager.sync_score(pid, HIT_POINTS, "hit")
+                for pid in added_dodges[row]:
+                    game_manager.sync_score(pid, DODGE_POINTS, "dodge")
+
+            hits_view = self.hits[:, columns] | new_hits
+            dodges_view = self.dodges[:, columns] | dodging
+            self.hits[:, columns] = hits_view
+            self.dodges[:, columns] = dodges_view
+
+        keep = np.flatnonzero(new_x > SPIKE_DESPAWN_X)
+        rows = keep.tolist()
+        self.hit_lists = [_merge(self.hit_lists[i], added_hits.get(i)) for i in rows]
+        self.dodge_lists = [_merge(self.dodge_lists[i], added_dodges.get(i)) for i in rows]
+        self.ids = [self.ids[i] for i in rows]
+        self.x, self.y = new_x[keep], self.y[keep]
+        self.speed, self.spawned = self.speed[keep], self.spawned[keep]
+        self.hits, self.dodges = self.hits[keep], self.dodges[keep]
+
+        updated = [
+            {
+                "id": obj_id,
+                "type": "spike",
+                "x": x,
+                "y": y,
+                "speed": speed,
+                "spawnedAt": spawned,
+                "scoredHits": hits,
+                "scoredDodges": dodges
+            }
+            for obj_id, x, y, speed, spawned, hits, dodges in zip(
+                self.ids, self.x.tolist(), self.y.tolist(), self.speed.tolist(), self.spawned.tolist(),
+                self.hit_lists, self.dodge_lists
+            )
+        ]
+
+        fresh = spawn_new_spikes(updated, now, game_manager.env)[len(keep):]
+        if fresh:
+            self.ids += [spike["id"] for spike in fresh]
+            self.x = np.append(self.x, [spike["x"] for spike in fresh])
+            self.y = np.append(self.y, [spike["y"] for spike in fresh])
+            self.speed = np.append(self.speed, [spike["speed"] for spike in fresh])
+            self.spawned = np.append(self.spawned, [spike["spawnedAt"] for spike in fresh])
+            blank = np.zeros((len(fresh), self.hits.shape[1]), bool)
+            self.hits = np.vstack([self.hits, blank])
+            self.dodges = np.vstack([self.dodges, blank])
+            self.hit_lists += [spike["scoredHits"] for spike in fresh]
+            self.dodge_lists += [spike["scoredDodges"] for spike in fresh]
+
+        self.produced = updated
+        return updated
+
+
+def make_engines():
+    if np is None:
+        print("⚠️ NumPy is not installed, using the dict simulation backend")
+        return {}
+    return {"Coin Cascade": CoinEngine(), "Bullet Barrage": SpikeEngine()}
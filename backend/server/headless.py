@@ -0,0 +1,94 @@
+"""
+A room that runs without sockets, a database or real time.
+
+HeadlessMatch steps a GameManager tick by tick on a ManualClock: nothing is
+broadcast, scores stay in memory and a minute of play takes as long as the
+simulation needs, not a minute. Inputs go in as FPGA events, the same way a
+gateway would deliver them. simulate.py runs many of these with bots.
+
+    match = HeadlessMatch("Bullet Barrage", players=2, seed=7)
+    match.press(1, "J")
+    match.step(60)
+    match.close()
+    match.scores()  # {1: 2, 2: -1}
+"""
+import asyncio
+import contextlib
+import io
+from collections import Counter
+from environment import Environment, ManualClock
+from fpga_protocol import make_event
+from game_manager import GameManager
+from game_modes.vectorized import make_engines
+from motion import GROUND_Y
+from score_store import ScoreWriter
+
+# The clock starts here rather than at 0, which GameManager reads as "no match"
+EPOCH = 1_000_000.0
+
+
+class HeadlessMatch:
+    def __init__(self, mode, players=2, seed=None, tick_rate=None, backend="dict"):
+        self.mode = mode
+        self.clock = ManualClock(EPOCH)
+        self.ticks = 0
+        self.game = GameManager(
+            f"headless-{mode}",
+            score_writer=ScoreWriter(write=lambda batch: None),
+            env=Environment(clock=self.clock),
+        )
+        self.game.engines = make_engines() if backend == "numpy" else {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.game.update_config(players, [f"Bot {pid}" for pid in range(1, players + 1)])
+        ground = GROUND_Y.get(mode, 0.0)
+        for pid in range(1, players + 1):
+            # Every player is driven by FPGA events, spread evenly across the floor
+            self.game.attach_fpga(pid)
+            self.game.player_positions[pid] = {"x": -1.5 + 3 * pid / (players + 1), "y": ground}
+            self.game.player_scores[pid] = 0
+        self.game.start_match(mode, seed=seed, record=False)
+        # The mode's own rate unless told otherwise; coins and spikes are scaled to the mode's rate
+        self.tick_rate = tick_rate or self.game.tick_period
+        self.loop = asyncio.new_event_loop()
+
+    @property
+    def now(self):
+        return self.clock()
+
+    @property
+    def elapsed(self):
+        return self.clock() - self.game.start_time
+
+    def press(self, pid, token):
+        """ Queue an FPGA token (L, R, N, J, B1, B2) for player pid, applied by the next tick """
+        self.game.push_fpga_events(pid, [make_event(token, received_at=self.clock())])
+
+    def step(self, ticks=1, control=None):
+        """
+        Advance the match by ticks ticks of tick_rate seconds each. control,
+        if given, is called with this match before every tick to queue inputs.
+        """
+        self.loop.run_until_complete(self._step(ticks, control))
+
+    async def _step(self, ticks, control):
+        for _ in range(ticks):
+            if control:
+                control(self)
+            self.clock.advance(self.tick_rate)
+            await self.game.simulate(self.clock())
+            self.ticks += 1
+
+    def run(self, seconds, control=None):
+        self.step(round(seconds / self.tick_rate), control)
+
+    def scores(self):
+        """ This match's score per player, including players who never scored """
+        return {pid: score for pid, _, score in self.game.match.results()}
+
+    def events(self, pid=None):
+        """ How often each scoring event (collect, hit, dodge, perfect, ...) happened, to pid or anyone """
+        return Counter(kind for _, player, kind, _ in self.game.match.events if pid is None or player == pid)
+
+    def close(self):
+        self.game.match.finish(self.clock())
+        self.loop.close()
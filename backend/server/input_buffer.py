@@ -0,0 +1,38 @@
+from collections import deque
+from config import INPUT_RING_SIZE
+
+
+class InputRing:
+    """
+    Per-player ring buffers of FPGA events waiting for the next tick. A player
+    who floods events only loses their own oldest ones.
+    """
+
+    def __init__(self, size=INPUT_RING_SIZE):
+        self.size = size
+        self.rings = {}
+        self.dropped = 0
+
+    def push(self, player_id, events):
+        ring = self.rings.get(player_id)
+        if ring is None:
+            ring = self.rings[player_id] = deque(maxlen=self.size)
+        overflow = len(ring) + len(events) - self.size
+        if overflow > 0:
+            self.dropped += overflow
+        ring.extend(events)
+
+    def drain(self):
+        """ Take every pending event as (player_id, event) pairs, oldest first """
+        pending = []
+        for player_id, ring in self.rings.items():
+            while ring:
+                pending.append((player_id, ring.popleft()))
+        pending.sort(key=lambda item: item[1]["receivedAt"])
+        return pending
+
+    def depth(self):
+        return sum(len(ring) for ring in self.rings.values())
+
+    def discard(self, player_id):
+        self.rings.pop(player_id, None)
@@ -0,0 +1,126 @@
+import math
+from bisect import bisect_right
+from collections import deque
+from config import TICK_RATE, LAG_COMP_MAX_REWIND, POSITION_HISTORY, LATENCY_SMOOTHING
+from spatial import UniformGrid
+
+# Modes whose collisions are judged against client-reported positions
+COMPENSATED_MODES = ("Coin Cascade", "Bullet Barrage")
+
+
+class LagCompensator:
+    """
+    Judges client-reported player positions against the objects as that
+    client saw them.
+
+    Every player_position report goes into a short per-player ring buffer
+    along with how far back it has to be rewound: the report took one trip
+    to reach the server and the objects on the player's screen took the
+    other, so roughly twice the smoothed one-way latency, capped at
+    max_rewind. Object positions are snapshotted after every tick, and each
+    report is tested once, on the first tick after it arrives, against the
+    snapshot from when the player acted.
+    """
+
+    def __init__(self, max_rewind=LAG_COMP_MAX_REWIND, history=POSITION_HISTORY, period=TICK_RATE):
+        self.max_rewind = max_rewind
+        self.positions = {}  # pid -> deque of (server time, x, y, rewind)
+        self.latency = {}  # pid -> smoothed one-way latency in seconds
+        self.history = history
+        self.snapshots = deque(maxlen=math.ceil(max_rewind / period) + 2)  # (server time, {id: (x, y)})
+        self.judged_until = 0.0
+        self.rewound_hits = 0
+
+    def record_position(self, pid, x, y, received_at, sent_at=None):
+        """ sent_at is the client's wall clock in ms (Date.now()); ignored when implausible """
+        if sent_at:
+            sample = received_at - sent_at / 1000
+            if 0 <= sample <= self.max_rewind:
+                previous = self.latency.get(pid, sample)
+                self.latency[pid] = previous + LATENCY_SMOOTHING * (sample - previous)
+        rewind = min(2 * self.latency.get(pid, 0.0), self.max_rewind)
+        ring = self.positions.get(pid)
+        if ring is None:
+            ring = self.positions[pid] = deque(maxlen=self.history)
+        ring.append((received_at, x, y, rewind))
+
+    def forget(self, pid):
+        self.positions.pop(pid, None)
+        self.latency.pop(pid, None)
+
+    def state(self):
+        """ What judging the next reports depends on, for match recordings """
+        return {
+            "latency": self.latency,
+            "positions": {pid: list(ring) for pid, ring in self.positions.items()},
+            "judgedUntil": self.judged_until,
+        }
+
+    def restore(self, latency, positions, judged_until):
+        self.latency = dict(latency)
+        self.positions = {
+            pid: deque((tuple(report) for report in ring), maxlen=self.history)
+            for pid, ring in positions.items()
+        }
+        self.judged_until = judged_until
+
+    def record_objects(self, now, objects):
+        self.snapshots.append((now, {obj["id"]: (obj["x"], obj["y"]) for obj in objects}))
+
+    def objects_at(self, when):
+        """ The last snapshot taken at or before when, or None if that is out of the window """
+        i = bisect_right(self.snapshots, when, key=lambda snapshot: snapshot[0])
+        return self.snapshots[i - 1][1] if i else None
+
+    def reports(self, since):
+        for pid, ring in self.positions.items():
+            for report in reversed(ring):
+                if report[0] <= since:
+                    break
+                yield pid, report
+
+    def hits(self, radius, now, players):
+        """
+        {object id: [pid, ...]} for reports received since the previous call
+        that touched an object within radius at the time the player acted.
+        Players are listed in the order of players (player_positions), the
+        same order the current-position checks use.
+        """
+        since, self.judged_until = self.judged_until, now
+        found = {}
+        grids = {}
+        for pid, (received_at, x, y, rewind) in self.reports(since):
+            if not rewind:
+                continue  # already judged at the current positions
+            snapshot = self.objects_at(received_at - rewind)
+            if not snapshot:
+                continue
+            grid = grids.get(id(snapshot))
+            if grid is None:
+                grid = grids[id(snapshot)] = UniformGrid(radius)
+                for order, (obj_id, (ox, oy)) in enumerate(snapshot.items()):
+                    grid.insert(order, obj_id, ox, oy)
+            for obj_id in grid.within(x, y, radius):
+                pids = found.setdefault(obj_id, [])
+                if pid not in pids:
+                    pids.append(pid)
+        order = {pid: i for i, pid in enumerate(players)}
+        for pids in found.values():
+            pids.sort(key=lambda pid: order.get(pid, len(order)))
+        self.rewound_hits += len(found)
+        return found
+
+    def stats(self):
+        return {
+            "latencyMs": {pid: round(latency * 1000, 1) for pid, latency in self.latency.items()},
+            "rewoundHits": self.rewound_hits,
+        }
+
+
+def first_in_order(players, candidates):
+    """ The candidate that comes first in players (dict order), or None """
+    candidates = set(candidates)
+    candidates.discard(None)
+    if len(candidates) <= 1:
+        return next(iter(candidates), None)
+    return next(pid for pid in players if pid in candidates)
@@ -0,0 +1,146 @@
+import threading
+import time
+from bisect import bisect_left
+from config import LEADERBOARD_TOP_K, LEADERBOARD_MAX_LIMIT
+from db import add_scores, get_score_page, get_score_version, get_rank, update_score
+
+
+class Leaderboard:
+    """
+    Read-through cache of the top LEADERBOARD_TOP_K rows of the players table.
+
+    Score writes go through write() and add(), which update the cached rows in
+    place. The cache is only reloaded (one indexed LIMIT query) when a change
+    could involve a player outside the cached rows, or when another process
+    wrote scores. ETags carry the score version kept in the database, so a
+    write anywhere changes them, whichever page they belong to. Called from
+    Flask threads and the db executor, so
+    everything happens under one lock, writes included: a reload can never
+    see a write that apply() has not counted yet.
+    """
+
+    def __init__(self, top_k=LEADERBOARD_TOP_K, max_age=None):
+        self.top_k = top_k
+        # Set when other processes write scores too: the cache is then reloaded
+        # whenever it is older than max_age seconds
+        self.max_age = max_age
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+        self.rows = []  # [(username, score)] best first
+        self.scores = {}  # username -> score for cached rows
+        self.complete = False  # True when the cache holds every player
+        self.stale = True
+        self.version = 0  # score version the cached rows were read at
+        self.reloads = 0
+
+    def _reload(self):
+        # Version first: a write landing in between only makes the rows newer than it
+        self.version = get_score_version()
+        rows = get_score_page(self.top_k + 1)
+        self.complete = len(rows) <= self.top_k
+        del rows[self.top_k:]
+        self.rows = rows
+        self.scores = dict(rows)
+        self.stale = False
+        self.loaded_at = time.monotonic()
+        self.reloads += 1
+
+    def _ensure(self):
+        expired = self.max_age is not None and time.monotonic() - self.loaded_at > self.max_age
+        if self.stale or expired:
+            self._reload()
+
+    def _apply(self, deltas):
+        if self.stale:
+            return
+        cutoff = self.rows[-1][1] if self.rows else None
+        for username, delta in deltas.items():
+            if username in self.scores:
+                self.scores[username] += delta
+                # A player dropping below the cutoff may be overtaken by an uncached one
+                if not self.complete and self.scores[username] < cutoff:
+                    self.stale = True
+            elif self.complete:
+                # Every player is cached, so an unknown name is a new player
+                self.scores[username] = delta
+            else:
+                self.stale = True
+        if self.stale:
+            return
+        # Same order as ORDER BY score DESC for a fresh table: ties keep their previous order
+        position = {username: i for i, (username, _) in enumerate(self.rows)}
+        self.rows = sorted(self.scores.items(), key=lambda row: (-row[1], position.get(row[0], len(position))))
+        if len(self.rows) > self.top_k:
+            for username, _ in self.rows[self.top_k:]:
+                del self.scores[username]
+            del self.rows[self.top_k:]
+            self.complete = False
+
+    def _wrote(self, version, deltas):
+        if version != self.version + 1:
+            # Another process wrote since the cache was read: its changes are unknown here
+            self.stale = True
+        self._apply(deltas)
+        self.version = version
+
+    def write(self, deltas):
+        """ Persist {username: increment} and update the cache in one step """
+        with self.lock:
+            self._wrote(add_scores(deltas), deltas)
+
+    def add(self, username, increment=1):
+        with self.lock:
+            self._wrote(update_score(username, increment), {username: increment})
+
+    def page(self, limit=None, offset=0):
+        limit = clamp_limit(limit)
+        offset = clamp_offset(offset)
+        with self.lock:
+            self._ensure()
+            if offset + limit <= len(self.rows) or self.complete:
+                return list(self.rows[offset:offset + limit])
+        return get_score_page(limit, offset)
+
+    def rank(self, username):
+        """ {"username", "score", "rank"} with rank 1 being the best, or None """
+        with self.lock:
+            self._ensure()
+            score = self.scores.get(username)
+            if score is not None:
+                # Rank is 1 + number of strictly higher scores, so ties share a rank
+                negated = [-s for _, s in self.rows]
+                return {"username": username, "score": score, "rank": bisect_left(negated, -score) + 1}
+        found = get_rank(username)
+        if found is None:
+            return None
+        rank, score = found
+        return {"username": username, "score": score, "rank": rank}
+
+    def etag(self, *parts):
+        with self.lock:
+            version = get_score_version()
+            if version != self.version:
+                # Written by another process: the page served with this tag has to be reloaded
+                self.stale = True
+            return "-".join(str(part) for part in (version,) + parts)
+
+    def stats(self):
+        return {"cached": len(self.rows), "complete": self.complete, "version": self.version, "reloads": self.reloads}
+
+
+def clamp_limit(limit):
+    try:
+        return max(1, min(int(limit), LEADERBOARD_MAX_LIMIT))
+    except (TypeError, ValueError, OverflowError):
+        # Missing or not a number: the default page
+        return LEADERBOARD_TOP_K
+
+
+def clamp_offset(offset):
+    try:
+        return max(0, int(offset))
+    except (TypeError, ValueError, OverflowError):
+        return 0
+
+
+leaderboard = Leaderboard()
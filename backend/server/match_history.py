@@ -0,0 +1,42 @@
+import time
+from config import MATCH_EVENT_LIMIT
+
+
+class MatchRecord:
+    """
+    Everything that happened in one match, kept in memory while it runs and
+    written with a few batched inserts when it ends (db.save_match).
+    Scores here are for this match only, unlike GameManager.player_scores.
+    """
+
+    def __init__(self, mode, started_at, config=None, event_limit=MATCH_EVENT_LIMIT):
+        self.mode = mode
+        self.started_at = started_at
+        self.ended_at = None
+        self.names = list(config["names"]) if config else []
+        self.num_players = config["numPlayers"] if config else 0
+        self.scores = {}
+        self.events = []  # (server time, player, kind, points)
+        self.event_limit = event_limit
+        self.dropped = 0
+
+    def username(self, pid):
+        return self.names[pid - 1] if 0 < pid <= len(self.names) else None
+
+    def record(self, pid, points, kind, at=None):
+        self.scores[pid] = self.scores.get(pid, 0) + points
+        if len(self.events) < self.event_limit:
+            self.events.append((at if at is not None else time.time(), pid, kind, points))
+        else:
+            self.dropped += 1
+
+    def finish(self, ended_at=None):
+        self.ended_at = ended_at if ended_at is not None else time.time()
+        if self.dropped:
+            print(f"⚠️ Match event log full, {self.dropped} events were not logged")
+        return self
+
+    def results(self):
+        """ (player, username, score) per player that scored or was configured """
+        players = sorted(set(self.scores) | set(range(1, self.num_players + 1)))
+        return [(pid, self.username(pid), self.scores.get(pid, 0)) for pid in players]
@@ -0,0 +1,185 @@
+import math
+from bisect import bisect_left
+
+# Prometheus text exposition (format 0.0.4) of counters, gauges and histograms.
+#
+# Recording is a float add or a bisect plus an increment, so it can stay on in
+# the 60 Hz loop. Everything is read only when /metrics is scraped. Shards
+# send their collected families to the front process, which serves them with
+# a shard label next to its own.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.0167, 0.025, 0.05, 0.1, 0.25, 1.0)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self, name, labels):
+        yield name + "_total", labels, self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, buckets=SECONDS_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), list(self.counts)):
+            cumulative += count
+            yield name + "_bucket", {**labels, "le": _number(bound)}, cumulative
+        yield name + "_sum", labels, self.sum
+        yield name + "_count", labels, cumulative
+
+
+class Family:
+    """ One metric name; a child per combination of label values """
+
+    def __init__(self, name, help, metric, labelnames=(), **options):
+        self.name = name
+        self.help = help
+        self.kind = metric.kind
+        self.labelnames = tuple(labelnames)
+        self._new = lambda: metric(**options)
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self._new()
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new()
+        return child
+
+    # Unlabelled families record directly
+    def inc(self, amount=1):
+        self.children[()].inc(amount)
+
+    def dec(self, amount=1):
+        self.children[()].dec(amount)
+
+    def set(self, value):
+        self.children[()].set(value)
+
+    def observe(self, value):
+        self.children[()].observe(value)
+
+    def collect(self):
+        samples = []
+        for values, child in list(self.children.items()):
+            labels = dict(zip(self.labelnames, values))
+            samples += [[name, labels, value] for name, labels, value in child.samples(self.name, labels)]
+        return {"name": self.name, "type": self.kind, "help": self.help, "samples": samples}
+
+
+class Registry:
+    def __init__(self):
+        self.families = {}
+        self.remote = {}  # shard index -> families collected in that shard
+
+    def _register(self, name, help, metric, labelnames, **options):
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, help, metric, labelnames, **options)
+        return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(name, help, Counter, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(name, help, Gauge, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=SECONDS_BUCKETS):
+        return self._register(name, help, Histogram, labelnames, buckets=buckets)
+
+    def collect(self):
+        return [family.collect() for family in list(self.families.values())]
+
+    def render(self):
+        merged = {}
+        sources = [(None, self.collect())] + list(self.remote.items())
+        for shard, families in sources:
+            for family in families:
+                entry = merged.setdefault(family["name"], {**family, "samples": []})
+                for name, labels, value in family["samples"]:
+                    if shard is not None:
+                        labels = {"shard": str(shard), **labels}
+                    entry["samples"].append((name, labels, value))
+
+        lines = []
+        for name, family in merged.items():
+            lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for sample, labels, value in family["samples"]:
+                lines.append(f"{sample}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+registry = Registry()
+
+TICK_SECONDS = registry.histogram("game_tick_duration_seconds", "Time spent ticking every room once")
+BROADCAST_SECONDS = registry.histogram(
+    "game_broadcast_seconds", "Time to diff, encode and queue one room's state frames for its clients"
+)
+FRAME_BYTES = registry.histogram(
+    "game_frame_bytes", "Serialized size of state frames", ("encoding",), buckets=BYTES_BUCKETS
+)
+WS_CLIENTS = registry.gauge("game_websocket_clients", "Connected WebSocket clients")
+FPGA_CLIENTS = registry.gauge("game_fpga_clients", "Connected FPGA gateways")
+INPUT_QUEUE_DEPTH = registry.gauge("game_input_queue_depth", "FPGA events waiting for the next tick, all rooms")
+OBJECTS = registry.gauge("game_objects", "Live game objects, all rooms", ("mode",))
+DB_FLUSH_SECONDS = registry.histogram("game_db_flush_seconds", "Time to write one batch of score changes")
+DB_FLUSH_FAILURES = registry.counter("game_db_flush_failures", "Score batches that failed to write")
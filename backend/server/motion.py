@@ -0,0 +1,68 @@
+# Server-side copy of the avatar movement in PlayerMario/PlayerWaluigi.jsx, so
+# FPGA motion moves players in the simulation without waiting for the browser
+# to render it and report a new player_position.
+
+FRAME_RATE = 60  # the browser constants below are per rendered frame
+LATERAL_SPEED = 0.005
+JUMP_STRENGTH = 0.07
+GRAVITY = 0.9
+
+GROUND_Y = {"Coin Cascade": -0.7, "Bullet Barrage": -0.35}
+LATERAL_MODES = {"Coin Cascade"}
+
+# FPGA tokens as the Disco Dash client maps them (ArrowGame.jsx COMMAND_MAPPING)
+ARROW_ACTIONS = {
+    "L": "ArrowLeft",
+    "R": "ArrowRight",
+    "J": "ArrowUp",
+    "B1": "ArrowUp",
+    "B2": "Button",
+}
+
+
+class PlayerMotion:
+    def __init__(self):
+        self.direction = 0
+        self.velocity_y = 0.0
+        self.jumping = False
+        self.ground = None  # y the current jump lands on
+
+    def state(self):
+        return {"direction": self.direction, "velocityY": self.velocity_y, "jumping": self.jumping, "ground": self.ground}
+
+    @classmethod
+    def from_state(cls, state):
+        motion = cls()
+        motion.direction = state["direction"]
+        motion.velocity_y = state["velocityY"]
+        motion.jumping = state["jumping"]
+        motion.ground = state["ground"]
+        return motion
+
+    def apply(self, token):
+        if token == "L":
+            self.direction = -1
+        elif token == "R":
+            self.direction = 1
+        elif token == "N":
+            self.direction = 0
+        elif token in ("J", "B1", "B2") and not self.jumping:
+            self.jumping = True
+            self.velocity_y = JUMP_STRENGTH
+            self.ground = None
+
+    def step(self, pos, mode, dt):
+        frames = dt * FRAME_RATE
+        if mode in LATERAL_MODES:
+            pos["x"] += self.direction * LATERAL_SPEED * frames
+
+        if self.jumping:
+            if self.ground is None:
+                # Modes without a floor land where the jump took off
+                self.ground = GROUND_Y.get(mode, pos["y"])
+            pos["y"] += self.velocity_y * frames
+            self.velocity_y -= 0.3 * dt * GRAVITY
+            if pos["y"] <= self.ground:
+                pos["y"] = self.ground
+                self.jumping = False
+                self.velocity_y = 0.0
@@ -0,0 +1,70 @@
+import json
+import os
+import re
+from config import RECORD_DIR
+
+# Match recordings, one JSON object per line in the order the room saw them:
+#
+#   start    t, room, mode, seed, backend, config, positions, scores, fpgaPlayers,
+#            lag, motion, lastTick      lag compensation and FPGA motion carried over
+#                                       from before the match, and the previous tick
+#   tick     t                          a tick ran with now = t
+#   pause    t                          the room went idle and stopped ticking
+#   ws       t, data, offset            a WebSocket message (offset: the browser's clock
+#                                       offset in seconds when it arrived, or null)
+#   fpga     t, player, events          FPGA events handed to the room
+#   attach   t, player                  an FPGA gateway took / left a player slot
+#   detach   t, player
+#   end      t, scores                  this match's scores per player
+#
+# With the seed, the tick times and every input, replay.py rebuilds the match
+# exactly, faster than real time.
+
+# Messages that change the simulation; queries, acks and clock pings are not kept.
+# A game_selection ends the recording, and the next match gets its own.
+RECORDED_MESSAGES = ("init", "player_position", "player_input")
+
+
+class MatchRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w")
+        self.entries = 0
+
+    @classmethod
+    def for_match(cls, game_manager, backend, directory=RECORD_DIR):
+        os.makedirs(directory, exist_ok=True)
+        room = re.sub(r"[^\w.-]", "_", game_manager.room_id)
+        recorder = cls(os.path.join(directory, f"{room}-{int(game_manager.start_time * 1000)}.jsonl"))
+        recorder.write(
+            "start", game_manager.start_time,
+            room=game_manager.room_id,
+            mode=game_manager.mode,
+            seed=game_manager.env.seed,
+            backend=backend,
+            config=game_manager.config,
+            positions=game_manager.player_positions,
+            scores=game_manager.player_scores,
+            fpgaPlayers=sorted(game_manager.fpga_players),
+            lag=game_manager.lag.state(),
+            motion={pid: motion.state() for pid, motion in game_manager.motion.items()},
+            lastTick=game_manager.last_tick,
+        )
+        return recorder
+
+    def write(self, kind, t, **fields):
+        self.file.write(json.dumps({"kind": kind, "t": t, **fields}) + "\n")
+        self.entries += 1
+
+    def message(self, t, data, clock=None):
+        self.write("ws", t, data=data, offset=clock.offset if clock and clock.synced else None)
+
+    def finish(self, t, scores):
+        self.write("end", t, scores=scores)
+        self.file.close()
+        print(f"Recorded {self.entries} entries to {self.path}")
+
+
+def read_recording(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
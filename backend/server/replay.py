@@ -0,0 +1,157 @@
+"""
+Replay a recorded match (see recorder.py) headless and faster than real time.
+
+The room is rebuilt from the recording's start entry with its seed, and
+every tick, WebSocket message and FPGA event is fed back at its recorded
+time on a ManualClock. No sockets and no database writes are involved. The
+scores are then checked against the ones the live match ended with.
+
+Run from backend/server:
+    python replay.py recordings/default-1700000000000.jsonl [--backend dict|numpy] [--profile]
+"""
+import argparse
+import asyncio
+import contextlib
+import cProfile
+import io
+import pstats
+import sys
+import time
+
+from clock_sync import ClockSync
+from environment import Environment, ManualClock
+from game_manager import GameManager
+from game_modes.vectorized import make_engines
+from motion import PlayerMotion
+from recorder import read_recording
+from score_store import ScoreWriter
+from websocket_server import clocks, handle_message
+
+
+class ReplaySocket:
+    """ Stands in for the browser that sent the recorded messages """
+    remote_address = ("replay", 0)
+    closed = False
+
+
+def _players(mapping):
+    # JSON turned the player ids into strings
+    return {int(pid): value for pid, value in (mapping or {}).items()}
+
+
+class Replayer:
+    def __init__(self, entries, backend=None):
+        if not entries or entries[0]["kind"] != "start":
+            raise ValueError("Not a match recording: the first entry must be 'start'")
+        self.entries = entries
+        self.start = entries[0]
+        self.backend = backend or self.start.get("backend", "dict")
+        self.clock = ManualClock(self.start["t"])
+        self.ws = ReplaySocket()
+        self.ticks = 0
+        self.game = self._build()
+
+    def _build(self):
+        start = self.start
+        # Scores are kept in memory only; nothing reaches the database
+        game = GameManager(start["room"], score_writer=ScoreWriter(write=lambda batch: None),
+                           env=Environment(clock=self.clock))
+        game.engines = make_engines() if self.backend == "numpy" else {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            if start["config"]:
+                game.update_config(start["config"]["numPlayers"], start["config"]["names"])
+            for pid in start["fpgaPlayers"]:
+                game.attach_fpga(pid)
+        # Copied: motion moves positions in place, and the entries may be replayed again
+        game.player_positions = {pid: dict(pos) for pid, pos in _players(start["positions"]).items()}
+        game.player_scores = _players(start["scores"])
+        game.start_match(start["mode"], seed=start["seed"], record=False)
+        # State from before the match that its first ticks still use (absent from older recordings)
+        if "lag" in start:
+            lag = start["lag"]
+            game.lag.restore(_players(lag["latency"]), _players(lag["positions"]), lag["judgedUntil"])
+        for pid, state in _players(start.get("motion")).items():
+            game.motion[pid] = PlayerMotion.from_state(state)
+        game.last_tick = start.get("lastTick")
+        return game
+
+    async def _apply(self, entry):
+        kind = entry["kind"]
+        if kind == "tick":
+            # Nothing is connected to publish to, so only the simulation half of a tick
+            await self.game.simulate(self.clock())
+            self.ticks += 1
+        elif kind == "ws":
+            clock = ClockSync()
+            clock.offset = entry["offset"]
+            clocks[self.ws] = clock
+            await handle_message(entry["data"], self.game, self.ws)
+        elif kind == "fpga":
+            self.game.push_fpga_events(entry["player"], entry["events"])
+        elif kind == "attach":
+            self.game.attach_fpga(entry["player"])
+        elif kind == "detach":
+            self.game.detach_fpga(entry["player"])
+        elif kind == "pause":
+            self.game.pause()
+
+    async def run(self):
+        """ Play every entry; returns this match's scores per player """
+        try:
+            for entry in self.entries[1:]:
+                self.clock.set(entry["t"])
+                if entry["kind"] == "end":
+                    break
+                await self._apply(entry)
+        finally:
+            clocks.pop(self.ws, None)
+        return dict(self.game.match.scores)
+
+    def recorded_scores(self):
+        end = self.entries[-1]
+        return _players(end["scores"]) if end["kind"] == "end" else None
+
+
+def replay(path, backend=None):
+    replayer = Replayer(read_recording(path), backend)
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        scores = asyncio.run(replayer.run())
+    return replayer, scores, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("recording")
+    parser.add_argument("--backend", choices=("dict", "numpy"), help="default: the one the match was played on")
+    parser.add_argument("--profile", action="store_true", help="print the hottest functions of the replay")
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    replayer, scores, elapsed = replay(args.recording, args.backend)
+    if profiler:
+        profiler.disable()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+
+    start = replayer.start
+    played = replayer.entries[-1]["t"] - start["t"]
+    print(
+        f"{start['mode']} in room {start['room']} (seed {start['seed']}, {replayer.backend} backend): "
+        f"{replayer.ticks} ticks, {played:.1f} s of play replayed in {elapsed:.2f} s"
+    )
+    print(f"Scores: {scores}")
+
+    recorded = replayer.recorded_scores()
+    if recorded is None:
+        print("⚠️ The recording has no end entry, nothing to compare against")
+    elif recorded != scores:
+        print(f"❌ Scores differ from the recorded match: {recorded}")
+        sys.exit(1)
+    else:
+        print("Scores match the recorded match")
+
+
+if __name__ == "__main__":
+    main()
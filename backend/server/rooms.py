@@ -0,0 +1,126 @@
+import asyncio
+from config import DEFAULT_ROOM, MAX_ROOMS
+from game_manager import GameManager
+from metrics import INPUT_QUEUE_DEPTH, OBJECTS
+from scheduler import TickScheduler
+from score_store import ScoreWriter
+
+
+class RoomManager:
+    """
+    All the rooms hosted by this process. One scheduler ticks every room in
+    turn and one score writer persists all of them. The scheduler runs at the
+    fastest tick rate among the rooms that need ticks, each room ticks at its
+    own mode's rate, and with no such room it sleeps. Rooms are created when
+    a WebSocket joins them and closed once nobody is left in them; the
+    default room always exists.
+    """
+
+    def __init__(self, max_rooms=MAX_ROOMS):
+        self.max_rooms = max_rooms
+        self.scheduler = TickScheduler()
+        self.score_writer = ScoreWriter()
+        self.rooms = {}
+        self.create(DEFAULT_ROOM)
+
+    def __iter__(self):
+        return iter(list(self.rooms.values()))
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def create(self, room_id):
+        room = self.rooms[room_id] = GameManager(room_id, self.scheduler, self.score_writer)
+        print(f"Opened room {room_id} ({len(self.rooms)} active)")
+        return room
+
+    def get(self, room_id):
+        return self.rooms.get(room_id)
+
+    def join(self, room_id, ws):
+        """ Subscribe ws to room_id, creating the room; None if the process is full """
+        room = self.rooms.get(room_id)
+        if room is None:
+            if len(self.rooms) >= self.max_rooms:
+                return None
+            room = self.create(room_id)
+        room.subscribers.add(ws)
+        self.scheduler.wake()
+        return room
+
+    def leave(self, room, ws):
+        room.subscribers.discard(ws)
+        room.state_sync.unsubscribe(ws)
+        self.close_if_idle(room)
+
+    def close_if_idle(self, room):
+        if room.room_id == DEFAULT_ROOM or not room.is_idle() or self.rooms.get(room.room_id) is not room:
+            return
+        room.end_match()
+        del self.rooms[room.room_id]
+        print(f"Closed room {room.room_id} ({len(self.rooms)} active)")
+
+    def room_for_fpga(self):
+        """ The first configured room with a free FPGA slot, in the order rooms were opened """
+        for room in self.rooms.values():
+            if room.config and len(room.fpga_connections) < room.config["numPlayers"]:
+                return room
+        return None
+
+    async def tick(self, behind=0.0, publish=True):
+        """ Tick the rooms that are due; returns the scheduler period to use next, None to sleep """
+        rooms = list(self.rooms.values())
+        INPUT_QUEUE_DEPTH.set(sum(room.fpga_inputs.depth() for room in rooms))
+        now = self.scheduler.clock() - behind
+        # A room is due on the scheduler tick closest to its own deadline
+        slack = self.scheduler.period / 2
+        active = []
+        for room in rooms:
+            if not room.needs_ticks():
+                room.pause()
+                continue
+            active.append(room)
+            try:
+                if room.due(now, slack):
+                    await room.tick(behind, publish)
+                elif publish:
+                    # Simulated earlier in a catch-up run but not due now
+                    await room.publish()
+            except Exception as e:
+                # One broken room must not stop the others
+                print(f"❌ Tick failed in room {room.room_id}: {e}")
+
+        objects = dict.fromkeys(OBJECTS.children, 0)
+        for room in rooms:
+            if room.mode:
+                objects[(room.mode,)] = objects.get((room.mode,), 0) + len(room.objects)
+        for mode, count in objects.items():
+            OBJECTS.labels(*mode).set(count)
+        return min((room.tick_period for room in active), default=None)
+
+    def stats(self):
+        return [
+            {
+                "room": room.room_id,
+                "mode": room.mode,
+                "subscribers": len(room.subscribers),
+                "numPlayers": room.config["numPlayers"] if room.config else 0,
+                "fpgaPlayers": sorted(room.fpga_connections),
+                "tickRate": 1 / room.tick_period,
+                "paused": not room.needs_ticks(),
+            }
+            for room in self.rooms.values()
+        ]
+
+    async def game_loop(self):
+        writer = asyncio.create_task(self.score_writer.run())
+        try:
+            await self.scheduler.run(self.tick)
+        finally:
+            # Before the writer stops, so a save that fails now is still retried by its final flush
+            await self.score_writer.wait_for_saves()
+            writer.cancel()
+            # Its final flush runs as it stops
+            await asyncio.gather(writer, return_exceptions=True)
+            for room in self.rooms.values():
+                room.shutdown()
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import deque
+from config import TICK_RATE, TICK_POLICY, MAX_CATCH_UP_TICKS, TICK_STATS_WINDOW
+from metrics import TICK_SECONDS
+
+POLICIES = ("catch_up", "skip")
+
+
+def _summarise(samples):
+    if not samples:
+        return {"last": 0.0, "mean": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "last": samples[-1] * 1000,
+        "mean": sum(samples) / len(samples) * 1000,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+
+class TickStats:
+    """ Rolling per-tick telemetry: work time, lateness and overrun counts """
+
+    def __init__(self, window=TICK_STATS_WINDOW):
+        self.ticks = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.pauses = 0
+        self.idle = 0.0  # seconds spent asleep with nothing to tick
+        self.work = deque(maxlen=window)
+        self.lateness = deque(maxlen=window)
+        self.starts = deque(maxlen=window)
+
+    def record(self, started, work, lateness, period):
+        self.ticks += 1
+        if work > period:
+            self.overruns += 1
+        self.work.append(work)
+        self.lateness.append(lateness)
+        self.starts.append(started)
+
+    def actual_rate(self):
+        if len(self.starts) < 2:
+            return 0.0
+        span = self.starts[-1] - self.starts[0]
+        return (len(self.starts) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        return {
+            "ticks": self.ticks,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "pauses": self.pauses,
+            "idleSeconds": self.idle,
+            "actualHz": self.actual_rate(),
+            "workMs": _summarise(self.work),
+            "latenessMs": _summarise(self.lateness),
+        }
+
+
+class TickScheduler:
+    """
+    Runs a tick callback against absolute deadlines on the monotonic clock, so
+    the period does not stretch by the time spent doing the work. When a tick
+    overruns, "catch_up" runs the missed ticks back-to-back (at most
+    MAX_CATCH_UP_TICKS of them) while "skip" realigns to the next deadline.
+
+    tick(behind, publish) is told how far behind its deadline it runs, so the
+    game can simulate the deadline's time rather than the time it got to
+    run, and whether to publish: while catching up, only the last of the
+    back-to-back ticks does, instead of one full frame to every client per
+    missed deadline just when the server is overloaded.
+
+    The tick callback returns the period until the next tick, so the rate
+    can follow what is being played, or None when there is nothing to do.
+    The scheduler then sleeps without waking up until wake() is called.
+    """
+
+    def __init__(self, period=TICK_RATE, policy=TICK_POLICY, max_catch_up=MAX_CATCH_UP_TICKS,
+                 clock=time.monotonic, sleep=asyncio.sleep):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown tick policy: {policy}")
+        self.period = period
+        self.policy = policy
+        self.max_catch_up = max(1, max_catch_up)
+        self.clock = clock
+        self.sleep = sleep
+        self.stats = TickStats()
+        self.deadline = None
+        self.wakeup = asyncio.Event()
+        self.sleeping = False
+
+    def wake(self):
+        """ Something may need ticks again: a match started or a client connected """
+        self.wakeup.set()
+
+    async def _idle(self):
+        self.sleeping = True
+        self.stats.pauses += 1
+        slept = self.clock()
+        try:
+            await self.wakeup.wait()
+        finally:
+            self.sleeping = False
+        self.stats.idle += self.clock() - slept
+        # The gap is not a slow tick
+        self.stats.starts.clear()
+        self.deadline = self.clock()
+
+    def _advance(self, now):
+        self.deadline += self.period
+        behind = now - self.deadline
+        if behind <= 0:
+            return
+
+        # Deadlines that have already passed, including the next one
+        missed = int(behind // self.period) + 1
+        if self.policy == "skip":
+            dropped = missed
+        else:
+            dropped = max(0, missed - self.max_catch_up)
+
+        self.deadline += dropped * self.period
+        self.stats.skipped += dropped
+
+    async def run(self, tick):
+        self.deadline = self.clock() + self.period
+        while True:
+            delay = self.deadline - self.clock()
+            if delay > 0:
+                await self.sleep(delay)
+            else:
+                # Still yield so socket handlers get a turn while catching up
+                await self.sleep(0)
+
+            # Cleared before the tick, so a wake() while it runs is not lost
+            self.wakeup.clear()
+            started = self.clock()
+            behind = max(0.0, started - self.deadline)
+            # With catch_up, a deadline that has already passed means another tick follows at once
+            publish = self.policy == "skip" or started < self.deadline + self.period
+            period = await tick(behind, publish)
+            finished = self.clock()
+
+            self.stats.record(started, finished - started, started - self.deadline, self.period)
+            TICK_SECONDS.observe(finished - started)
+            if period is None:
+                await self._idle()
+                continue
+            self.period = period
+            self._advance(finished)
+
+    def snapshot(self):
+        return {
+            "tickRate": 1 / self.period,
+            "policy": self.policy,
+            "sleeping": self.sleeping,
+            **self.stats.snapshot(),
+        }
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from config import SCORE_FLUSH_INTERVAL
+from db import run_db, save_match
+from leaderboard import leaderboard
+from metrics import DB_FLUSH_SECONDS, DB_FLUSH_FAILURES
+
+
+class ScoreWriter:
+    """
+    Write-behind buffer for score changes. sync_score only adds to an
+    in-memory delta per username; the deltas are written in one transaction
+    every SCORE_FLUSH_INTERVAL seconds, when a match ends and on shutdown.
+    Finished matches are saved the same way: a save that fails is kept and
+    retried with the next flush. The SQLite work runs on the db executor so
+    a tick never waits on the disk, and flushes hold a lock so a batch is
+    never written twice or out of order.
+    """
+
+    def __init__(self, interval=SCORE_FLUSH_INTERVAL, write=leaderboard.write, save=save_match):
+        self.interval = interval
+        self.write = write
+        self.save = save
+        self.pending = {}  # username -> score delta not yet on disk
+        self.matches = []  # finished MatchRecords whose save failed
+        self.saving = set()  # save tasks in flight
+        self.flushing = set()  # flush tasks in flight
+        self.lock = asyncio.Lock()
+        self.flushes = 0
+        self.failures = 0
+
+    def add(self, username, points):
+        self.pending[username] = self.pending.get(username, 0) + points
+
+    def _take(self):
+        batch = {username: delta for username, delta in self.pending.items() if delta}
+        self.pending = {}
+        return batch
+
+    def _restore(self, batch):
+        # Keep the deltas for the next flush; anything added meanwhile is merged in
+        for username, delta in batch.items():
+            self.add(username, delta)
+
+    async def flush(self):
+        async with self.lock:
+            matches, self.matches = self.matches, []
+            for match in matches:
+                await self.save_match(match)
+
+            batch = self._take()
+            if not batch:
+                return
+            started = time.perf_counter()
+            try:
+                await run_db(self.write, batch)
+                self.flushes += 1
+                DB_FLUSH_SECONDS.observe(time.perf_counter() - started)
+            except Exception as e:
+                self.failures += 1
+                DB_FLUSH_FAILURES.inc()
+                self._restore(batch)
+                print(f"❌ Failed to persist scores: {e}")
+
+    def _keep(self, tasks, coro):
+        # Referenced until done, so it is not garbage collected and its errors are reported
+        task = asyncio.ensure_future(coro)
+        tasks.add(task)
+
+        def done(task):
+            tasks.discard(task)
+            if not task.cancelled() and task.exception():
+                print(f"❌ Score writer task failed: {task.exception()}")
+
+        task.add_done_callback(done)
+        return task
+
+    def flush_soon(self):
+        """ Schedule a flush without waiting for it, e.g. at the end of a match """
+        self._keep(self.flushing, self.flush())
+
+    async def save_match(self, match):
+        try:
+            await run_db(self.save, match)
+        except Exception as e:
+            self.failures += 1
+            DB_FLUSH_FAILURES.inc()
+            self.matches.append(match)
+            print(f"❌ Failed to save {match.mode} match, retrying with the next flush: {e}")
+
+    def save_match_soon(self, match):
+        """ Save a finished MatchRecord without waiting for it """
+        self._keep(self.saving, self.save_match(match))
+
+    async def wait_for_saves(self):
+        """ Let the saves and flushes in flight finish, e.g. before shutting down """
+        while self.saving or self.flushing:
+            await asyncio.gather(*self.saving, *self.flushing, return_exceptions=True)
+
+    def flush_now(self):
+        """ Blocking flush for shutdown, once no flush is in flight """
+        matches, self.matches = self.matches, []
+        for match in matches:
+            try:
+                self.save(match)
+            except Exception as e:
+                print(f"❌ Failed to save {match.mode} match, it is lost: {e}")
+        batch = self._take()
+        if batch:
+            self.write(batch)
+
+    async def run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                # Shielded: stopping the writer lets a flush already writing finish first
+                await asyncio.shield(self._keep(self.flushing, self.flush()))
+        finally:
+            await self.wait_for_saves()
+            async with self.lock:
+                self.flush_now()
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "unsavedMatches": len(self.matches) + len(self.saving),
+            "flushes": self.flushes,
+            "failures": self.failures,
+        }
@@ -0,0 +1,465 @@
+"""
+Rooms sharded over worker processes.
+
+Each shard is a process with its own event loop, RoomManager and tick
+scheduler. The front process owns every real connection: it accepts the
+WebSockets and FPGA TCP connections and relays them to the shard that owns
+the room over a Unix socket per shard. Inside a shard, ShardSocket and
+ShardStreamWriter stand in for the real connections, so the regular
+websocket_server.handler and fpga_server.handle_tcp_connection run unchanged.
+
+Rooms are assigned to shards by a hash of their name. A WebSocket starts in
+the default room; when a message names a room owned by another shard, the
+front moves the connection there (the client then has to resend
+state_sync/set_encoding, as the new shard has never seen it). FPGA gateways
+go to the first configured room with a free slot, using the status the
+shards report every SHARD_STATUS_INTERVAL seconds (a gateway finding no slot
+waits for a couple of fresh reports before it is turned away). When a shard dies, the
+front closes the connections it was serving and its rooms hash on to the
+next live shard.
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import struct
+import zlib
+from websockets.server import serve
+from config import (
+    WS_PORT, TCP_PORT, DEFAULT_ROOM, FPGA_READ_BUFFER,
+    SHARD_SOCKET_DIR, SHARD_STATUS_INTERVAL, SHARD_LEADERBOARD_MAX_AGE
+)
+from fanout import FanOut
+from fpga_server import configure_socket
+from leaderboard import leaderboard
+from metrics import registry
+from tracing import tracer
+
+# IPC frame: length u32 (of everything after it) | kind u8 | connection u32 | flags u8 | payload
+_FRAME = struct.Struct("<IBIB")
+_HEADER_REST = _FRAME.size - 4
+
+# Front -> shard
+WS_OPEN = 1
+WS_MESSAGE = 2
+WS_CLOSE = 3
+FPGA_OPEN = 4
+FPGA_DATA = 5
+FPGA_CLOSE = 6
+# Shard -> front
+SEND = 10
+CLOSE = 11
+FPGA_WRITE = 12
+FPGA_END = 13
+STATUS = 14
+METRICS = 15
+TRACES = 16
+
+# SEND flags
+BINARY = 1
+STATE = 2  # a state frame, which the front may coalesce or drop
+
+
+def pack(kind, conn, payload=b"", flags=0):
+    return _FRAME.pack(_HEADER_REST + len(payload), kind, conn, flags) + payload
+
+
+async def read_frame(reader):
+    length, kind, conn, flags = _FRAME.unpack(await reader.readexactly(_FRAME.size))
+    payload = await reader.readexactly(length - _HEADER_REST)
+    return kind, conn, flags, payload
+
+
+def shard_path(index):
+    return os.path.join(SHARD_SOCKET_DIR, f"game-shard-{os.getpid()}-{index}.sock")
+
+
+def shard_index(room_id, count):
+    return zlib.crc32(room_id.encode()) % count
+
+
+# --------------------------- Shard process ------------------------------
+
+class ShardSocket:
+    """ A WebSocket as seen from a shard; the real one lives in the front process """
+
+    relayed = True  # the FanOut passes on whether a frame is droppable
+
+    def __init__(self, conn, link, remote_address):
+        self.conn = conn
+        self.link = link
+        self.remote_address = remote_address
+        self.inbox = asyncio.Queue()
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.inbox.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def send(self, msg, droppable=False):
+        flags = STATE if droppable else 0
+        if isinstance(msg, bytes):
+            self.link.write(pack(SEND, self.conn, msg, flags | BINARY))
+        else:
+            self.link.write(pack(SEND, self.conn, msg.encode(), flags))
+        await self.link.drain()
+
+    async def close(self):
+        if not self.closed:
+            self.hang_up()
+            self.link.write(pack(CLOSE, self.conn))
+
+    def hang_up(self):
+        self.closed = True
+        self.inbox.put_nowait(None)
+
+
+class ShardStreamWriter:
+    """ The writer half of an FPGA connection as seen from a shard """
+
+    def __init__(self, conn, link, peername):
+        self.conn = conn
+        self.link = link
+        self.peername = peername
+        self.closed = False
+
+    def get_extra_info(self, name, default=None):
+        # No "socket": the front process already configured the real one
+        return self.peername if name == "peername" else default
+
+    def write(self, data):
+        if not self.closed:
+            self.link.write(pack(FPGA_WRITE, self.conn, data))
+
+    async def drain(self):
+        await self.link.drain()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.link.write(pack(FPGA_END, self.conn))
+
+    async def wait_closed(self):
+        pass
+
+
+async def report_status(link, rooms):
+    while True:
+        link.write(pack(STATUS, 0, json.dumps(rooms.stats()).encode()))
+        link.write(pack(METRICS, 0, json.dumps(registry.collect()).encode()))
+        link.write(pack(TRACES, 0, json.dumps(tracer.state()).encode()))
+        await asyncio.sleep(SHARD_STATUS_INTERVAL)
+
+
+async def shard_link(reader, writer, rooms):
+    from fpga_server import handle_tcp_connection
+    from websocket_server import handler
+
+    sockets = {}
+    fpga_readers = {}
+    status = asyncio.create_task(report_status(writer, rooms))
+    try:
+        while True:
+            kind, conn, _, payload = await read_frame(reader)
+            if kind == WS_MESSAGE:
+                ws = sockets.get(conn)
+                if ws:
+                    ws.inbox.put_nowait(payload.decode())
+            elif kind == FPGA_DATA:
+                fpga_reader = fpga_readers.get(conn)
+                if fpga_reader:
+                    fpga_reader.feed_data(payload)
+            elif kind == WS_OPEN:
+                ws = sockets[conn] = ShardSocket(conn, writer, payload.decode())
+                asyncio.create_task(handler(ws, rooms))
+            elif kind == WS_CLOSE:
+                ws = sockets.pop(conn, None)
+                if ws:
+                    ws.hang_up()
+            elif kind == FPGA_OPEN:
+                fpga_reader = fpga_readers[conn] = asyncio.StreamReader(limit=FPGA_READ_BUFFER)
+                fpga_writer = ShardStreamWriter(conn, writer, payload.decode())
+                asyncio.create_task(handle_tcp_connection(fpga_reader, fpga_writer, rooms))
+            elif kind == FPGA_CLOSE:
+                fpga_reader = fpga_readers.pop(conn, None)
+                if fpga_reader:
+                    fpga_reader.feed_eof()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        print("❌ Lost the front process")
+    finally:
+        status.cancel()
+        for ws in sockets.values():
+            ws.hang_up()
+        for fpga_reader in fpga_readers.values():
+            fpga_reader.feed_eof()
+
+
+async def serve_shard(path):
+    from rooms import RoomManager
+
+    rooms = RoomManager()
+    server = await asyncio.start_unix_server(lambda r, w: shard_link(r, w, rooms), path)
+    async with server:
+        await rooms.game_loop()
+
+
+def run_shard(index, path):
+    leaderboard.max_age = SHARD_LEADERBOARD_MAX_AGE
+    print(f"[Shard {index}] Serving rooms on {path} (pid {os.getpid()})")
+    try:
+        asyncio.run(serve_shard(path))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_shards(count):
+    """ Spawn the shard processes and return their socket paths """
+    context = multiprocessing.get_context("spawn")
+    paths = []
+    for index in range(count):
+        path = shard_path(index)
+        if os.path.exists(path):
+            os.unlink(path)
+        context.Process(target=run_shard, args=(index, path), daemon=True).start()
+        paths.append(path)
+    return paths
+
+
+# --------------------------- Front process ------------------------------
+
+class ShardLink:
+    def __init__(self, index, path):
+        self.index = index
+        self.path = path
+        self.reader = None
+        self.writer = None
+        self.alive = True
+
+    async def connect(self, attempts=100):
+        for _ in range(attempts):
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                return
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.1)
+        raise ConnectionError(f"Shard {self.index} did not come up at {self.path}")
+
+    def send(self, kind, conn, payload=b""):
+        if self.alive:
+            self.writer.write(pack(kind, conn, payload))
+
+    async def drain(self):
+        if self.alive:
+            await self.writer.drain()
+
+
+class Front:
+    """ Accepts every connection and relays it to the shard that owns its room """
+
+    def __init__(self, links):
+        self.links = links
+        self.clients = FanOut()
+        self.sockets = {}  # conn -> (ws, ShardLink currently serving it)
+        self.fpga = {}  # conn -> (StreamWriter, ShardLink)
+        self.status = {link.index: [] for link in links}  # latest room stats per shard
+        self.status_changed = asyncio.Condition()
+        self.next_conn = 0
+
+    def _conn_id(self):
+        self.next_conn = (self.next_conn + 1) & 0xFFFFFFFF or 1
+        return self.next_conn
+
+    def shard_for(self, room_id):
+        # Rooms of a dead shard move to the next live one; the others stay where they are
+        index = shard_index(room_id, len(self.links))
+        for offset in range(len(self.links)):
+            link = self.links[(index + offset) % len(self.links)]
+            if link.alive:
+                return link
+        raise ConnectionError("No shard is left")
+
+    def _free_fpga_slot(self):
+        for link in self.links:
+            if not link.alive:
+                continue
+            for room in self.status[link.index]:
+                if room["numPlayers"] and len(room["fpgaPlayers"]) < room["numPlayers"]:
+                    # Count the gateway now so the next one does not race for the same slot
+                    room["fpgaPlayers"].append(None)
+                    return link
+        return None
+
+    async def shard_for_fpga(self):
+        # The status can be SHARD_STATUS_INTERVAL old: a room configured since then is not in it
+        # yet, so before giving up wait for the reports the shards send after that
+        deadline = asyncio.get_running_loop().time() + 2 * SHARD_STATUS_INTERVAL
+        link = self._free_fpga_slot()
+        while link is None:
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                # Nobody has a free slot; let the default room's shard turn it away
+                return self.shard_for(DEFAULT_ROOM)
+            try:
+                async with self.status_changed:
+                    await asyncio.wait_for(self.status_changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            link = self._free_fpga_slot()
+        return link
+
+    def rooms(self):
+        try:
+            owner = self.shard_for(DEFAULT_ROOM).index
+        except ConnectionError:
+            return []
+        # Every shard has a default room but only one of them is ever joined; dead shards report none
+        return [
+            dict(room, shard=index)
+            for index, rooms in self.status.items()
+            for room in rooms
+            if room["room"] != DEFAULT_ROOM or index == owner
+        ]
+
+    async def relay(self, link):
+        """ Deliver everything a shard sends back to the real connections """
+        try:
+            await self._relay(link)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            print(f"❌ Lost shard {link.index}, closing its connections")
+            self.drop(link)
+
+    def drop(self, link):
+        """ Stop routing to a dead shard and close the connections it was serving """
+        link.alive = False
+        self.status[link.index] = []
+        registry.remote.pop(link.index, None)
+        for ws, serving in list(self.sockets.values()):
+            if serving is link:
+                # Unregistering closes the WebSocket, which ends its ws_handler
+                self.clients.unregister(ws)
+        for writer, serving in list(self.fpga.values()):
+            if serving is link:
+                writer.close()
+
+    async def _relay(self, link):
+        while True:
+            kind, conn, flags, payload = await read_frame(link.reader)
+            if kind == SEND:
+                entry = self.sockets.get(conn)
+                if entry and entry[1] is link:
+                    msg = payload if flags & BINARY else payload.decode()
+                    self.clients.send(entry[0], msg, bool(flags & STATE))
+            elif kind == FPGA_WRITE:
+                entry = self.fpga.get(conn)
+                if entry and entry[1] is link:
+                    entry[0].write(payload)
+            elif kind == STATUS:
+                self.status[link.index] = json.loads(payload)
+                async with self.status_changed:
+                    self.status_changed.notify_all()
+            elif kind == METRICS:
+                # Served by the front's /metrics with a shard label
+                registry.remote[link.index] = json.loads(payload)
+            elif kind == TRACES:
+                # Merged into the front's /latency, or alone with ?shard=
+                tracer.remote[link.index] = json.loads(payload)
+            elif kind == CLOSE:
+                entry = self.sockets.get(conn)
+                if entry and entry[1] is link:
+                    self.clients.unregister(entry[0])
+            elif kind == FPGA_END:
+                entry = self.fpga.get(conn)
+                if entry and entry[1] is link:
+                    entry[0].close()
+
+    async def ws_handler(self, ws):
+        conn = self._conn_id()
+        address = str(ws.remote_address).encode()
+        try:
+            link = self.shard_for(DEFAULT_ROOM)
+        except ConnectionError as e:
+            print(f"❌ {e}, turning the browser away")
+            await ws.close()
+            return
+        self.clients.register(ws)
+        self.sockets[conn] = (ws, link)
+        link.send(WS_OPEN, conn, address)
+        try:
+            async for message in ws:
+                if isinstance(message, bytes):
+                    message = message.decode()
+
+                data = json.loads(message)
+                if data.get("type") == "get_rooms":
+                    self.clients.send(ws, json.dumps({"type": "rooms", "rooms": self.rooms()}))
+                    continue
+
+                if "room" in data and self.shard_for(str(data["room"])) is not link:
+                    link.send(WS_CLOSE, conn)
+                    link = self.shard_for(str(data["room"]))
+                    self.sockets[conn] = (ws, link)
+                    link.send(WS_OPEN, conn, address)
+
+                link.send(WS_MESSAGE, conn, message.encode())
+                await link.drain()
+        except Exception as e:
+            print(f"Error processing message: {e}")
+        finally:
+            link.send(WS_CLOSE, conn)
+            self.sockets.pop(conn, None)
+            self.clients.unregister(ws)
+
+    async def fpga_handler(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            configure_socket(sock)
+
+        conn = self._conn_id()
+        try:
+            link = await self.shard_for_fpga()
+        except ConnectionError as e:
+            print(f"❌ {e}, turning the FPGA gateway away")
+            writer.close()
+            return
+        self.fpga[conn] = (writer, link)
+        link.send(FPGA_OPEN, conn, str(writer.get_extra_info("peername")).encode())
+        try:
+            while not writer.is_closing():
+                data = await reader.read(FPGA_READ_BUFFER)
+                if not data:
+                    break
+                link.send(FPGA_DATA, conn, data)
+                # Backpressure: stop reading the gateway while the shard link is congested
+                await link.drain()
+        except Exception as e:
+            print(f"Error relaying FPGA connection: {e}")
+        finally:
+            link.send(FPGA_CLOSE, conn)
+            self.fpga.pop(conn, None)
+            writer.close()
+
+
+async def run_front(paths, host="0.0.0.0"):
+    leaderboard.max_age = SHARD_LEADERBOARD_MAX_AGE
+    links = [ShardLink(index, path) for index, path in enumerate(paths)]
+    for link in links:
+        await link.connect()
+    front = Front(links)
+    relays = [asyncio.create_task(front.relay(link)) for link in links]
+
+    tcp_server = await asyncio.start_server(
+        front.fpga_handler, host, TCP_PORT, reuse_address=True, limit=FPGA_READ_BUFFER
+    )
+    async with serve(front.ws_handler, host, WS_PORT), tcp_server:
+        print(f"[Front] WebSocket on port {WS_PORT}, TCP on port {TCP_PORT}, {len(links)} shards")
+        try:
+            await asyncio.gather(tcp_server.serve_forever(), *relays)
+        finally:
+            for path in paths:
+                if os.path.exists(path):
+                    os.unlink(path)
@@ -0,0 +1,306 @@
+"""
+Play many headless matches with scripted bots, for balancing game modes.
+
+Every match is a HeadlessMatch (headless.py) driven by one bot per player.
+Player i plays at skill --skill[i % len(--skill)], from 0 (slow, sloppy)
+to 1 (instant, precise), so one run compares skill levels side by side:
+
+  Coin Cascade    walks to the coin that will land first within reach
+  Bullet Barrage  jumps when the next spike is about to reach the player
+  Disco Dash      presses each arrow's key around its hit time
+
+Game constants can be overridden per run, by module and name:
+
+  --set coin_game.MIN_COINS=5                     every match uses 5
+  --grid spikeball_game.SPIKE_SPEED_MIN=0.005,0.01  one batch of matches per value
+
+Several --grid options run every combination; dict and list values work
+too, e.g. --grid "game_manager.MODE_TICK_RATES={},{'Bullet Barrage': 0.0333}". Names are looked up in
+game_modes first, then among the server modules (e.g. motion.JUMP_STRENGTH).
+Constants computed from others at import (arrow_game.TRAVEL_TIME) do not
+follow their inputs. Matches run on the dict backend across a process pool
+and the same --seed plays the same matches.
+
+Run from backend/server:
+    python simulate.py --mode "Coin Cascade" --matches 2000 --skill 0.3 --skill 0.9 \\
+        --grid coin_game.COIN_GRAVITY_MIN=0.003,0.005,0.01 [--workers 8] [--json]
+"""
+import argparse
+import ast
+import importlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+MODES = ("Coin Cascade", "Bullet Barrage", "Disco Dash")
+
+
+class CoinBot:
+    """ Walks under the coin that will land first among those it can still reach """
+
+    def __init__(self, pid, skill, rng):
+        self.pid = pid
+        self.rng = rng
+        self.reaction = 0.05 + (1 - skill) * 0.45  # seconds between decisions
+        self.aim = (1 - skill) * 0.25  # how far off the coin it stands
+        self.next_decision = 0.0
+        self.target = None
+        self.direction = "N"
+
+    def __call__(self, match):
+        from motion import FRAME_RATE, LATERAL_SPEED
+
+        pos = match.game.player_positions[self.pid]
+        if match.now >= self.next_decision:
+            self.next_decision = match.now + self.reaction
+            speed = LATERAL_SPEED * FRAME_RATE
+            reachable = [
+                coin for coin in match.game.objects
+                if coin["type"] == "coin" and abs(coin["x"] - pos["x"]) / speed < self._time_to_land(coin)
+            ]
+            coin = min(reachable, key=self._time_to_land, default=None)
+            self.target = coin["x"] + self.rng.uniform(-self.aim, self.aim) if coin else None
+
+        if self.target is None or abs(self.target - pos["x"]) < 0.05:
+            direction = "N"
+        else:
+            direction = "R" if self.target > pos["x"] else "L"
+        if direction != self.direction:
+            self.direction = direction
+            match.press(self.pid, direction)
+
+    @staticmethod
+    def _time_to_land(coin):
+        # A coin spawned at y=1 has fallen 15 * gravity * t^2 after t seconds at 60 ticks per
+        # second; it can be collected once it is within reach of a standing player (y=-0.4)
+        rate = math.sqrt(15 * coin["gravity"])
+        return (math.sqrt(1.4) - math.sqrt(max(1 - coin["y"], 0.0))) / rate
+
+
+class SpikeBot:
+    """ Jumps when the nearest incoming spike is a fixed time away, give or take its timing error """
+
+    JUMP_LEAD = 0.25  # seconds before a spike arrives to take off; roughly the jump's peak
+
+    def __init__(self, pid, skill, rng):
+        self.pid = pid
+        self.rng = rng
+        self.jitter = (1 - skill) * 0.2
+        self.last_x = {}
+        self.lead = {}  # spike id -> when this bot jumps for it, drawn once so the tick rate does not matter
+        self.jumped = set()
+
+    def __call__(self, match):
+        pos = match.game.player_positions[self.pid]
+        last_x, self.last_x = self.last_x, {}
+        for spike in match.game.objects:
+            if spike["type"] != "spike":
+                continue
+            self.last_x[spike["id"]] = spike["x"]
+            previous = last_x.get(spike["id"])
+            if spike["id"] in self.jumped or previous is None or spike["x"] < pos["x"]:
+                continue
+            speed = (previous - spike["x"]) / match.tick_rate
+            if speed <= 0:
+                continue
+            lead = self.lead.get(spike["id"])
+            if lead is None:
+                lead = self.lead[spike["id"]] = self.JUMP_LEAD + self.rng.gauss(0, self.jitter)
+            if (spike["x"] - pos["x"]) / speed <= lead:
+                self.jumped.add(spike["id"])
+                match.press(self.pid, "J")
+        self.jumped &= set(self.last_x)
+        self.lead = {spike_id: lead for spike_id, lead in self.lead.items() if spike_id in self.last_x}
+
+
+class ArrowBot:
+    """ Presses each arrow's key near its hit time, sometimes not at all """
+
+    KEYS = {"ArrowUp": "J", "ArrowLeft": "L", "ArrowRight": "R", "Button": "B2"}
+
+    def __init__(self, pid, skill, rng):
+        self.pid = pid
+        self.rng = rng
+        self.jitter = (1 - skill) * 0.25
+        self.skip = (1 - skill) * 0.3  # chance of not reacting to an arrow
+        self.planned = {}  # arrow id -> press time, None to let it pass
+
+    def __call__(self, match):
+        from game_modes.arrow_game import TRAVEL_TIME
+
+        for arrow in match.game.objects:
+            if arrow["id"] in self.planned or arrow["type"] not in self.KEYS:
+                continue
+            skipped = self.rng.random() < self.skip
+            self.planned[arrow["id"]] = None if skipped else (
+                arrow["spawnedAt"] + TRAVEL_TIME + self.rng.gauss(0, self.jitter)
+            )
+
+        for arrow in match.game.objects:
+            at = self.planned.get(arrow["id"])
+            if at is not None and match.now >= at:
+                self.planned[arrow["id"]] = None
+                match.press(self.pid, self.KEYS[arrow["type"]])
+
+
+BOTS = {"Coin Cascade": CoinBot, "Bullet Barrage": SpikeBot, "Disco Dash": ArrowBot}
+
+
+def parse_value(text):
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
+def parse_values(text):
+    """ Comma-separated values; commas inside a dict or list value do not split it """
+    try:
+        return list(ast.literal_eval(f"({text},)"))
+    except (ValueError, SyntaxError):
+        return [parse_value(value) for value in text.split(",")]
+
+
+def parse_assignment(text):
+    name, _, values = text.partition("=")
+    if "." not in name or not values:
+        raise argparse.ArgumentTypeError(f"expected module.CONSTANT=value, got {text!r}")
+    return name, values
+
+
+def resolve(name):
+    module_name, _, attr = name.rpartition(".")
+    for candidate in (f"game_modes.{module_name}", module_name):
+        try:
+            module = importlib.import_module(candidate)
+        except ImportError:
+            continue
+        if hasattr(module, attr):
+            return module, attr
+    raise SystemExit(f"❌ Unknown constant {name}")
+
+
+_defaults = {}  # per worker: (module, attr) -> value before any override
+
+
+def apply_params(params):
+    """ Reset every constant a previous job touched, then apply this job's overrides """
+    for (module, attr), value in _defaults.items():
+        setattr(module, attr, value)
+    for name, value in params.items():
+        module, attr = resolve(name)
+        _defaults.setdefault((module, attr), getattr(module, attr))
+        setattr(module, attr, value)
+
+
+def play(job):
+    """ One match in a worker; returns per player (skill, score, event counts) """
+    from headless import HeadlessMatch
+
+    mode, params, seed, skills, seconds = job
+    apply_params(dict(params))
+    match = HeadlessMatch(mode, players=len(skills), seed=seed)
+    bots = [BOTS[mode](pid, skill, random.Random(f"{seed}-{pid}")) for pid, skill in enumerate(skills, start=1)]
+
+    def control(match):
+        for bot in bots:
+            bot(match)
+
+    match.run(seconds, control)
+    match.close()
+    scores = match.scores()
+    return params, mode, [(skill, scores[pid], dict(match.events(pid))) for pid, skill in enumerate(skills, start=1)]
+
+
+def param_sets(args):
+    base = {name: parse_value(value) for name, value in args.set or ()}
+    grid = [[(name, value) for value in parse_values(values)] for name, values in args.grid or ()]
+    for combination in itertools.product(*grid):
+        yield tuple(sorted({**base, **dict(combination)}.items()))
+
+
+def summarize(results):
+    groups = defaultdict(lambda: {"scores": [], "events": Counter()})
+    for params, mode, players in results:
+        for skill, score, events in players:
+            # repr because override values can be dicts or lists
+            group = groups[repr(params), mode, skill]
+            group["params"] = params
+            group["scores"].append(score)
+            group["events"].update(events)
+
+    rows = []
+    for (_, mode, skill), group in sorted(groups.items()):
+        scores = group["scores"]
+        rows.append({
+            "params": dict(group["params"]),
+            "mode": mode,
+            "skill": skill,
+            "samples": len(scores),
+            "mean": statistics.fmean(scores),
+            "stdev": statistics.stdev(scores) if len(scores) > 1 else 0.0,
+            "min": min(scores),
+            "max": max(scores),
+            # Per player per match
+            "events": {kind: count / len(scores) for kind, count in sorted(group["events"].items())},
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", action="append", choices=MODES, help="repeatable, default: all")
+    parser.add_argument("--matches", type=int, default=200, help="per mode and parameter set")
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of each match")
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--skill", action="append", type=float, help="repeatable, default: 0.5")
+    parser.add_argument("--set", action="append", type=parse_assignment, metavar="MODULE.CONST=VALUE")
+    parser.add_argument("--grid", action="append", type=parse_assignment, metavar="MODULE.CONST=V1,V2,...")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    modes = args.mode or list(MODES)
+    skills = args.skill or [0.5]
+    players = [skills[i % len(skills)] for i in range(args.players)]
+    sets = list(param_sets(args))
+    for params in sets:
+        # Fail on a typo here rather than in every worker
+        for name, _ in params:
+            resolve(name)
+
+    jobs = [
+        (mode, params, args.seed + i, players, args.seconds)
+        for params in sets for mode in modes for i in range(args.matches)
+    ]
+    started = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(args.workers) as pool:
+        results = list(pool.imap_unordered(play, jobs, chunksize=max(1, len(jobs) // (args.workers * 8))))
+    elapsed = time.perf_counter() - started
+    rows = summarize(results)
+
+    if args.json:
+        print(json.dumps({"matches": len(jobs), "seconds": elapsed, "results": rows}, indent=2))
+        return
+
+    played = len(jobs) * args.seconds
+    print(f"{len(jobs)} matches ({played / 60:.0f} min of play) in {elapsed:.1f} s on {args.workers} workers")
+    for row in rows:
+        params = " ".join(f"{name}={value}" for name, value in row["params"].items()) or "defaults"
+        events = " ".join(f"{kind}={count:.1f}" for kind, count in row["events"].items())
+        print(
+            f"{row['mode']:<16}skill {row['skill']:<5}{params:<40}"
+            f"score {row['mean']:>7.2f} ± {row['stdev']:<6.2f}[{row['min']}, {row['max']}]  {events}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import math
+
+
+class UniformGrid:
+    """
+    Uniform grid over player positions, rebuilt every tick. With the cell size
+    equal to the query radius, a query only looks at the 3x3 cells around the
+    point, so collision checks cost roughly O(objects + players).
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.reach = 0.0  # longest move of a player since its previous position
+
+    @classmethod
+    def from_positions(cls, positions, cell_size, previous=None):
+        """
+        positions: {pid: {"x", "y", ...}}; dict order is kept as query order.
+        previous: {pid: (x, y)} where players were at the last tick, for within_segment.
+        """
+        grid = cls(cell_size)
+        previous = previous or {}
+        for order, (pid, pos) in enumerate(positions.items()):
+            grid.insert(order, pid, pos["x"], pos["y"], *previous.get(pid, (pos["x"], pos["y"])))
+        return grid
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, order, key, x, y, from_x=None, from_y=None):
+        from_x = x if from_x is None else from_x
+        from_y = y if from_y is None else from_y
+        self.reach = max(self.reach, abs(x - from_x), abs(y - from_y))
+        self.cells.setdefault(self._cell(x, y), []).append((order, key, x, y, from_x, from_y))
+
+    def within(self, x, y, radius):
+        """ Keys closer than radius to (x, y), in insertion order """
+        radius_sq = radius * radius
+        span = max(1, math.ceil(radius / self.cell_size))
+        cx, cy = self._cell(x, y)
+        found = []
+        for ix in range(cx - span, cx + span + 1):
+            for iy in range(cy - span, cy + span + 1):
+                for order, key, px, py, _, _ in self.cells.get((ix, iy), ()):
+                    if (px - x) ** 2 + (py - y) ** 2 < radius_sq:
+                        found.append((order, key))
+        found.sort()
+        return [key for _, key in found]
+
+    def first_within(self, x, y, radius):
+        found = self.within(x, y, radius)
+        return found[0] if found else None
+
+    def within_segment(self, x0, y0, x1, y1, radius):
+        """
+        Keys that came closer than radius to an object moving from (x0, y0)
+        to (x1, y1) during the tick while each player moved from its previous
+        position to its current one, in insertion order. Both paths are swept,
+        so a longer tick cannot step an object over a player or a jump over
+        an object.
+        """
+        radius_sq = radius * radius
+        margin = radius + self.reach
+        lo_x, lo_y = self._cell(min(x0, x1) - margin, min(y0, y1) - margin)
+        hi_x, hi_y = self._cell(max(x0, x1) + margin, max(y0, y1) + margin)
+        found = []
+        for ix in range(lo_x, hi_x + 1):
+            for iy in range(lo_y, hi_y + 1):
+                for order, key, px, py, qx, qy in self.cells.get((ix, iy), ()):
+                    if segment_distance_sq(x0 - qx, y0 - qy, x1 - px, y1 - py) < radius_sq:
+                        found.append((order, key))
+        found.sort()
+        return [key for _, key in found]
+
+    def first_within_segment(self, x0, y0, x1, y1, radius):
+        found = self.within_segment(x0, y0, x1, y1, radius)
+        return found[0] if found else None
+
+
+def segment_distance_sq(ax, ay, bx, by):
+    """
+    Squared distance from the origin to the segment from (ax, ay) to (bx, by).
+    With the object's start and end relative to the player's, this is how
+    close the two came over the tick, both moving linearly.
+    """
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    t = max(0.0, min(1.0, -(ax * dx + ay * dy) / length_sq)) if length_sq else 0.0
+    return (ax + t * dx) ** 2 + (ay + t * dy) ** 2
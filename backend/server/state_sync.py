@@ -0,0 +1,149 @@
+from collections import OrderedDict
+from config import KEYFRAME_INTERVAL, DELTA_HISTORY
+
+
+def snapshot_objects(objects):
+    # Game modes mutate some objects in place (arrow hitBy lists), so copy lists too
+    return {
+        obj["id"]: {k: (list(v) if isinstance(v, list) else v) for k, v in obj.items()}
+        for obj in objects
+    }
+
+
+def diff_objects(base, current, derived=frozenset()):
+    spawned = [obj for obj_id, obj in current.items() if obj_id not in base]
+    removed = [obj_id for obj_id in base if obj_id not in current]
+    changed = {}
+
+    for obj_id, obj in current.items():
+        old = base.get(obj_id)
+        if old is None:
+            continue
+        fields = {k: v for k, v in obj.items() if k not in derived and old.get(k) != v}
+        for k in old:
+            if k not in obj:
+                fields[k] = None
+        if fields:
+            changed[obj_id] = fields
+
+    return spawned, removed, changed
+
+
+def with_traces(frame, state):
+    # Trace ids of the FPGA events this tick consumed, so browsers can report when they showed them
+    if state.get("traces"):
+        frame["traces"] = state["traces"]
+    return frame
+
+
+def diff_scores(base, current):
+    return {pid: score for pid, score in current.items() if base.get(pid) != score}
+
+
+class StateSync:
+    """
+    Snapshot/delta protocol for gameStateUpdate.
+
+    Every tick gets a sequence number and its snapshot is kept for the last
+    DELTA_HISTORY ticks. Clients that opt in with a state_sync message receive
+    diffs against the last sequence they acknowledged with state_ack; everyone
+    else (and any client whose baseline has expired) gets the full keyframe.
+    A keyframe is also sent to all clients every KEYFRAME_INTERVAL ticks.
+
+    derived_fields maps a mode to object fields that clients recompute from the
+    frame timestamp themselves; those are never sent as changes.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL, history=DELTA_HISTORY, derived_fields=None):
+        self.keyframe_interval = keyframe_interval
+        self.derived_fields = derived_fields or {}
+        self.history_size = history
+        self.seq = 0
+        self.history = OrderedDict()  # seq -> {"mode", "objects", "scores"}
+        self.baselines = {}  # ws -> acknowledged seq (None until the first ack)
+
+    def subscribe(self, ws):
+        self.baselines.setdefault(ws, None)
+
+    def unsubscribe(self, ws):
+        self.baselines.pop(ws, None)
+
+    def ack(self, ws, seq):
+        if ws not in self.baselines or seq not in self.history:
+            return
+        acked = self.baselines[ws]
+        if acked is None or seq > acked:
+            self.baselines[ws] = seq
+
+    def resync(self, ws):
+        if ws in self.baselines:
+            self.baselines[ws] = None
+
+    def _record(self, state):
+        self.seq += 1
+        self.history[self.seq] = {
+            "mode": state["mode"],
+            "objects": snapshot_objects(state["objects"]),
+            "scores": dict(state["scores"]),
+        }
+        while len(self.history) > self.history_size:
+            self.history.popitem(last=False)
+
+    def _keyframe(self, state):
+        return with_traces({
+            "type": "gameStateUpdate",
+            "mode": state["mode"],
+            "objects": state["objects"],
+            "scores": state["scores"],
+            "timestamp": state["timestamp"],
+            "seq": self.seq,
+            "keyframe": True
+        }, state)
+
+    def _delta(self, base_seq, state):
+        base = self.history[base_seq]
+        current = self.history[self.seq]
+        derived = self.derived_fields.get(state["mode"], frozenset())
+        spawned, removed, changed = diff_objects(base["objects"], current["objects"], derived)
+        return with_traces({
+            "type": "gameStateDelta",
+            "mode": state["mode"],
+            "seq": self.seq,
+            "baseSeq": base_seq,
+            "spawned": spawned,
+            "removed": removed,
+            "changed": changed,
+            "scores": diff_scores(base["scores"], current["scores"]),
+            "timestamp": state["timestamp"]
+        }, state)
+
+    def frames(self, state, clients):
+        """
+        Record this tick and group clients by the frame they should receive,
+        so each distinct frame is only encoded once. Returns a list of
+        (frame, [ws, ...]) pairs.
+        """
+        self._record(state)
+        periodic = self.seq % self.keyframe_interval == 0
+
+        keyframe_targets = []
+        by_base = {}
+        for ws in clients:
+            base_seq = self.baselines.get(ws)
+            usable = (
+                not periodic
+                and base_seq is not None
+                and base_seq in self.history
+                and self.history[base_seq]["mode"] == state["mode"]
+            )
+            if usable:
+                by_base.setdefault(base_seq, []).append(ws)
+            else:
+                keyframe_targets.append(ws)
+
+        groups = []
+        if keyframe_targets:
+            groups.append((self._keyframe(state), keyframe_targets))
+        for base_seq, targets in by_base.items():
+            groups.append((self._delta(base_seq, state), targets))
+        return groups
@@ -0,0 +1,150 @@
+import math
+import time
+from collections import OrderedDict
+from itertools import count
+from config import TRACE_OPEN_LIMIT
+
+# Stages an FPGA event goes through, each measured from the previous one:
+#
+#   gateway   pressed on the gateway (synced device clock) -> bytes parsed on the server
+#   queue     parsed -> handed to the GameManager
+#   input     handed over -> consumed by a tick
+#   tick      consumed -> the gameStateUpdate reflecting it is published
+#   display   published -> shown by a browser (when it sends trace_ack)
+#
+# "server" is pressed (or parsed, without clock sync) -> published and
+# "total" is pressed -> displayed, the full motion-to-photon latency.
+STAGES = ("gateway", "queue", "input", "tick", "display", "server", "total")
+
+
+class LatencyHistogram:
+    """
+    Fixed log-spaced buckets from 10 us to about 100 s, each about 5% wide:
+    recording is one log and one increment, and percentiles are read off the
+    cumulative counts to within a bucket.
+    """
+
+    LOW_MS = 0.01
+    GROWTH = 1.05
+    BUCKETS = 330
+
+    def __init__(self):
+        self.counts = [0] * (self.BUCKETS + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._scale = 1 / math.log(self.GROWTH)
+
+    def record(self, ms):
+        if ms <= self.LOW_MS:
+            index = 0
+        else:
+            index = min(int(math.log(ms / self.LOW_MS) * self._scale) + 1, self.BUCKETS)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket in enumerate(self.counts):
+            seen += bucket
+            if seen >= target:
+                # Upper edge of the bucket, never more than the largest sample
+                return min(self.LOW_MS * self.GROWTH ** index, self.max)
+        return self.max
+
+    def state(self):
+        """ The raw counts, sparse, for merging into another histogram """
+        return {
+            "buckets": [[index, bucket] for index, bucket in enumerate(self.counts) if bucket],
+            "count": self.count,
+            "total": self.total,
+            "max": self.max,
+        }
+
+    def merge(self, state):
+        for index, bucket in state["buckets"]:
+            self.counts[index] += bucket
+        self.count += state["count"]
+        self.total += state["total"]
+        self.max = max(self.max, state["max"])
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "meanMs": self.total / self.count if self.count else 0.0,
+            "p50Ms": self.percentile(0.5),
+            "p95Ms": self.percentile(0.95),
+            "p99Ms": self.percentile(0.99),
+            "maxMs": self.max,
+        }
+
+
+class Tracer:
+    """ Follows FPGA events by trace id and records the time spent in each stage """
+
+    def __init__(self, open_limit=TRACE_OPEN_LIMIT):
+        self.open_limit = open_limit
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.open = OrderedDict()  # trace id -> [first time, last time]
+        self.ids = count(1)
+        self.remote = {}  # shard index -> histogram states reported by that shard
+
+    def record(self, stage, ms):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.record(ms)
+
+    def start(self, event):
+        """ Give a freshly parsed event a trace id """
+        trace_id = event["traceId"] = next(self.ids)
+        self.open[trace_id] = [event["receivedAt"], event["receivedAt"]]
+        if len(self.open) > self.open_limit:
+            self.open.popitem(last=False)
+        return trace_id
+
+    def pressed(self, trace_id, pressed_at):
+        """ The gateway's own timestamp, once its clock is synced """
+        times = self.open.get(trace_id)
+        if times:
+            self.record("gateway", (times[1] - pressed_at) * 1000)
+            times[0] = pressed_at
+
+    def mark(self, trace_id, stage, at=None, overall=None):
+        times = self.open.get(trace_id)
+        if times is None:
+            return
+        at = time.time() if at is None else at
+        self.record(stage, (at - times[1]) * 1000)
+        times[1] = at
+        if overall:
+            self.record(overall, (at - times[0]) * 1000)
+
+    def displayed(self, trace_id, at):
+        """ First browser to show the event closes the trace """
+        self.mark(trace_id, "display", at, "total")
+        self.open.pop(trace_id, None)
+
+    def state(self):
+        # Called from the Flask thread too; list() so a new stage cannot break the iteration
+        return {stage: histogram.state() for stage, histogram in list(self.histograms.items())}
+
+    def snapshot(self, shard=None):
+        """ Percentiles over this process and every shard, or over one shard only """
+        if shard is None and not self.remote:
+            return {stage: histogram.snapshot() for stage, histogram in list(self.histograms.items())}
+        sources = [self.state(), *list(self.remote.values())] if shard is None else [self.remote.get(shard, {})]
+        merged = {}
+        for states in sources:
+            for stage, state in states.items():
+                merged.setdefault(stage, LatencyHistogram()).merge(state)
+        return {stage: histogram.snapshot() for stage, histogram in merged.items()}
+
+
+tracer = Tracer()
@@ -1,20 +1,34 @@
+import asyncio
 import json
 import time
 from websockets.server import serve
-from db import get_scores
-from config import WS_PORT
+from db import run_db
+from leaderboard import leaderboard
+from config import WS_PORT, DEFAULT_ROOM, CLOCK_SYNC_INTERVAL, CLOCK_SYNC_BURST, CLOCK_SYNC_BURST_INTERVAL
+from clock_sync import ClockSync
+from recorder import RECORDED_MESSAGES
+from tracing import tracer
+from fanout import FanOut, STATE_FRAME_TYPES
+from metrics import BROADCAST_SECONDS
+from wire import ENCODINGS, MODES, OBJECT_TYPES, FIELDS
 
-clients = set()
+clients = FanOut()
+clocks = {}  # ws -> ClockSync of that browser
 
-async def broadcast(data):
+async def broadcast(data, room=None):
+    """ Send to the subscribers of room (a GameManager), or to every client """
     msg = json.dumps(data)
-    for ws in list(clients):
-        if not ws.closed:
-            try:
-                await ws.send(msg)
-            except Exception as e:
-                print(f"Error sending message: {e}")
-                clients.discard(ws)
+    targets = None if room is None else room.subscribers
+    clients.publish(msg, targets, droppable=data.get("type") in STATE_FRAME_TYPES)
+
+
+async def broadcast_state(game_manager, state):
+    started = time.perf_counter()
+    codec = game_manager.codec
+    for frame, targets in game_manager.state_sync.frames(state, list(game_manager.subscribers)):
+        for encoding, group in clients.by_encoding(targets).items():
+            clients.publish(codec.encode(frame, encoding), group, droppable=True)
+    BROADCAST_SECONDS.observe(time.perf_counter() - started)
 
 
 def handle_init_message(data, game_manager, ws):
@@ -30,9 +44,9 @@ def handle_init_message(data, game_manager, ws):
 def handle_game_selection_message(data, game_manager):
     # print(f"Received game selection message from player {data.get('player')}: {data}")
 
-    game_manager.mode = data["mode"]
-    game_manager.start_time = time.time()
-    game_manager.objects.clear()
+    if game_manager.mode:
+        game_manager.end_match()
+    game_manager.start_match(data["mode"])
 
     return {
         "type": "startGame",
@@ -41,71 +55,232 @@ def handle_game_selection_message(data, game_manager):
     }
 
 
-def handle_player_position_message(data, game_manager):
+def server_time(ws, client_time):
+    """ A client timestamp in seconds on the server clock (unchanged until that client is synced) """
+    clock = clocks.get(ws)
+    return clock.to_server(client_time) if clock else client_time
+
+
+def handle_player_position_message(data, game_manager, ws):
     # print(f"Received player position message: {data}")  # Debugging: Check what data is received
     pos = data["position"]
     sent_at = data.get("sentAt")
+    if sent_at:
+        sent_at = server_time(ws, sent_at / 1000) * 1000
+    if ws in clocks:
+        game_manager.clocks[data["player"]] = clocks[ws]
     game_manager.player_positions[data["player"]] = {
         "x": pos["x"],
         "y": pos["y"],
         "sentAt": sent_at
     }
+    game_manager.lag.record_position(data["player"], pos["x"], pos["y"], game_manager.env.clock(), sent_at)
     return None
 
 
-def handle_player_input_message(data, game_manager):
+def handle_player_input_message(data, game_manager, ws):
     # print(f"Received player input message: {data}")  # Debugging: Check what data is received
+    if data["player"] in game_manager.fpga_players:
+        # Already judged from the FPGA event itself; this is the browser echoing it back
+        return None
     game_manager.player_input_queue.append({
         "player": data["player"],
         "action": data["action"],
-        "timestamp": data["timestamp"]
+        "timestamp": server_time(ws, data["timestamp"])
     })
     return None
 
 
-def handle_get_scores_message():
+def handle_state_sync_message(data, game_manager, ws):
+    if data.get("delta", True):
+        game_manager.state_sync.subscribe(ws)
+    else:
+        game_manager.state_sync.unsubscribe(ws)
+    return None
+
+
+def handle_state_ack_message(data, game_manager, ws):
+    game_manager.state_sync.ack(ws, data["seq"])
+    return None
+
+
+def handle_state_resync_message(game_manager, ws):
+    game_manager.state_sync.resync(ws)
+    return None
+
+
+def handle_set_encoding_message(data, ws):
+    encoding = data.get("encoding", "json")
+    if encoding not in ENCODINGS:
+        encoding = "json"
+    clients.set_encoding(ws, encoding)
+    return {
+        "type": "encoding_ack",
+        "encoding": encoding,
+        "modes": MODES,
+        "objectTypes": OBJECT_TYPES,
+        "fields": [name for name, _ in FIELDS]
+    }
+
+
+async def handle_get_scores_message(data):
     # print("Received get scores message")  # Debugging: Check if message is received
-    return {"type": "score_data", "scores": get_scores()}
+    scores = await run_db(leaderboard.page, data.get("limit"), data.get("offset", 0))
+    return {"type": "score_data", "scores": scores, "offset": data.get("offset", 0)}
+
+
+async def handle_get_rank_message(data):
+    username = data.get("username")
+    rank = await run_db(leaderboard.rank, username)
+    return {"type": "rank_data", "username": username, **(rank or {"rank": None, "score": None})}
+
+
+def handle_get_tick_stats_message(game_manager):
+    return {"type": "tick_stats", "stats": game_manager.tick_stats()}
+
+
+def handle_get_broadcast_stats_message():
+    return {"type": "broadcast_stats", "clients": clients.stats()}
+
+
+def handle_get_wire_stats_message(game_manager):
+    return {"type": "wire_stats", "stats": game_manager.codec.stats.snapshot()}
+
+
+def handle_clock_pong_message(data, ws):
+    clock = clocks.get(ws)
+    if clock:
+        clock.pong(data.get("id"), data["t1"] / 1000, data["t2"] / 1000, time.time())
+    return None
+
+
+def handle_clock_sync_message(data):
+    # The browser's own estimate of the server clock (it computes offset/RTT like we do)
+    received = time.time() * 1000
+    return {"type": "clock_sync_reply", "t0": data.get("t0"), "t1": received, "t2": time.time() * 1000}
+
+
+def handle_trace_ack_message(data, ws):
+    displayed_at = server_time(ws, data["displayedAt"] / 1000)
+    for trace_id in data.get("traces", []):
+        tracer.displayed(trace_id, displayed_at)
+    return None
+
+
+def handle_get_clock_stats_message(game_manager):
+    return {"type": "clock_stats", "stats": game_manager.clock_stats()}
+
+
+def handle_get_lag_stats_message(game_manager):
+    return {"type": "lag_stats", "stats": game_manager.lag.stats()}
 
 
 async def handle_message(data, game_manager, ws):
     msg_type = data.get("type")
     # print(f"Received message type: {msg_type}, data: {data}")  # Debugging
+    if game_manager.recorder and msg_type in RECORDED_MESSAGES:
+        game_manager.recorder.message(game_manager.env.clock(), data, clocks.get(ws))
 
     if msg_type == "init":
         return handle_init_message(data, game_manager, ws)
     elif msg_type == "game_selection":
         return handle_game_selection_message(data, game_manager)
     elif msg_type == "player_position":
-        return handle_player_position_message(data, game_manager)
+        return handle_player_position_message(data, game_manager, ws)
     elif msg_type == "player_input":
-        return handle_player_input_message(data, game_manager)
+        return handle_player_input_message(data, game_manager, ws)
+    elif msg_type == "state_sync":
+        return handle_state_sync_message(data, game_manager, ws)
+    elif msg_type == "state_ack":
+        return handle_state_ack_message(data, game_manager, ws)
+    elif msg_type == "state_resync":
+        return handle_state_resync_message(game_manager, ws)
+    elif msg_type == "set_encoding":
+        return handle_set_encoding_message(data, ws)
     elif msg_type == "get_scores":
-        return handle_get_scores_message()
+        return await handle_get_scores_message(data)
+    elif msg_type == "get_rank":
+        return await handle_get_rank_message(data)
+    elif msg_type == "get_tick_stats":
+        return handle_get_tick_stats_message(game_manager)
+    elif msg_type == "get_broadcast_stats":
+        return handle_get_broadcast_stats_message()
+    elif msg_type == "get_wire_stats":
+        return handle_get_wire_stats_message(game_manager)
+    elif msg_type == "clock_pong":
+        return handle_clock_pong_message(data, ws)
+    elif msg_type == "clock_sync":
+        return handle_clock_sync_message(data)
+    elif msg_type == "trace_ack":
+        return handle_trace_ack_message(data, ws)
+    elif msg_type == "get_latency_stats":
+        return {"type": "latency_stats", "stats": tracer.snapshot()}
+    elif msg_type == "get_clock_stats":
+        return handle_get_clock_stats_message(game_manager)
+    elif msg_type == "get_lag_stats":
+        return handle_get_lag_stats_message(game_manager)
     return None
 
 
-async def handler(ws, game_manager):
-    clients.add(ws)
+def switch_room(rooms, game_manager, room_id, ws):
+    if room_id == game_manager.room_id:
+        return game_manager, {"type": "room_joined", "room": room_id}
+    room = rooms.join(room_id, ws)
+    if room is None:
+        return game_manager, {"type": "room_error", "room": room_id, "error": "Too many rooms"}
+    rooms.leave(game_manager, ws)
+    return room, {"type": "room_joined", "room": room_id}
+
+
+async def ping_clock(ws, clock):
+    """ Server-initiated clock pings; the browser answers with clock_pong """
+    sent = 0
+    while True:
+        await asyncio.sleep(CLOCK_SYNC_BURST_INTERVAL if sent < CLOCK_SYNC_BURST else CLOCK_SYNC_INTERVAL)
+        now = time.time()
+        clients.send(ws, json.dumps({"type": "clock_ping", "id": clock.ping(now), "t0": now * 1000}))
+        sent += 1
+
+
+async def handler(ws, rooms):
+    clients.register(ws)
+    clock = clocks[ws] = ClockSync()
+    pinger = asyncio.create_task(ping_clock(ws, clock))
+    game_manager = rooms.join(DEFAULT_ROOM, ws)
     try:
         async for message in ws:
             data = json.loads(message)
-            response = await handle_message(data, game_manager, ws)
+            msg_type = data.get("type")
+
+            # Any message may name its room; join_room only switches
+            if "room" in data:
+                game_manager, joined = switch_room(rooms, game_manager, str(data["room"]), ws)
+                if msg_type == "join_room" or joined["type"] == "room_error":
+                    clients.send(ws, json.dumps(joined))
+                    continue
+
+            if msg_type == "get_rooms":
+                response = {"type": "rooms", "rooms": rooms.stats()}
+            else:
+                response = await handle_message(data, game_manager, ws)
 
             if response:
-                await ws.send(json.dumps(response))
+                clients.send(ws, json.dumps(response))
 
     except Exception as e:
         print(f"Error processing message: {e}")
     finally:
-        clients.discard(ws)
+        pinger.cancel()
+        clocks.pop(ws, None)
+        clients.unregister(ws)
+        rooms.leave(game_manager, ws)
 
 
-def setup_ws(game_manager):
-    return lambda ws: handler(ws, game_manager)
+def setup_ws(rooms):
+    return lambda ws: handler(ws, rooms)
 
 
-async def start_ws_server(game_manager):
-    async with serve(setup_ws(game_manager), "0.0.0.0", WS_PORT):
+async def start_ws_server(rooms):
+    async with serve(setup_ws(rooms), "0.0.0.0", WS_PORT):
         print(f"[WebSocket] Listening on port {WS_PORT}")
-        await game_manager.game_loop()
+        await rooms.game_loop()
@@ -0,0 +1,273 @@
+import json
+import struct
+import time
+from collections import OrderedDict
+from metrics import FRAME_BYTES
+
+# Binary state frames (little-endian)
+#
+#   header   kind u8, mode u8, seq u32, baseSeq u32, timestamp f64
+#   scores   count u8, then (player u16, score i32) per entry
+#   objects  count u16, then per object: id u32, type u8, field mask u32, field values
+#   removed  count u16, then id u32 each                      (deltas only)
+#   changed  count u16, then per object: id u32, field mask u32, cleared mask u32,
+#            field values                                     (deltas only)
+#   traces   count u16, then trace id u32 each
+#
+# Field values follow the order of FIELDS for every bit set in the mask. The
+# cleared mask marks fields the object no longer has (null in JSON deltas).
+# Player lists (hitBy, scoredHits, ...) are sent as bitsets of player ids 1-32;
+# a frame naming any other player id is sent as JSON instead.
+
+KEYFRAME = 0
+DELTA = 1
+
+MODES = ["Coin Cascade", "Disco Dash", "Bullet Barrage"]
+OBJECT_TYPES = ["coin", "spike", "ArrowUp", "ArrowLeft", "ArrowRight", "Button"]
+FIELDS = [
+    ("x", "f"),
+    ("y", "f"),
+    ("spawnedAt", "d"),
+    ("gravity", "f"),
+    ("speed", "f"),
+    ("time", "d"),
+    ("hitBy", "I"),
+    ("missedBy", "I"),
+    ("scoredHits", "I"),
+    ("scoredDodges", "I"),
+]
+BITSET_FIELDS = {"hitBy", "missedBy", "scoredHits", "scoredDodges"}
+BITSET_PLAYERS = 32
+
+ENCODINGS = ("json", "binary")
+ID_TABLE_SIZE = 4096
+
+_MODE_CODES = {mode: i for i, mode in enumerate(MODES)}
+_TYPE_CODES = {kind: i for i, kind in enumerate(OBJECT_TYPES)}
+_FIELD_BITS = {name: (1 << i, fmt) for i, (name, fmt) in enumerate(FIELDS)}
+_UNKNOWN = 255
+
+_HEADER = struct.Struct("<BBIId")
+_COUNT8 = struct.Struct("<B")
+_COUNT16 = struct.Struct("<H")
+_SCORE = struct.Struct("<Hi")
+_OBJECT = struct.Struct("<IBI")
+_CHANGED = struct.Struct("<III")
+_ID = struct.Struct("<I")
+_values_structs = {}
+
+
+def _values_struct(mask):
+    packer = _values_structs.get(mask)
+    if packer is None:
+        fmt = "".join(fmt for i, (_, fmt) in enumerate(FIELDS) if mask & (1 << i))
+        packer = _values_structs[mask] = struct.Struct("<" + fmt)
+    return packer
+
+
+def _bitset(players):
+    bits = 0
+    for pid in players:
+        pid = int(pid)
+        if not 1 <= pid <= BITSET_PLAYERS:
+            raise ValueError(f"Player {pid} does not fit a {BITSET_PLAYERS}-player bitset")
+        bits |= 1 << (pid - 1)
+    return bits
+
+
+def _players(bits):
+    return [i + 1 for i in range(BITSET_PLAYERS) if bits & (1 << i)]
+
+
+def _fields(obj):
+    """ (mask of the fields present, mask of the fields set to None, values) """
+    mask = 0
+    cleared = 0
+    values = []
+    for name, (bit, _) in _FIELD_BITS.items():
+        if name not in obj:
+            continue
+        value = obj[name]
+        if value is None:
+            cleared |= bit
+            continue
+        mask |= bit
+        values.append(_bitset(value) if name in BITSET_FIELDS else value)
+    return mask, cleared, values
+
+
+class IdTable:
+    """ Maps string object ids to small integers; entries age out LRU-style """
+
+    def __init__(self, size=ID_TABLE_SIZE):
+        self.size = size
+        self.next_id = 1
+        self.ids = OrderedDict()
+
+    def get(self, obj_id):
+        small = self.ids.get(obj_id)
+        if small is None:
+            small = self.ids[obj_id] = self.next_id
+            self.next_id = (self.next_id + 1) & 0xFFFFFFFF or 1
+            if len(self.ids) > self.size:
+                self.ids.popitem(last=False)
+        else:
+            self.ids.move_to_end(obj_id)
+        return small
+
+
+class WireStats:
+    """ Frames, bytes and encoding time per wire encoding """
+
+    def __init__(self):
+        self.totals = {encoding: [0, 0, 0.0] for encoding in ENCODINGS}
+
+    def record(self, encoding, size, seconds):
+        totals = self.totals[encoding]
+        totals[0] += 1
+        totals[1] += size
+        totals[2] += seconds
+
+    def snapshot(self):
+        stats = {}
+        for encoding, (frames, size, seconds) in self.totals.items():
+            stats[encoding] = {
+                "frames": frames,
+                "bytes": size,
+                "bytesPerFrame": size / frames if frames else 0.0,
+                "encodeMsPerFrame": seconds * 1000 / frames if frames else 0.0,
+            }
+        return stats
+
+
+class StateCodec:
+    """ Encodes gameStateUpdate/gameStateDelta frames as JSON text or binary """
+
+    def __init__(self):
+        self.ids = IdTable()
+        self.stats = WireStats()
+
+    def encode(self, frame, encoding="json"):
+        started = time.perf_counter()
+        data = None
+        if encoding == "binary":
+            try:
+                data = self.encode_binary(frame)
+            except (ValueError, struct.error):
+                # Something the binary format cannot hold (e.g. player 33): this frame goes out as JSON
+                encoding = "json"
+        if data is None:
+            data = json.dumps(frame)
+        self.stats.record(encoding, len(data), time.perf_counter() - started)
+        FRAME_BYTES.labels(encoding).observe(len(data))
+        return data
+
+    def _pack_object(self, out, obj):
+        mask, _, values = _fields(obj)
+        out += _OBJECT.pack(self.ids.get(obj["id"]), _TYPE_CODES.get(obj["type"], _UNKNOWN), mask)
+        out += _values_struct(mask).pack(*values)
+
+    def encode_binary(self, frame):
+        delta = frame["type"] == "gameStateDelta"
+        out = bytearray(_HEADER.pack(
+            DELTA if delta else KEYFRAME,
+            _MODE_CODES.get(frame["mode"], _UNKNOWN),
+            frame.get("seq", 0),
+            frame.get("baseSeq", 0),
+            frame["timestamp"]
+        ))
+
+        scores = frame["scores"]
+        out += _COUNT8.pack(len(scores))
+        for pid, score in scores.items():
+            out += _SCORE.pack(int(pid), score)
+
+        objects = frame["spawned"] if delta else frame["objects"]
+        out += _COUNT16.pack(len(objects))
+        for obj in objects:
+            self._pack_object(out, obj)
+
+        if delta:
+            out += _COUNT16.pack(len(frame["removed"]))
+            for obj_id in frame["removed"]:
+                out += _ID.pack(self.ids.get(obj_id))
+
+            out += _COUNT16.pack(len(frame["changed"]))
+            for obj_id, fields in frame["changed"].items():
+                mask, cleared, values = _fields(fields)
+                out += _CHANGED.pack(self.ids.get(obj_id), mask, cleared)
+                out += _values_struct(mask).pack(*values)
+
+        traces = frame.get("traces", ())
+        out += _COUNT16.pack(len(traces))
+        for trace_id in traces:
+            out += _ID.pack(trace_id)
+
+        return bytes(out)
+
+
+def _unpack_fields(data, offset, mask, cleared=0):
+    packer = _values_struct(mask)
+    values = iter(packer.unpack_from(data, offset))
+    fields = {}
+    for i, (name, _) in enumerate(FIELDS):
+        if mask & (1 << i):
+            value = next(values)
+            fields[name] = _players(value) if name in BITSET_FIELDS else value
+        elif cleared & (1 << i):
+            fields[name] = None
+    return fields, offset + packer.size
+
+
+def decode_binary(data):
+    """ Decode a binary state frame back into its JSON shape (with integer ids) """
+    kind, mode, seq, base_seq, timestamp = _HEADER.unpack_from(data, 0)
+    offset = _HEADER.size
+
+    scores = {}
+    (count,) = _COUNT8.unpack_from(data, offset)
+    offset += _COUNT8.size
+    for _ in range(count):
+        pid, score = _SCORE.unpack_from(data, offset)
+        offset += _SCORE.size
+        scores[pid] = score
+
+    objects = []
+    (count,) = _COUNT16.unpack_from(data, offset)
+    offset += _COUNT16.size
+    for _ in range(count):
+        obj_id, kind_code, mask = _OBJECT.unpack_from(data, offset)
+        fields, offset = _unpack_fields(data, offset + _OBJECT.size, mask)
+        obj_type = OBJECT_TYPES[kind_code] if kind_code < len(OBJECT_TYPES) else None
+        objects.append({"id": obj_id, "type": obj_type, **fields})
+
+    frame = {
+        "mode": MODES[mode] if mode < len(MODES) else None,
+        "seq": seq,
+        "scores": scores,
+        "timestamp": timestamp,
+    }
+    if kind == KEYFRAME:
+        frame.update({"type": "gameStateUpdate", "objects": objects, "keyframe": True})
+    else:
+        removed = []
+        (count,) = _COUNT16.unpack_from(data, offset)
+        offset += _COUNT16.size
+        for _ in range(count):
+            removed.append(_ID.unpack_from(data, offset)[0])
+            offset += _ID.size
+
+        changed = {}
+        (count,) = _COUNT16.unpack_from(data, offset)
+        offset += _COUNT16.size
+        for _ in range(count):
+            obj_id, mask, cleared = _CHANGED.unpack_from(data, offset)
+            changed[obj_id], offset = _unpack_fields(data, offset + _CHANGED.size, mask, cleared)
+
+        frame.update({"type": "gameStateDelta", "baseSeq": base_seq, "spawned": objects, "removed": removed, "changed": changed})
+
+    (count,) = _COUNT16.unpack_from(data, offset)
+    offset += _COUNT16.size
+    if count:
+        frame["traces"] = [_ID.unpack_from(data, offset + i * _ID.size)[0] for i in range(count)]
+    return frame
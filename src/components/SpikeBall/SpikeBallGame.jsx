@@ -17,6 +17,7 @@ const ReportPosition = ({ playerRef, playerIndex, ws }) => {
             type: "player_position",
             player: playerIndex + 1,
             position: { x: pos.x, y: pos.y },
+            sentAt: Date.now(),
           })
         );
       }
@@ -0,0 +1,170 @@
+// The game server's WebSocket, as the components see it.
+//
+// After init the socket subscribes to state deltas (state_sync): the server
+// then sends gameStateDelta frames against the last sequence we acknowledged
+// with state_ack, plus a full gameStateUpdate keyframe now and then. Every
+// delta is applied to the state it was diffed against and passed on as a
+// full gameStateUpdate, so listeners never see a delta. A delta whose base
+// we no longer hold asks the server for a keyframe with state_resync.
+//
+// With useBinary() state frames arrive in the binary encoding of wire.js
+// instead, except for any frame the server had to send as JSON. Object ids
+// differ between the two, so a delta is only applied to a base received in
+// the same encoding.
+
+import { decodeBinary, matchesServer } from "./wire.js";
+
+// Mirrors backend/server/game_modes/arrow_game.py: arrow x is left out of
+// deltas and follows from the frame timestamp
+const ARROW_SPAWN_OFFSET = 1280;
+const ARROW_MOVE_SPEED = 150;
+// Mirrors DELTA_HISTORY in backend/server/config.py: older bases are never used
+const HISTORY = 120;
+
+export default class GameSocket extends EventTarget {
+  constructor(url) {
+    super();
+    this.states = new Map(); // seq -> { mode, objects: Map(id -> object), scores, binary }
+    this.baseSeq = 0; // base of the latest delta; the server never diffs against anything older
+    this.resyncing = false;
+    this.socket = new WebSocket(url);
+    this.socket.addEventListener("open", () => this.dispatchEvent(new Event("open")));
+    this.socket.addEventListener("close", () => this.dispatchEvent(new Event("close")));
+    this.socket.addEventListener("message", (event) => this.receive(event.data));
+  }
+
+  get readyState() {
+    return this.socket.readyState;
+  }
+
+  send(message) {
+    this.socket.send(message);
+  }
+
+  close() {
+    this.socket.close();
+  }
+
+  subscribe() {
+    this.states.clear();
+    this.baseSeq = 0;
+    this.send(JSON.stringify({ type: "state_sync" }));
+  }
+
+  useBinary() {
+    this.socket.binaryType = "arraybuffer";
+    this.send(JSON.stringify({ type: "set_encoding", encoding: "binary" }));
+  }
+
+  receive(message) {
+    if (message instanceof ArrayBuffer) {
+      this.receiveState(decodeBinary(message), true);
+      return;
+    }
+
+    let data;
+    try {
+      data = JSON.parse(message);
+    } catch {
+      this.emit(message);
+      return;
+    }
+
+    if (data.type === "gameStateUpdate" || data.type === "gameStateDelta") {
+      this.receiveState(data, false, message);
+      return;
+    }
+    if (data.type === "encoding_ack" && data.encoding === "binary" && !matchesServer(data)) {
+      console.warn("Server's binary frame tables differ from ours, staying on JSON");
+      this.send(JSON.stringify({ type: "set_encoding", encoding: "json" }));
+    }
+    this.emit(message);
+  }
+
+  receiveState(data, binary, text = null) {
+    if (data.type === "gameStateUpdate") {
+      this.resyncing = false;
+      this.keep(data.seq, {
+        mode: data.mode,
+        objects: new Map(data.objects.map((obj) => [obj.id, obj])),
+        scores: data.scores,
+        binary,
+      });
+      this.emit(text ?? JSON.stringify(data));
+    } else {
+      const frame = this.apply(data, binary);
+      if (frame) {
+        this.emit(JSON.stringify(frame));
+      }
+    }
+  }
+
+  apply(delta, binary) {
+    const base = this.states.get(delta.baseSeq);
+    if (!base || base.binary !== binary) {
+      // Missed the frame this delta builds on: start over from a keyframe
+      if (!this.resyncing) {
+        this.resyncing = true;
+        this.send(JSON.stringify({ type: "state_resync" }));
+      }
+      return null;
+    }
+
+    const objects = new Map(base.objects);
+    for (const id of delta.removed) {
+      objects.delete(id);
+    }
+    for (const obj of delta.spawned) {
+      objects.set(obj.id, obj);
+    }
+    for (const [id, fields] of Object.entries(delta.changed)) {
+      const obj = { ...objects.get(id) };
+      for (const [name, value] of Object.entries(fields)) {
+        if (value === null) {
+          delete obj[name];
+        } else {
+          obj[name] = value;
+        }
+      }
+      objects.set(id, obj);
+    }
+    if (delta.mode === "Disco Dash") {
+      for (const [id, obj] of objects) {
+        if (obj.spawnedAt !== undefined) {
+          objects.set(id, { ...obj, x: ARROW_SPAWN_OFFSET - ARROW_MOVE_SPEED * (delta.timestamp - obj.spawnedAt) });
+        }
+      }
+    }
+
+    const scores = { ...base.scores, ...delta.scores };
+    this.baseSeq = delta.baseSeq;
+    this.keep(delta.seq, { mode: delta.mode, objects, scores, binary });
+
+    const frame = {
+      type: "gameStateUpdate",
+      mode: delta.mode,
+      objects: [...objects.values()],
+      scores,
+      timestamp: delta.timestamp,
+      seq: delta.seq,
+    };
+    if (delta.traces) {
+      frame.traces = delta.traces;
+    }
+    return frame;
+  }
+
+  keep(seq, state) {
+    for (const kept of this.states.keys()) {
+      if (kept < this.baseSeq || kept <= seq - HISTORY) {
+        this.states.delete(kept);
+      }
+    }
+    this.states.set(seq, state);
+    this.send(JSON.stringify({ type: "state_ack", seq }));
+  }
+
+  emit(data) {
+    this.dispatchEvent(new MessageEvent("message", { data }));
+  }
+}
@@ -4,6 +4,7 @@ import Menu from "./pages/Menu/Menu.jsx";
 import GameSel from "./pages/GameSel/GameSel.jsx";
 import RhythmGame from "./pages/RythmGame/RhythmGame.jsx";
 import Scoreboard from "./pages/RythmGame/Scoreboard.jsx";
+import GameSocket from "./gameSocket.js";
 
 function Root() {
   const [players, setPlayers] = useState([]);
@@ -23,19 +24,35 @@ function Root() {
   };
 
   function setupWebSocket(initData) {
-    const socket = new WebSocket("ws://13.61.26.147:8765");
+    const socket = new GameSocket("ws://13.61.26.147:8765");
 
-    socket.onopen = () => {
+    socket.addEventListener("open", () => {
       console.log("WebSocket connected");
       setIsConnected(true);
       if (initData) {
         socket.send(JSON.stringify(initData));
       }
-    };
+      // Receive state as deltas against what we acknowledged; GameSocket turns them back into full frames
+      socket.subscribe();
+      socket.useBinary();
+    });
 
-    socket.onmessage = (event) => {
+    socket.addEventListener("message", (event) => {
+      const receivedAt = Date.now();
       try {
         const data = JSON.parse(event.data);
+
+        if (data.type === "clock_ping") {
+          // Lets the server estimate our clock offset and round trip
+          socket.send(JSON.stringify({ type: "clock_pong", id: data.id, t1: receivedAt, t2: Date.now() }));
+          return;
+        }
+        if (data.traces) {
+          // Report when the frame carrying these FPGA inputs reached the screen
+          requestAnimationFrame(() => {
+            socket.send(JSON.stringify({ type: "trace_ack", traces: data.traces, displayedAt: Date.now() }));
+          });
+        }
         console.log("WS message received:", data);
 
         if (data.type === "player_connected") {
@@ -61,12 +78,12 @@ function Root() {
       } catch (err) {
         console.error("Error parsing WebSocket message:", err);
       }
-    };
+    });
 
-    socket.onclose = () => {
+    socket.addEventListener("close", () => {
       console.warn("WebSocket disconnected");
       setIsConnected(false);
-    };
+    });
 
     return socket;
   }
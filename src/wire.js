@@ -0,0 +1,150 @@
+// Decoder for the binary state frames of backend/server/wire.py, which
+// documents the layout. The tables below mirror that file; the server
+// repeats them in its encoding_ack so a mismatch can be caught.
+
+export const MODES = ["Coin Cascade", "Disco Dash", "Bullet Barrage"];
+export const OBJECT_TYPES = ["coin", "spike", "ArrowUp", "ArrowLeft", "ArrowRight", "Button"];
+export const FIELDS = [
+  ["x", "f"],
+  ["y", "f"],
+  ["spawnedAt", "d"],
+  ["gravity", "f"],
+  ["speed", "f"],
+  ["time", "d"],
+  ["hitBy", "I"],
+  ["missedBy", "I"],
+  ["scoredHits", "I"],
+  ["scoredDodges", "I"],
+];
+const BITSET_FIELDS = new Set(["hitBy", "missedBy", "scoredHits", "scoredDodges"]);
+const BITSET_PLAYERS = 32;
+const KEYFRAME = 0;
+
+export function matchesServer(ack) {
+  return (
+    JSON.stringify(ack.modes) === JSON.stringify(MODES) &&
+    JSON.stringify(ack.objectTypes) === JSON.stringify(OBJECT_TYPES) &&
+    JSON.stringify(ack.fields) === JSON.stringify(FIELDS.map(([name]) => name))
+  );
+}
+
+function players(bits) {
+  const ids = [];
+  for (let i = 0; i < BITSET_PLAYERS; i++) {
+    if (bits & (1 << i)) {
+      ids.push(i + 1);
+    }
+  }
+  return ids;
+}
+
+class Reader {
+  constructor(buffer) {
+    this.view = new DataView(buffer);
+    this.offset = 0;
+  }
+
+  u8() {
+    return this.view.getUint8(this.offset++);
+  }
+
+  u16() {
+    const value = this.view.getUint16(this.offset, true);
+    this.offset += 2;
+    return value;
+  }
+
+  u32() {
+    const value = this.view.getUint32(this.offset, true);
+    this.offset += 4;
+    return value;
+  }
+
+  i32() {
+    const value = this.view.getInt32(this.offset, true);
+    this.offset += 4;
+    return value;
+  }
+
+  f32() {
+    const value = this.view.getFloat32(this.offset, true);
+    this.offset += 4;
+    return value;
+  }
+
+  f64() {
+    const value = this.view.getFloat64(this.offset, true);
+    this.offset += 8;
+    return value;
+  }
+
+  // Object ids are small integers on the wire; strings here, like the JSON frames' ids
+  id() {
+    return String(this.u32());
+  }
+
+  // cleared marks the fields a delta removes; they come back as null, like in JSON deltas
+  fields(mask, cleared = 0) {
+    const fields = {};
+    FIELDS.forEach(([name, format], i) => {
+      if (mask & (1 << i)) {
+        const value = format === "d" ? this.f64() : format === "f" ? this.f32() : this.u32();
+        fields[name] = BITSET_FIELDS.has(name) ? players(value) : value;
+      } else if (cleared & (1 << i)) {
+        fields[name] = null;
+      }
+    });
+    return fields;
+  }
+}
+
+// Decode a binary state frame into the shape of its JSON counterpart
+export function decodeBinary(buffer) {
+  const reader = new Reader(buffer);
+  const kind = reader.u8();
+  const mode = reader.u8();
+  const seq = reader.u32();
+  const baseSeq = reader.u32();
+  const timestamp = reader.f64();
+
+  const scores = {};
+  for (let count = reader.u8(); count > 0; count--) {
+    const pid = reader.u16();
+    scores[pid] = reader.i32();
+  }
+
+  const objects = [];
+  for (let count = reader.u16(); count > 0; count--) {
+    const id = reader.id();
+    const type = OBJECT_TYPES[reader.u8()] ?? null;
+    objects.push({ id, type, ...reader.fields(reader.u32()) });
+  }
+
+  let frame = { mode: MODES[mode] ?? null, seq, scores, timestamp };
+  if (kind === KEYFRAME) {
+    frame = { type: "gameStateUpdate", ...frame, objects, keyframe: true };
+  } else {
+    const removed = [];
+    for (let count = reader.u16(); count > 0; count--) {
+      removed.push(reader.id());
+    }
+
+    const changed = {};
+    for (let count = reader.u16(); count > 0; count--) {
+      const id = reader.id();
+      const mask = reader.u32();
+      changed[id] = reader.fields(mask, reader.u32());
+    }
+
+    frame = { type: "gameStateDelta", ...frame, baseSeq, spawned: objects, removed, changed };
+  }
+
+  const traces = [];
+  for (let count = reader.u16(); count > 0; count--) {
+    traces.push(reader.u32());
+  }
+  if (traces.length) {
+    frame.traces = traces;
+  }
+  return frame;
+}